@@ -0,0 +1,72 @@
+"""
+Compare the character-at-a-time Lexer against the table-driven Scanner.
+
+Run from the repo root with `python benchmarks/lexer_benchmark.py` or
+`invoke bench`.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from glorp.lexparse import (
+    Lexer,
+    Scanner,
+)
+
+def build_source(functions:int, calls:int) -> str:
+    """
+    Build a generated looking program.
+    
+    Args:
+        functions: how many top level defs to make
+        calls: how many calls go in each def
+    
+    Returns:
+        str: the program, without a trailing newline since the Lexer can't
+             take one
+    """
+    lines:list[str] = []
+    
+    for i in range(functions):
+        lines.append(f"def routine_{i}():")
+        
+        for j in range(calls):
+            lines.append(f"    helper_{(i * calls) + j}()")
+        
+        lines.append("")
+    
+    return "\n".join(lines).rstrip("\n")
+
+def main(functions:int = 2000, calls:int = 8, repeat:int = 10) -> None:
+    src:str = build_source(functions, calls)
+    
+    # make sure we're racing the same thing
+    expected = [(t.type, t.value, t.line, t.column) for t in Lexer().tokenize(src)]
+    actual = [(t.type, t.value, t.line, t.column) for t in Scanner().tokenize(src)]
+    
+    if (expected != actual):
+        raise AssertionError("Scanner and Lexer disagree on the benchmark source!")
+    
+    print(f"            source: {src.count(chr(10)) + 1} lines, {len(src)} characters, {len(expected)} tokens")
+    
+    encoded:bytes = src.encode("utf-8")
+    results:dict[str, float] = {}
+    
+    for name, run in (
+        ("Lexer", lambda: Lexer().tokenize(src)),
+        ("Scanner", lambda: Scanner().tokenize(src)),
+        ("Scanner (bytes)", lambda: Scanner().tokenize_buffer(encoded)),
+        ("Scanner (compact)", lambda: Scanner().tokenize_compact(encoded)),
+    ):
+        best:float = min(timeit.repeat(run, number=1, repeat=repeat))
+        results[name] = best
+        print(f"{name:>18}: {best * 1000:9.2f} ms  ({len(expected) / best:12.0f} tokens/s)")
+    
+    for name in results:
+        if (name != "Lexer"):
+            print(f"{name:>18}: {results['Lexer'] / results[name]:9.2f}x the Lexer")
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,10 @@ __version__ = "0.0.1-indev"
 
 from . import (
     lexparse,
+    snes,
 )
 
 __all__ = [
     "lexparse",
+    "snes",
 ]
\ No newline at end of file
@@ -6,27 +6,56 @@ from .ast import (
     ASTNodeWithBody,
 )
 
+from .ast_arena import (
+    ASTArena,
+    ASTKind,
+)
+
 from .lexer import (
     Lexer,
 )
 
+from .parallel import (
+    parse_parallel,
+)
+
 from .parser import(
     Parser,
 )
 
+from .scanner import (
+    Scanner,
+)
+
+from .symbols import (
+    SymbolTable,
+)
+
 from .token import (
+    BufferToken,
     Token,
     TokenType,
 )
 
+from .token_buffer import (
+    TokenBuffer,
+)
+
 __all__ = [
     "AST",
+    "ASTArena",
     "ASTFunctionCall",
     "ASTFunctionDef",
+    "ASTKind",
     "ASTNode",
     "ASTNodeWithBody",
+    "BufferToken",
     "Lexer",
     "Parser",
+    "Scanner",
+    "SymbolTable",
     "Token",
+    "TokenBuffer",
     "TokenType",
+    "parse_parallel",
 ]
\ No newline at end of file
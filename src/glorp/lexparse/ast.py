@@ -1,27 +1,66 @@
+from .symbols import (
+    SymbolTable,
+)
+
 class ASTNode:
-    pass
+    __slots__ = (
+        "line",
+        "end_line",
+    )
+    
+    def __init__(self):
+        self.line:int = -1
+        """Line the node starts on, -1 if it's not from a source"""
+        
+        self.end_line:int = -1
+        """Last line the node covers"""
 
 class ASTNodeWithBody(ASTNode):
+    __slots__ = (
+        "body",
+        "body_indent",
+    )
+    
     def __init__(self):
+        super().__init__()
+        
         self.body:list[ASTNode] = []
         self.body_indent:int = 0
     
     def add_node(self, node:ASTNode) -> None:
         self.body.append(node)
-    
+
 class AST(ASTNodeWithBody):
+    __slots__ = (
+        "symbols",
+    )
+    
     def __init__(self):
         super().__init__()
+        
+        self.symbols:SymbolTable = SymbolTable()
+        """Table the symbol IDs on this tree's nodes come from"""
 
 class ASTFunctionCall(ASTNode):
+    __slots__ = (
+        "name",
+        "symbol",
+    )
+    
     def __init__(self):
         super().__init__()
         
         self.name:str = "NAME_NOT_SET"
+        self.symbol:int = -1
 
 class ASTFunctionDef(ASTNodeWithBody):
+    __slots__ = (
+        "name",
+        "symbol",
+    )
+    
     def __init__(self):
         super().__init__()
         
         self.name:str = "NAME_NOT_SET"
-        
+        self.symbol:int = -1
@@ -0,0 +1,285 @@
+from array import array
+from enum import IntEnum
+
+from typing import (
+    Iterator,
+)
+
+from .ast import (
+    AST,
+    ASTFunctionCall,
+    ASTFunctionDef,
+    ASTNode,
+    ASTNodeWithBody,
+)
+
+from .symbols import (
+    SymbolTable,
+)
+
+class ASTKind(IntEnum):
+    ROOT = 0
+    """The AST itself, always node 0"""
+    
+    FUNCTION_DEF = 1
+    """An ASTFunctionDef"""
+    
+    FUNCTION_CALL = 2
+    """An ASTFunctionCall"""
+
+class ASTArena:
+    """
+    A whole AST kept in parallel typed arrays instead of one object per node.
+    
+    Nodes are indexes. Each has a kind, a name symbol, the lines it spans and
+    its body indent, and the tree is threaded through first child and next
+    sibling links. Walking it is a scan over a handful of flat arrays, and
+    pickling it is pickling those arrays plus the symbol table.
+    
+    The usual AST classes are still there for anyone who wants them - view()
+    hands back a read only __slots__ object that looks up everything through
+    the arena.
+    """
+    def __init__(self, symbols:SymbolTable|None = None):
+        self.symbols:SymbolTable = SymbolTable() if (symbols is None) else symbols
+        """Table the name symbols come from"""
+        
+        self.kinds:array = array("B")
+        """ASTKind of each node"""
+        
+        self.symbol_ids:array = array("l")
+        """Name symbol of each node, -1 for nameless ones"""
+        
+        self.first_child:array = array("l")
+        """First node in each node's body, -1 if it's empty"""
+        
+        self.next_sibling:array = array("l")
+        """Next node in the same body, -1 at the end"""
+        
+        self.last_child:array = array("l")
+        """Last node in each node's body, so appending stays cheap"""
+        
+        self.lines:array = array("l")
+        """Line each node starts on"""
+        
+        self.end_lines:array = array("l")
+        """Last line each node covers"""
+        
+        self.body_indents:array = array("l")
+        """Body indent of each node that has a body"""
+        
+        # the root is always there
+        self.add(ASTKind.ROOT)
+    
+    def __len__(self) -> int:
+        return len(self.kinds)
+    
+    def add(self, kind:ASTKind, parent:int = -1, symbol:int = -1, line:int = -1, end_line:int = -1, body_indent:int = 0) -> int:
+        """
+        Add a node, optionally on the end of another node's body.
+        
+        Args:
+            kind: what kind of node it is
+            parent: node whose body this goes on the end of, -1 for none
+            symbol: name symbol
+            line: line the node starts on
+            end_line: last line the node covers
+            body_indent: indent of the node's body
+        
+        Returns:
+            int: the new node
+        """
+        ret:int = len(self.kinds)
+        
+        self.kinds.append(kind)
+        self.symbol_ids.append(symbol)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.last_child.append(-1)
+        self.lines.append(line)
+        self.end_lines.append(end_line)
+        self.body_indents.append(body_indent)
+        
+        if (parent >= 0):
+            if (self.last_child[parent] < 0):
+                self.first_child[parent] = ret
+            else:
+                self.next_sibling[self.last_child[parent]] = ret
+            
+            self.last_child[parent] = ret
+        
+        return ret
+    
+    def add_node(self, node:ASTNode, parent:int = 0) -> int:
+        """
+        Copy an object node, and everything in its body, into the arena.
+        
+        Args:
+            node: the node to copy
+            parent: node whose body it goes on the end of
+        
+        Returns:
+            int: the copied node
+        """
+        kind:ASTKind = ASTKind.FUNCTION_CALL
+        
+        if (isinstance(node, ASTFunctionDef)):
+            kind = ASTKind.FUNCTION_DEF
+        elif (not isinstance(node, ASTFunctionCall)):
+            raise TypeError(f"Can't put a {type(node).__name__} in an arena")
+        
+        ret:int = self.add(kind, parent, node.symbol, node.line, node.end_line, getattr(node, "body_indent", 0))
+        
+        if (isinstance(node, ASTNodeWithBody)):
+            for child in node.body:
+                self.add_node(child, ret)
+        
+        return ret
+    
+    @classmethod
+    def from_ast(cls, ast:AST) -> "ASTArena":
+        """Copy an object AST into a new arena"""
+        ret:ASTArena = cls(ast.symbols)
+        ret.lines[0] = ast.line
+        ret.end_lines[0] = ast.end_line
+        ret.body_indents[0] = ast.body_indent
+        
+        for node in ast.body:
+            ret.add_node(node)
+        
+        return ret
+    
+    def children(self, index:int) -> Iterator[int]:
+        """Every node in a node's body, in order"""
+        child:int = self.first_child[index]
+        next_sibling:array = self.next_sibling
+        
+        while (child >= 0):
+            yield child
+            child = next_sibling[child]
+    
+    def of_kind(self, kind:ASTKind) -> Iterator[int]:
+        """Every node of one kind, in source order"""
+        kinds:bytes = self.kinds.tobytes()
+        found:int = kinds.find(kind)
+        
+        while (found >= 0):
+            yield found
+            found = kinds.find(kind, found + 1)
+    
+    def view(self, index:int) -> ASTNode:
+        """An AST class shaped view of a node"""
+        return _VIEWS[self.kinds[index]](self, index)
+    
+    @property
+    def root(self) -> AST:
+        """The whole tree, as an AST"""
+        return self.view(0)
+    
+    def to_node(self, index:int) -> ASTNode:
+        """Copy a node and its body back out into plain objects"""
+        kind:int = self.kinds[index]
+        ret:ASTNode
+        
+        if (kind == ASTKind.ROOT):
+            ret = AST()
+            ret.symbols = self.symbols
+        elif (kind == ASTKind.FUNCTION_DEF):
+            ret = ASTFunctionDef()
+        else:
+            ret = ASTFunctionCall()
+        
+        ret.line = self.lines[index]
+        ret.end_line = self.end_lines[index]
+        
+        if (kind != ASTKind.ROOT):
+            ret.symbol = self.symbol_ids[index]
+            ret.name = self.symbols.name(ret.symbol)
+        
+        if (kind != ASTKind.FUNCTION_CALL):
+            ret.body_indent = self.body_indents[index]
+            ret.body = [self.to_node(child) for child in self.children(index)]
+        
+        return ret
+    
+    def to_ast(self) -> AST:
+        """Copy the whole tree back out into plain objects"""
+        return self.to_node(0)
+
+class _ASTArenaView():
+    """Bits every view shares"""
+    __slots__ = ()
+    
+    def __init__(self, arena:ASTArena, index:int):
+        self._arena:ASTArena = arena
+        self._index:int = index
+    
+    @property
+    def arena_index(self) -> int:
+        """Which node in the arena this is"""
+        return self._index
+    
+    @property
+    def line(self) -> int:
+        return self._arena.lines[self._index]
+    
+    @property
+    def end_line(self) -> int:
+        return self._arena.end_lines[self._index]
+
+class _ASTArenaNamedView(_ASTArenaView):
+    __slots__ = ()
+    
+    @property
+    def name(self) -> str:
+        return self._arena.symbols.name(self._arena.symbol_ids[self._index])
+    
+    @property
+    def symbol(self) -> int:
+        return self._arena.symbol_ids[self._index]
+
+class _ASTArenaBodyView(_ASTArenaView):
+    __slots__ = ()
+    
+    @property
+    def body(self) -> list[ASTNode]:
+        return [self._arena.view(child) for child in self._arena.children(self._index)]
+    
+    @property
+    def body_indent(self) -> int:
+        return self._arena.body_indents[self._index]
+    
+    def add_node(self, node:ASTNode) -> None:
+        raise TypeError("Arena backed nodes are read only, use ASTArena.add_node")
+
+class ASTArenaRoot(_ASTArenaBodyView, AST):
+    """Read only view of an arena's root"""
+    __slots__ = (
+        "_arena",
+        "_index",
+    )
+    
+    @property
+    def symbols(self) -> SymbolTable:
+        return self._arena.symbols
+
+class ASTArenaFunctionDef(_ASTArenaBodyView, _ASTArenaNamedView, ASTFunctionDef):
+    """Read only view of a function def in an arena"""
+    __slots__ = (
+        "_arena",
+        "_index",
+    )
+
+class ASTArenaFunctionCall(_ASTArenaNamedView, ASTFunctionCall):
+    """Read only view of a function call in an arena"""
+    __slots__ = (
+        "_arena",
+        "_index",
+    )
+
+_VIEWS:dict[int, type] = {
+    ASTKind.ROOT: ASTArenaRoot,
+    ASTKind.FUNCTION_DEF: ASTArenaFunctionDef,
+    ASTKind.FUNCTION_CALL: ASTArenaFunctionCall,
+}
+"""dict[kind, view class]"""
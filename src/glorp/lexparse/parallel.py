@@ -0,0 +1,130 @@
+import os
+
+from array import array
+from bisect import bisect_left
+
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+)
+
+from .ast import (
+    AST,
+)
+
+from .ast_arena import (
+    ASTArena,
+)
+
+from .parser import (
+    Parser,
+)
+
+from .scanner import (
+    TOP_LEVEL_LINE,
+    Scanner,
+)
+
+from .symbols import (
+    SymbolTable,
+)
+
+CHUNKS_PER_WORKER:int = 4
+"""How many chunks each worker gets, so one slow chunk doesn't hold up the rest"""
+
+MIN_CHUNK_SIZE:int = 64 * 1024
+"""Smallest chunk worth shipping to another process, in characters"""
+
+def split_source(source:str, chunks:int) -> list[tuple[int, int, int]]:
+    """
+    Cut a source into roughly even chunks of whole top level blocks.
+    
+    Every chunk starts on a top level line (bar the first, which starts at the
+    start), so each one lexes and parses without knowing about the others.
+    
+    Args:
+        source: the source
+        chunks: how many chunks to aim for
+    
+    Returns:
+        list[tuple]: (start offset, stop offset, first line) of each chunk
+    """
+    # the pre-scan, just the line starts that aren't indented
+    boundaries:list[int] = [found.start() for found in TOP_LEVEL_LINE.finditer(source)]
+    size:int = max(1, len(source) // max(1, chunks))
+    cuts:list[int] = [0]
+    
+    for i in range(1, chunks):
+        index:int = bisect_left(boundaries, i * size)
+        
+        if ((index < len(boundaries)) and (boundaries[index] > cuts[-1])):
+            cuts.append(boundaries[index])
+    
+    cuts.append(len(source))
+    
+    ret:list[tuple[int, int, int]] = []
+    line:int = 1
+    
+    for start, stop in zip(cuts, cuts[1:]):
+        ret.append((start, stop, line))
+        line += source.count("\n", start, stop)
+    
+    return ret
+
+def _parse_chunk(chunk:tuple[str, int]) -> ASTArena:
+    """Lex and parse one chunk, in whatever process it lands in"""
+    text, line = chunk
+    symbols:SymbolTable = SymbolTable()
+    
+    # arenas are a handful of arrays, so they're cheap to send back
+    return Parser(symbols).parse_arena(Scanner(symbols).iter_slice(text, line=line))
+
+def parse_parallel(source:str, symbols:SymbolTable|None = None, workers:int|None = None, executor:Executor|None = None) -> AST:
+    """
+    Lex and parse a source with its top level blocks spread across processes.
+    
+    The source is cut into chunks on top level lines, each chunk is lexed and
+    parsed on its own, and the defs come back in source order with the lines
+    they had in the whole source. Names are interned into one table at the
+    end, so symbol IDs match a plain parse with the same table.
+    
+    Anything too small to be worth the trip is parsed right here.
+    
+    Args:
+        source: the source
+        symbols: table to intern names into, a new one if not given
+        workers: how many processes to use, os.cpu_count if not given
+        executor: pool to run on, one gets made (and shut down) if not given
+    
+    Returns:
+        AST: the whole program
+    """
+    symbols = SymbolTable() if (symbols is None) else symbols
+    workers = (os.cpu_count() or 1) if (workers is None) else workers
+    chunks:int = min(workers * CHUNKS_PER_WORKER, len(source) // MIN_CHUNK_SIZE)
+    
+    if ((chunks < 2) or ((workers < 2) and (executor is None))):
+        return Parser(symbols).parse(Scanner(symbols).iter_tokens(source))
+    
+    jobs:list[tuple[str, int]] = [(source[start:stop], line) for start, stop, line in split_source(source, chunks)]
+    arenas:list[ASTArena]
+    
+    if (executor is None):
+        with ProcessPoolExecutor(workers) as pool:
+            arenas = list(pool.map(_parse_chunk, jobs))
+    else:
+        arenas = list(executor.map(_parse_chunk, jobs))
+    
+    ret:AST = AST()
+    ret.symbols = symbols
+    
+    for arena in arenas:
+        # move the chunk's names over to the real table
+        remap:list[int] = [symbols.intern(arena.symbols.name(symbol)) for symbol in range(len(arena.symbols))]
+        arena.symbol_ids = array("l", (remap[symbol] if (symbol >= 0) else -1 for symbol in arena.symbol_ids))
+        arena.symbols = symbols
+        
+        for index in arena.children(0):
+            ret.add_node(arena.to_node(index))
+    
+    return ret
@@ -1,8 +1,29 @@
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
+from collections import deque
+from itertools import islice
+
+from typing import (
+    Iterable,
+    Iterator,
+)
+
 from .token import (
     Token,
     TokenType,
 )
 
+from .symbols import (
+    SymbolTable,
+)
+
+from .token_buffer import (
+    TOKEN_TYPES,
+    TokenBuffer,
+)
+
 from .ast import (
     AST,
     ASTFunctionCall,
@@ -11,35 +32,227 @@ from .ast import (
     ASTNodeWithBody,
 )
 
+from .ast_arena import (
+    ASTArena,
+)
+
+_LAYOUT_TYPES:frozenset[TokenType] = frozenset((
+    TokenType.DEDENT,
+    TokenType.EOF,
+    TokenType.INDENT,
+    TokenType.NEWLINE,
+))
+
+def _is_top_level(token:Token) -> bool:
+    """Whether a token is the first thing on a top level line"""
+    return (token.column == 1) and (token.type not in _LAYOUT_TYPES)
+
+def _token_line(token:Token) -> int:
+    return token.line
+
+def _node_line(node:ASTNode) -> int:
+    return node.line
+
+def _shift_lines(node:ASTNode, delta:int) -> None:
+    """Move a node and everything in its body down some lines"""
+    node.line += delta
+    node.end_line += delta
+    
+    if (isinstance(node, ASTNodeWithBody)):
+        for child in node.body:
+            _shift_lines(child, delta)
+
+class _TokenWindow():
+    """
+    Bounded lookahead over any iterable of tokens.
+    
+    Tokens are pulled from the source only as far as they're looked at, so a
+    generator feeding the window never gets ahead of it by more than the
+    lookahead.
+    """
+    def __init__(self, source:Iterable[Token], size:int):
+        self._tokens:Iterator[Token] = iter(source)
+        self._window:deque[Token] = deque()
+        self._size:int = size
+    
+    def __len__(self) -> int:
+        return len(self._window)
+    
+    def peek(self, offset:int = 0) -> Token|None:
+        if (offset >= self._size):
+            raise ValueError(f"Can't look {offset} tokens ahead, lookahead is {self._size}")
+        
+        while (len(self._window) <= offset):
+            swp:Token|None = next(self._tokens, None)
+            
+            if (swp is None):
+                return None
+            
+            self._window.append(swp)
+        
+        return self._window[offset]
+    
+    def peek_type(self) -> TokenType|None:
+        swp:Token|None = self.peek()
+        return None if (swp is None) else swp.type
+    
+    def peek_value(self) -> str|None:
+        swp:Token|None = self.peek()
+        return None if (swp is None) else swp.value
+    
+    def peek_symbol(self) -> int:
+        swp:Token|None = self.peek()
+        return -1 if (swp is None) else swp.symbol
+    
+    def peek_line(self) -> int:
+        swp:Token|None = self.peek()
+        return -1 if (swp is None) else swp.line
+    
+    def advance(self) -> None:
+        if (self._window):
+            self._window.popleft()
+        else:
+            next(self._tokens, None)
+
+class _TokenBufferCursor():
+    """
+    Walks a TokenBuffer by index.
+    
+    Types and values come straight out of the buffer's columns, a Token only
+    gets built if someone asks for the whole thing.
+    """
+    def __init__(self, source:TokenBuffer):
+        self._source:TokenBuffer = source
+        self._types = source.types
+        self._index:int = 0
+    
+    def peek(self, offset:int = 0) -> Token|None:
+        if ((self._index + offset) >= len(self._types)):
+            return None
+        
+        return self._source[self._index + offset]
+    
+    def peek_type(self) -> TokenType|None:
+        if (self._index >= len(self._types)):
+            return None
+        
+        return TOKEN_TYPES[self._types[self._index]]
+    
+    def peek_value(self) -> str|None:
+        if (self._index >= len(self._types)):
+            return None
+        
+        return self._source.value_of(self._index)
+    
+    def peek_symbol(self) -> int:
+        if (self._index >= len(self._types)):
+            return -1
+        
+        return self._source.symbol_ids[self._index]
+    
+    def peek_line(self) -> int:
+        if (self._index >= len(self._types)):
+            return -1
+        
+        return self._source.line_of(self._index)
+    
+    def advance(self) -> None:
+        self._index += 1
+
 class Parser():
-    def __init__(self):
-        self.source:list[Token] = []
+    """
+    Turns tokens into an AST.
+    
+    Names on the nodes are interned into a SymbolTable, which ends up on the
+    AST for later phases. Tokens that already carry a symbol ID are trusted to
+    have come from the same table, so hand the Parser whatever table the
+    Scanner was given.
+    """
+    LOOKAHEAD:int = 2
+    """How many tokens the parser is allowed to hold on to at once"""
+    
+    def __init__(self, symbols:SymbolTable|None = None):
+        self.symbols:SymbolTable = SymbolTable() if (symbols is None) else symbols
+        self.source:Iterable[Token] = []
         self.position:int = 0
         self.ast:AST = AST()
+        self.ast.symbols = self.symbols
+        self._reader:_TokenWindow|_TokenBufferCursor = _TokenWindow((), self.LOOKAHEAD)
     
     def _reset(self):
         self.source = []
         self.position = 0
         self.ast = AST()
+        self.ast.symbols = self.symbols
+        self._reader = _TokenWindow((), self.LOOKAHEAD)
+    
+    def _start(self, source:Iterable[Token]|TokenBuffer) -> None:
+        """Reinit and hook up to a new token source"""
+        self._reset()
+        self.source = source
+        
+        if (isinstance(source, TokenBuffer)):
+            self._reader = _TokenBufferCursor(source)
+        else:
+            self._reader = _TokenWindow(source, self.LOOKAHEAD)
+    
+    def _peek(self, offset:int = 0) -> Token|None:
+        """
+        Look at an upcoming token without consuming it.
+        
+        Args:
+            offset: how far past the current token to look
+        
+        Returns:
+            Token|None: the token, or None if the source ran dry first
+        """
+        return self._reader.peek(offset)
     
     @property
     def current_token(self) -> Token:
-        return self.source[self.position]
+        swp:Token|None = self._peek()
+        
+        if (swp is None):
+            raise ValueError(f"Ran out of tokens after token {self.position}")
+        
+        return swp
+    
+    @property
+    def _current_type(self) -> TokenType|None:
+        return self._reader.peek_type()
+    
+    @property
+    def _current_value(self) -> str|None:
+        return self._reader.peek_value()
     
     def _advance(self) -> None:
+        self._reader.advance()
         self.position += 1
     
+    def _expect_identifier(self) -> int:
+        """Expect an identifier, and get its symbol ID"""
+        swp_value:str|None = self._current_value
+        swp_symbol:int = self._reader.peek_symbol()
+        
+        self._expect(TokenType.IDENTIFIER)
+        
+        # tokens from the Lexer, or a Scanner without a table, don't have one
+        if (swp_symbol < 0):
+            swp_symbol = self.symbols.intern(swp_value)
+        
+        return swp_symbol
+    
     def _expect(self, type_:TokenType, value:str|None = None) -> None:
         # so we're just going to try to invalidate this, right?
         correct_token:bool = True
         
         # wrong type
-        if (self.current_token.type != type_):
+        if (self._current_type != type_):
             correct_token = False
         
         # value
         if (value is not None):
-            if (self.current_token.value != value):
+            if (self._current_value != value):
                 correct_token = False
         
         if (correct_token):
@@ -47,19 +260,19 @@ class Parser():
         else:
             raise ValueError(f"Expected symbol of type [{type_.name}] with value [{value}] at {self.current_token.line}:{self.current_token.column}")
     
-    def _handle_def(self) -> None:
+    def _handle_def(self) -> ASTFunctionDef:
         # set up function def
         swp:ASTFunctionDef = ASTFunctionDef()
         
         # okay, we expect the def to be where we're at, so ingest it
+        swp.line = self._reader.peek_line()
         self._expect(TokenType.DEF)
         
         # now the tricky wicket
-        swp_token:Token = self.current_token
-        self._expect(TokenType.IDENTIFIER)
+        swp.symbol = self._expect_identifier()
         
         # that would leave us with the identifier if the expect didn't fail
-        swp.name = swp_token.value
+        swp.name = self.symbols.name(swp.symbol)
         
         # we don't do args, so we just expect three symbols and a newline
         # TODO: Do args, duh.
@@ -69,25 +282,27 @@ class Parser():
         self._expect(TokenType.NEWLINE)
         
         # indent here, so we pull it into our function
-        swp_token = self.current_token
+        swp_indent:str|None = self._current_value
         self._expect(TokenType.INDENT)
-        swp.body_indent = int(swp_token.value)
+        swp.body_indent = int(swp_indent)
         
         # still inside setup
         still_inside:bool = True
         
         while (still_inside):
             # and now we start expecting declarations that aren't top level.
-            if (self.current_token.type == TokenType.IDENTIFIER):
+            if (self._current_type == TokenType.IDENTIFIER):
                 # we don't know if it's a function or a var yet
                 # but
                 # assume it's function because that's all we're doing for now
                 # TODO: handle vars, classes, whatever here
                 swp_inner:ASTFunctionCall = ASTFunctionCall()
+                swp_inner.line = self._reader.peek_line()
+                swp_inner.end_line = swp_inner.line
                 
                 # we can just set the name and advance
-                swp_inner.name = self.current_token.value
-                self._expect(TokenType.IDENTIFIER)
+                swp_inner.symbol = self._expect_identifier()
+                swp_inner.name = self.symbols.name(swp_inner.symbol)
                 
                 # no args, so we expect two symbols here I think?
                 # TODO: Handle args
@@ -96,34 +311,138 @@ class Parser():
                 
                 # inject into body
                 swp.add_node(swp_inner)
-            elif (self.current_token.type == TokenType.DEDENT):
-                # we need that to be the correct type to move on
-                if (int(self.current_token.value) == swp.body_indent):
+                swp.end_line = swp_inner.end_line
+            elif (self._current_type == TokenType.NEWLINE):
+                # end of a statement, nothing to do
+                self._expect(TokenType.NEWLINE)
+            elif (self._current_type == TokenType.DEDENT):
+                # a dedent in the middle of the file carries the indent it
+                # went back to, the ones stapled on at the end carry the one
+                # they closed - either way, it has to take us out of the body
+                if (int(self._current_value) <= swp.body_indent):
                     # escape!
                     self._expect(TokenType.DEDENT)
                     still_inside = False
+                else:
+                    raise ValueError(f"Unexpected dedent at {self.current_token.line}:{self.current_token.column}")
             else:
                 raise NotImplementedError("Unsupported Token!")
-
+        
         # finally built this node, send it out
-        self.ast.add_node(swp)
+        return swp
     
-    def parse(self, source:list[Token]) -> AST:
+    def parse_iter(self, source:Iterable[Token]|TokenBuffer) -> Iterator[ASTNode]:
+        """
+        Parse a token stream, handing back top level nodes as they finish.
+        
+        Tokens are only pulled from the source as they're needed, so feeding
+        this a generator (say, Scanner.iter_tokens) runs lexing and parsing as
+        one pipeline, and the first function is out before the last one has
+        been lexed. Nodes aren't kept on self.ast - that's up to the caller.
+        
+        Args:
+            source: tokens to parse, a list or any other iterable, or a
+                    TokenBuffer
+        
+        Yields:
+            ASTNode: each top level node, in source order
+        """
         # reinit
-        self._reset()
-        self.source = source
+        self._start(source)
         
         # start eating tokens
-        while (self.position < len(self.source)):
+        while (self._current_type is not None):
             # def
-            if (self.current_token.type == TokenType.DEF):
-                self._handle_def()
-            elif (self.current_token.type == TokenType.EOF):
+            if (self._current_type == TokenType.DEF):
+                yield self._handle_def()
+            elif (self._current_type == TokenType.EOF):
                 # we can just throw that away, reckon
                 self._expect(TokenType.EOF)
-            
-            # advance?
-            self._advance()
+            else:
+                # anything else at the top level gets skipped
+                self._advance()
+    
+    def parse(self, source:Iterable[Token]|TokenBuffer) -> AST:
+        # parse_iter does the reinit on its first step
+        for node in self.parse_iter(source):
+            self.ast.add_node(node)
         
         # return
-        return self.ast
\ No newline at end of file
+        return self.ast
+    
+    def reparse(self, ast:AST, tokens:list[Token], first_line:int, last_line:int, line_delta:int = 0) -> AST:
+        """
+        Parse an edited token stream again, only redoing the top level blocks
+        the edit touched.
+        
+        Defs entirely outside of those blocks are carried over from the old AST
+        as the very same objects, the ones after the edit with their lines
+        moved along in place. Whatever was holding on to the old AST will see
+        those moves, so treat it as used up.
+        
+        Args:
+            ast: the AST from parsing the source before the edit
+            tokens: the full token stream after the edit, say from
+                    Scanner.retokenize
+            first_line: first line of the old source the edit replaced
+            last_line: last line of the old source the edit replaced
+            line_delta: how many more lines the new source has than the old
+        
+        Returns:
+            AST: the new AST, also left on self.ast
+        """
+        last_line = max(first_line, last_line + line_delta)
+        
+        # same edges Scanner.retokenize uses - the last top level token before
+        # the edit, and the first one after it
+        head:int = bisect_left(tokens, first_line, key=_token_line) - 1
+        
+        while ((head > 0) and (not _is_top_level(tokens[head]))):
+            head -= 1
+        
+        head = max(head, 0)
+        tail:int = bisect_right(tokens, last_line, key=_token_line)
+        
+        while ((tail < len(tokens)) and (not _is_top_level(tokens[tail]))):
+            tail += 1
+        
+        # and the old defs either side of them
+        start_line:int = tokens[head].line if (head < len(tokens) and _is_top_level(tokens[head])) else 0
+        old_head:int = bisect_left(ast.body, start_line, key=_node_line)
+        old_tail:int = len(ast.body)
+        
+        if (tail < len(tokens)):
+            old_tail = bisect_left(ast.body, tokens[tail].line - line_delta, key=_node_line)
+        
+        # parse_iter resets self.ast on its way in
+        middle:list[ASTNode] = list(self.parse_iter(tokens[head:tail]))
+        self.source = tokens
+        
+        for node in islice(ast.body, old_tail, None):
+            _shift_lines(node, line_delta)
+        
+        self.ast.body = ast.body[:old_head]
+        self.ast.body.extend(middle)
+        self.ast.body.extend(islice(ast.body, old_tail, None))
+        
+        return self.ast
+    
+    def parse_arena(self, source:Iterable[Token]|TokenBuffer) -> ASTArena:
+        """
+        Parse straight into an ASTArena rather than a tree of objects.
+        
+        Only the def currently being parsed is ever an object, each one is
+        copied into the arena as soon as it's done.
+        
+        Args:
+            source: tokens to parse, same as parse
+        
+        Returns:
+            ASTArena: the AST, with this parser's symbols
+        """
+        ret:ASTArena = ASTArena(self.symbols)
+        
+        for node in self.parse_iter(source):
+            ret.add_node(node)
+        
+        return ret
@@ -0,0 +1,558 @@
+import mmap
+import re
+
+from bisect import bisect_left
+from itertools import islice
+from os import PathLike
+
+from typing import (
+    Iterator,
+)
+
+from .token import (
+    BufferToken,
+    Token,
+    TokenType,
+)
+
+from .symbols import (
+    SymbolTable,
+)
+
+from .token_buffer import (
+    TOKEN_TYPE_CODES,
+    TokenBuffer,
+)
+
+KEYWORDS:dict[str, TokenType] = {
+    type_.value: type_
+    for type_ in TokenType
+    if (type_.value.isidentifier() and type_ not in (
+        TokenType.DEDENT,
+        TokenType.EOF,
+        TokenType.IDENTIFIER,
+        TokenType.INDENT,
+    ))
+}
+"""dict[word, keyword token type], anything else that's a word is an identifier"""
+
+PUNCTUATION:dict[str, TokenType] = {
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN,
+    ":": TokenType.COLON,
+}
+"""dict[symbol, token type] for the single character tokens"""
+
+_BYTE_KEYWORDS:dict[bytes, TokenType] = {key.encode("ascii"): val for key, val in KEYWORDS.items()}
+_BYTE_PUNCTUATION:dict[bytes, TokenType] = {key.encode("ascii"): val for key, val in PUNCTUATION.items()}
+_LONGEST_KEYWORD:int = max(len(key) for key in KEYWORDS)
+
+_PATTERN_SOURCE:str = r"""
+      (?P<newline> \n (?:[ ]*\n)* [ ]* ) (?P<tab> \t )?
+    | (?P<space>   [ ]+ ) (?P<trailing> \n )?
+    | (?P<word>    [A-Za-z_][A-Za-z0-9_]* ) (?P<more> [^\x00-\x7F] )?
+    | (?P<punct>   [():] )
+    | (?P<wide>    [^\x00-\x7F] )
+"""
+"""
+One pattern to rule them all. Every lexeme the language has starts with a
+character that picks exactly one of these branches.
+
+A newline eats any blank lines after it plus the indentation of the next real
+line, so indentation is measured in one go. Anything outside of ASCII goes down
+the slow path, since Python's idea of an identifier is bigger than ASCII. The
+trailing optional groups flag the few spots where what comes next changes the
+outcome, so the scan loop never has to index the source itself.
+"""
+
+_MASTER_PATTERN:re.Pattern = re.compile(_PATTERN_SOURCE, re.VERBOSE)
+_BYTE_PATTERN:re.Pattern = re.compile(_PATTERN_SOURCE.encode("ascii"), re.VERBOSE)
+_BYTE_WIDE_RUN:re.Pattern = re.compile(rb"[A-Za-z0-9_\x80-\xFF]+")
+
+_LAYOUT_CODES:frozenset[int] = frozenset(TOKEN_TYPE_CODES[type_] for type_ in (
+    TokenType.DEDENT,
+    TokenType.EOF,
+    TokenType.INDENT,
+))
+
+TOP_LEVEL_LINE:re.Pattern = re.compile(r"^[^ \n]", re.MULTILINE)
+"""Matches the first character of every top level line"""
+
+def _line_offset(source:str, line:int) -> int:
+    """Offset a line starts at, or the end of the source if it's past it"""
+    ret:int = 0
+    
+    for _ in range(line - 1):
+        ret = source.find("\n", ret) + 1
+        
+        if (ret == 0):
+            return len(source)
+    
+    return ret
+
+def top_level_span(source:str, first_line:int, last_line:int) -> tuple[int, int, int, int]:
+    """
+    Find the run of whole top level blocks covering some lines.
+    
+    The run starts at the last top level line before first_line, and stops at
+    the first one after last_line. Either end falls back to the edge of the
+    source if there isn't one.
+    
+    Args:
+        source: the source
+        first_line: first line that has to be covered
+        last_line: last line that has to be covered
+    
+    Returns:
+        tuple: (start offset, stop offset, start line, stop line)
+    """
+    start:int = 0
+    start_line:int = 1
+    
+    if (first_line > 1):
+        start_line = first_line - 1
+        start = _line_offset(source, start_line)
+        
+        # walk back over indented and blank lines
+        while ((start > 0) and ((start == len(source)) or (source[start] in " \n"))):
+            start = source.rfind("\n", 0, start - 1) + 1
+            start_line -= 1
+    
+    # and forwards to the next line that isn't
+    stop:int = _line_offset(source, last_line + 1)
+    stop_line:int = last_line + 1
+    found:re.Match|None = TOP_LEVEL_LINE.search(source, stop)
+    
+    if (found is None):
+        stop_line += source.count("\n", stop)
+        stop = len(source)
+    else:
+        stop_line += source.count("\n", stop, found.start())
+        stop = found.start()
+    
+    return (start, stop, start_line, stop_line)
+
+def _top_level_index(tokens:list[Token], line:int) -> int:
+    """Index of the first token on a line that isn't closing the line before"""
+    ret:int = bisect_left(tokens, line, key=_token_line)
+    
+    while ((ret < len(tokens)) and (tokens[ret].type == TokenType.DEDENT)):
+        ret += 1
+    
+    return ret
+
+def _token_line(token:Token) -> int:
+    return token.line
+
+class Scanner:
+    """
+    Table-driven version of the Lexer.
+    
+    Instead of walking the source a character at a time, this matches whole
+    lexemes against one compiled pattern and looks words up in a prebuilt
+    keyword map. The token stream is the same one the Lexer produces, line and
+    column included, with one exception: the Lexer falls over if the source
+    ends on a newline, and this treats that as a normal end of file instead.
+    
+    Sources can also be lexed straight out of anything that speaks the buffer
+    protocol (bytes, memoryview, mmap) holding UTF-8. Identifiers then come
+    back as BufferTokens that only decode their value when it's asked for.
+    
+    Given a SymbolTable, every identifier gets interned into it as it's found
+    and its token carries the symbol ID. Values then come from the table, so
+    buffer identifiers skip the laziness and each distinct name gets decoded
+    just the once.
+    """
+    def __init__(self, symbols:SymbolTable|None = None):
+        self.stream:list[Token] = []
+        self.buffer = None
+        self.symbols:SymbolTable|None = symbols
+    
+    def _scan_wide_word(self, source:str, start:int, line:int, column:int) -> int:
+        """
+        Slow path for words that contain non-ASCII characters.
+        
+        Mirrors what the Lexer does character by character.
+        
+        Args:
+            source: the source being scanned
+            start: where the word starts
+            line: line the word is on, for errors
+            column: column the word starts at, for errors
+        
+        Returns:
+            int: position just past the end of the word
+        """
+        length:int = len(source)
+        position:int = start
+        
+        # only letters get to start a word
+        if (not (source[position].isalpha() or (source[position] == "_"))):
+            raise SyntaxError(f"Unexpected character {source[position]} at line {line}, column {column}")
+        
+        position += 1
+        
+        while ((position < length) and (source[position].isidentifier() or source[position].isdigit())):
+            position += 1
+        
+        if (not source[start:position].isidentifier()):
+            raise SyntaxError(f"Unexpected symbol at line {line}, column {column}")
+        
+        return position
+    
+    def _scan_wide_bytes(self, buffer, start:int, line:int, column:int) -> tuple[int, int]:
+        """
+        Slow path for words that contain non-ASCII characters, buffer edition.
+        
+        Decodes just the run of bytes that could be part of the word and lets
+        the string slow path have at it.
+        
+        Args:
+            buffer: the buffer being scanned
+            start: where the word starts
+            line: line the word is on, for errors
+            column: column the word starts at, for errors
+        
+        Returns:
+            tuple[int, int]: offset just past the end of the word, and how many
+                             characters long the word is
+        """
+        run:bytes = _BYTE_WIDE_RUN.match(buffer, start).group()
+        
+        try:
+            text:str = str(run, "utf-8")
+        except UnicodeDecodeError:
+            raise SyntaxError(f"Invalid UTF-8 at line {line}, column {column}")
+        
+        width:int = self._scan_wide_word(text, 0, line, column)
+        
+        return (start + len(text[:width].encode("utf-8"))), width
+    
+    def _character_at(self, source, position:int, binary:bool) -> str:
+        """The character at a position, for error messages"""
+        if (binary):
+            return str(bytes(source[position:position + 4]), "utf-8", "replace")[0]
+        
+        return source[position]
+    
+    def _scan_lexemes(self, source, binary:bool = False, start:int = 0, stop:int|None = None, line:int = 1, final:bool = True) -> Iterator[tuple]:
+        """
+        The scan loop proper.
+        
+        Yields plain records rather than tokens so whoever's driving can store
+        them however they like.
+        
+        A run of lines can be scanned on its own as long as it starts on a top
+        level line, since nothing's open there. Offsets stay relative to the
+        whole source either way.
+        
+        Args:
+            source: a str, or a buffer if binary is set
+            binary: whether source is UTF-8 in a buffer
+            start: offset to start at, the start of a top level line
+            stop: offset to stop at, the start of a top level line or the end
+            line: line number start is on
+            final: whether stop is the end of the source - if not, anything
+                   still indented gets the single dedent back to 0 the whole
+                   source would have had there, instead of the end of file
+                   dedents and eof
+        
+        Yields:
+            tuple: (type, start, end, line, column, value) - value is None when
+                   it's an identifier left sitting in a buffer
+        """
+        # stash hot lookups locally, this loop runs once per lexeme
+        match = (_BYTE_PATTERN if binary else _MASTER_PATTERN).match
+        keywords:dict = _BYTE_KEYWORDS if binary else KEYWORDS
+        punctuation:dict = _BYTE_PUNCTUATION if binary else PUNCTUATION
+        newline = b"\n" if binary else "\n"
+        identifier:TokenType = TokenType.IDENTIFIER
+        longest_keyword:int = _LONGEST_KEYWORD
+        
+        length:int = len(source) if (stop is None) else stop
+        position:int = start
+        indent_stack:list[int] = [0]
+        
+        # columns count characters, so in a buffer this gets nudged forwards
+        # past any multibyte characters to keep position - line_start right
+        line_start:int = start
+        
+        while (position < length):
+            found = match(source, position, length)
+            
+            if (found is None):
+                raise SyntaxError(f"Unexpected character {self._character_at(source, position, binary)} at line {line}, column {position - line_start + 1}")
+            
+            kind:str = found.lastgroup
+            end:int = found.end()
+            
+            if (kind == "word"):
+                if (binary):
+                    type_:TokenType|None = None
+                    
+                    # nothing longer than the longest keyword is worth copying
+                    if ((end - position) <= longest_keyword):
+                        type_ = keywords.get(found.group())
+                    
+                    if (type_ is None):
+                        yield (identifier, position, end, line, position - line_start + 1, None)
+                    else:
+                        yield (type_, position, end, line, position - line_start + 1, type_.value)
+                else:
+                    word:str = found.group()
+                    yield (keywords.get(word, identifier), position, end, line, position - line_start + 1, word)
+            elif (kind == "punct"):
+                type_:TokenType = punctuation[found.group()]
+                yield (type_, position, end, line, position - line_start + 1, type_.value)
+            elif (kind == "space"):
+                pass
+            elif ((kind == "newline") or (kind == "tab")):
+                yield (TokenType.NEWLINE, position, position + 1, line, position - line_start + 1, "\n")
+                
+                text = found.group("newline")
+                line += text.count(newline)
+                line_start = position + text.rfind(newline) + 1
+                
+                if (kind == "tab"):
+                    raise SyntaxError(f"Tabs are not allowed! See: ln {line}, col {end - line_start}")
+                
+                # nothing after the newline means there's no line to indent
+                if (end < length):
+                    indent:int = end - line_start
+                    
+                    # further in is easy
+                    if (indent > indent_stack[-1]):
+                        yield (TokenType.INDENT, line_start, end, line, 1, str(indent))
+                        indent_stack.append(indent)
+                    # less in has to land on a previous indent
+                    elif (indent < indent_stack[-1]):
+                        while (indent < indent_stack[-1]):
+                            indent_stack.pop()
+                        
+                        if (indent == indent_stack[-1]):
+                            yield (TokenType.DEDENT, line_start, end, line, 1, str(indent))
+                        else:
+                            raise ValueError(f"Dedent did not match any previous indent at line {line}!")
+            elif (kind == "trailing"):
+                # the Lexer won't take trailing spaces before a newline
+                raise SyntaxError(f"Unexpected character \n at line {line}, column {end - line_start}")
+            else:
+                # wide, or more - something outside of ASCII
+                column:int = position - line_start + 1
+                
+                if (binary):
+                    end, width = self._scan_wide_bytes(source, position, line, column)
+                    line_start += (end - position) - width
+                    yield (identifier, position, end, line, column, None)
+                else:
+                    end = self._scan_wide_word(source, position, line, column)
+                    yield (identifier, position, end, line, column, source[position:end])
+            
+            position = end
+        
+        # stopped short of the end, at the start of a top level line
+        if (not final):
+            if (len(indent_stack) > 1):
+                yield (TokenType.DEDENT, length, length, line, 1, "0")
+            
+            return
+        
+        # end of file, staple dedents and eof just like the Lexer
+        column:int = length - line_start + 1
+        
+        while (len(indent_stack) > 1):
+            yield (TokenType.DEDENT, length, length, line, column, str(indent_stack.pop()))
+        
+        yield (TokenType.EOF, length, length, line, column, "EOF")
+    
+    def _intern(self, source, start:int, end:int, value:str|None) -> int:
+        """Intern an identifier, straight from the buffer if it's still in one"""
+        if (value is None):
+            return self.symbols.intern_bytes(bytes(source[start:end]))
+        
+        return self.symbols.intern(value)
+    
+    def _scan(self, source, binary:bool = False, *args) -> Iterator[Token]:
+        symbols:SymbolTable|None = self.symbols
+        identifier:TokenType = TokenType.IDENTIFIER
+        
+        for type_, start, end, line, column, value in self._scan_lexemes(source, binary, *args):
+            if ((symbols is not None) and (type_ is identifier)):
+                symbol:int = self._intern(source, start, end, value)
+                yield Token(type_, symbols.name(symbol), line, column, symbol)
+            elif (value is None):
+                yield BufferToken(type_, source, start, end, line, column)
+            else:
+                yield Token(type_, value, line, column)
+    
+    def iter_tokens(self, source:str) -> Iterator[Token]:
+        """
+        Lex a string lazily, one token at a time.
+        
+        Args:
+            source: the source to lex
+        
+        Yields:
+            Token: each token, in order
+        """
+        self.buffer = None
+        return self._scan(source)
+    
+    def iter_slice(self, source:str, start:int = 0, stop:int|None = None, line:int = 1) -> Iterator[Token]:
+        """
+        Lex just part of a string, lazily.
+        
+        Args:
+            source: the whole source
+            start: offset to start at, the start of a top level line
+            stop: offset to stop at, the start of a top level line - the end
+                  if not given
+            line: line number start is on
+        
+        Yields:
+            Token: each token in the slice, lines and columns as they are in
+                   the whole source
+        """
+        self.buffer = None
+        return self._scan(source, False, start, stop, line, (stop is None) or (stop >= len(source)))
+    
+    def iter_buffer(self, buffer) -> Iterator[Token]:
+        """
+        Lex UTF-8 source straight out of a buffer without decoding it first.
+        
+        Args:
+            buffer: bytes, bytearray, memoryview, mmap - anything the re module
+                    will match against
+        
+        Yields:
+            Token: each token, identifiers pointing back into the buffer
+        """
+        self.buffer = buffer
+        return self._scan(buffer, binary=True)
+    
+    def iter_file(self, path:str|PathLike) -> Iterator[Token]:
+        """
+        Lex a file by mapping it into memory rather than reading it in.
+        
+        The map is kept on self.buffer and shared by every token that points
+        into it. It closes itself once nothing references it any more. Pages
+        of the file are only read in as the scan reaches them.
+        
+        Args:
+            path: file to lex
+        
+        Yields:
+            Token: each token, in order
+        """
+        with open(path, "rb") as src:
+            # can't map an empty file, but there's nothing to share either
+            if (src.seek(0, 2) == 0):
+                return self.iter_buffer(b"")
+            
+            mapped:mmap.mmap = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        return self.iter_buffer(mapped)
+    
+    def tokenize(self, source:str) -> list[Token]:
+        self.stream = list(self.iter_tokens(source))
+        return self.stream
+    
+    def retokenize(self, tokens:list[Token], source:str, first_line:int, last_line:int, line_delta:int = 0) -> list[Token]:
+        """
+        Lex an edited source again, only redoing the top level blocks the edit
+        touched.
+        
+        Everything before the block the edit starts in and after the block it
+        ends in is taken from the old stream, with the tokens after it moved
+        down by however many lines the edit added. Those tokens are shifted in
+        place, so the old stream shouldn't be used afterwards.
+        
+        An edit that starts on a top level line redoes the block before it as
+        well, since the edit might be what closed that block off.
+        
+        Args:
+            tokens: the stream from lexing the source before the edit
+            source: the source after the edit
+            first_line: first line of the old source the edit replaced
+            last_line: last line of the old source the edit replaced
+            line_delta: how many more lines the new source has than the old
+        
+        Returns:
+            list[Token]: the same stream tokenize would give for source
+        """
+        start, stop, start_line, stop_line = top_level_span(source, first_line, max(first_line, last_line + line_delta))
+        
+        # the edges are top level lines in the old source too, so the old
+        # stream splits cleanly there
+        head:int = _top_level_index(tokens, start_line)
+        tail:int = len(tokens)
+        
+        if (stop < len(source)):
+            tail = _top_level_index(tokens, stop_line - line_delta)
+            
+            for token in islice(tokens, tail, None):
+                token.line += line_delta
+        
+        self.buffer = None
+        self.stream = tokens[:head]
+        self.stream.extend(self._scan(source, False, start, stop, start_line, stop == len(source)))
+        self.stream.extend(islice(tokens, tail, None))
+        
+        return self.stream
+    
+    def tokenize_buffer(self, buffer) -> list[Token]:
+        """Like iter_buffer, but hands back the whole stream at once"""
+        self.stream = list(self.iter_buffer(buffer))
+        return self.stream
+    
+    def tokenize_file(self, path:str|PathLike) -> list[Token]:
+        """Like iter_file, but hands back the whole stream at once"""
+        self.stream = list(self.iter_file(path))
+        return self.stream
+    
+    def tokenize_compact(self, source) -> TokenBuffer:
+        """
+        Lex into a TokenBuffer instead of a list of Token objects.
+        
+        Args:
+            source: a str, or a buffer holding UTF-8 (bytes, memoryview, mmap)
+        
+        Returns:
+            TokenBuffer: the token stream, as columns over source
+        """
+        binary:bool = not isinstance(source, str)
+        ret:TokenBuffer = TokenBuffer(source)
+        
+        self.buffer = source if binary else None
+        self.stream = []
+        
+        # this is the whole point, so skip TokenBuffer.append and go straight
+        # for the columns
+        codes:dict[TokenType, int] = TOKEN_TYPE_CODES
+        types_append = ret.types.append
+        starts_append = ret.starts.append
+        ends_append = ret.ends.append
+        symbol_ids_append = ret.symbol_ids.append
+        values:dict[int, str] = ret._values
+        index:int = 0
+        
+        symbols:SymbolTable|None = self.symbols
+        identifier:TokenType = TokenType.IDENTIFIER
+        
+        for type_, start, end, line, column, value in self._scan_lexemes(source, binary):
+            code:int = codes[type_]
+            
+            if (code in _LAYOUT_CODES):
+                values[index] = value
+            
+            if ((symbols is not None) and (type_ is identifier)):
+                symbol_ids_append(self._intern(source, start, end, value))
+            else:
+                symbol_ids_append(-1)
+            
+            types_append(code)
+            starts_append(start)
+            ends_append(end)
+            index += 1
+        
+        return ret
@@ -0,0 +1,69 @@
+import sys
+
+class SymbolTable:
+    """
+    Every name in a program, interned and handed out as a small integer ID.
+    
+    The lexer fills this in as it finds identifiers, and the parser, AST and
+    compiler all key off the IDs from then on. There's exactly one copy of each
+    name, and it's the one every token and node points at.
+    """
+    def __init__(self):
+        self._ids:dict[str, int] = {}
+        self._byte_ids:dict[bytes, int] = {}
+        self._names:list[str] = []
+    
+    def __len__(self) -> int:
+        return len(self._names)
+    
+    def __contains__(self, name:str) -> bool:
+        return name in self._ids
+    
+    def intern(self, name:str) -> int:
+        """
+        Get the ID for a name, adding it if it's new.
+        
+        Args:
+            name: the name to look up
+        
+        Returns:
+            int: the name's ID
+        """
+        ret:int|None = self._ids.get(name)
+        
+        if (ret is None):
+            ret = len(self._names)
+            name = sys.intern(name)
+            self._names.append(name)
+            self._ids[name] = ret
+        
+        return ret
+    
+    def intern_bytes(self, raw:bytes) -> int:
+        """
+        Get the ID for a UTF-8 encoded name, adding it if it's new.
+        
+        Each distinct name only gets decoded once, no matter how many times it
+        turns up in a buffer.
+        
+        Args:
+            raw: the encoded name
+        
+        Returns:
+            int: the name's ID
+        """
+        ret:int|None = self._byte_ids.get(raw)
+        
+        if (ret is None):
+            ret = self.intern(str(raw, "utf-8"))
+            self._byte_ids[raw] = ret
+        
+        return ret
+    
+    def lookup(self, name:str) -> int|None:
+        """The ID for a name, or None if it's never been seen"""
+        return self._ids.get(name)
+    
+    def name(self, symbol:int) -> str:
+        """The name behind an ID"""
+        return self._names[symbol]
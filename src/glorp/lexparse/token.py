@@ -60,11 +60,57 @@ class Token:
     """
     A single token in this lexer.
     """
-    def __init__(self, type_:TokenType, value:str="", line:int=-1, column:int=-1):
+    __slots__ = (
+        "type",
+        "value",
+        "line",
+        "column",
+        "symbol",
+    )
+    
+    def __init__(self, type_:TokenType, value:str="", line:int=-1, column:int=-1, symbol:int=-1):
         self.type = type_
         self.value = value
         self.line = line
         self.column = column
+        self.symbol = symbol
+        """ID of the name in the lexer's SymbolTable, -1 if it wasn't given one"""
     
     def __repr__(self):
         return f"Token({self.type.value}: {self.value} at {self.line}:{self.column})"
+
+class BufferToken(Token):
+    """
+    A token whose value still lives in the buffer it was lexed from.
+    
+    Only the offsets are kept, the value is decoded the first time someone asks
+    for it. The buffer has to stay alive (and open, for mmaps) as long as the
+    token does.
+    """
+    __slots__ = (
+        "buffer",
+        "start",
+        "end",
+        "_value",
+    )
+    
+    def __init__(self, type_:TokenType, buffer, start:int, end:int, line:int=-1, column:int=-1):
+        self.type = type_
+        self.buffer = buffer
+        self.start:int = start
+        self.end:int = end
+        self.line = line
+        self.column = column
+        self.symbol = -1
+        self._value:str|None = None
+    
+    @property
+    def value(self) -> str:
+        if (self._value is None):
+            self._value = str(self.buffer[self.start:self.end], "utf-8")
+        
+        return self._value
+    
+    @value.setter
+    def value(self, val:str) -> None:
+        self._value = val
@@ -0,0 +1,140 @@
+import re
+
+from array import array
+from bisect import bisect_left
+
+from typing import (
+    Iterator,
+)
+
+from .token import (
+    Token,
+    TokenType,
+)
+
+TOKEN_TYPES:tuple[TokenType, ...] = tuple(TokenType)
+"""Every token type, indexed by its type code"""
+
+TOKEN_TYPE_CODES:dict[TokenType, int] = {type_: code for code, type_ in enumerate(TOKEN_TYPES)}
+"""dict[token type, type code], the inverse of TOKEN_TYPES"""
+
+_STORED_VALUES:frozenset[TokenType] = frozenset((
+    TokenType.DEDENT,
+    TokenType.EOF,
+    TokenType.INDENT,
+))
+"""Token types whose value isn't just their slice of the source"""
+
+_NEWLINE:re.Pattern = re.compile("\n")
+_BYTE_NEWLINE:re.Pattern = re.compile(b"\n")
+
+class TokenBuffer:
+    """
+    A token stream kept as parallel columns instead of one object per token.
+    
+    Each token is a type code and the start and end offsets of its lexeme in
+    the source. Values are sliced (or decoded, for buffers) when asked for, and
+    lines and columns are worked out from an index of where the newlines are,
+    which itself only gets built the first time a line is asked for. The few
+    tokens with made up values (indents, dedents, eof) keep them on the side.
+    
+    Indexing hands back a Token built from the columns, for anything that still
+    wants objects.
+    """
+    def __init__(self, source=""):
+        self.source = source
+        """The str or buffer the offsets point into"""
+        
+        self.types:array = array("B")
+        """Type code of each token, see TOKEN_TYPES"""
+        
+        self.starts:array = array("Q")
+        """Offset each token starts at"""
+        
+        self.ends:array = array("Q")
+        """Offset just past the end of each token"""
+        
+        self.symbol_ids:array = array("l")
+        """Symbol ID of each token, -1 for anything that didn't get one"""
+        
+        self._values:dict[int, str] = {}
+        self._newlines:array|None = None
+        self._binary:bool = not isinstance(source, str)
+    
+    def __len__(self) -> int:
+        return len(self.types)
+    
+    def __getitem__(self, index:int) -> Token:
+        if (index < 0):
+            index += len(self.types)
+        
+        return Token(self.type_of(index), self.value_of(index), self.line_of(index), self.column_of(index), self.symbol_ids[index])
+    
+    def __iter__(self) -> Iterator[Token]:
+        for i in range(len(self.types)):
+            yield self[i]
+    
+    def append(self, type_:TokenType, start:int, end:int, value:str|None = None, symbol:int = -1) -> None:
+        """
+        Add a token to the end of the buffer.
+        
+        Args:
+            type_: the token type
+            start: offset the lexeme starts at
+            end: offset just past the end of the lexeme
+            value: the value, only kept for indents, dedents and eof
+            symbol: symbol ID, for identifiers
+        """
+        if (type_ in _STORED_VALUES):
+            self._values[len(self.types)] = value
+        
+        self.types.append(TOKEN_TYPE_CODES[type_])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.symbol_ids.append(symbol)
+    
+    def type_of(self, index:int) -> TokenType:
+        return TOKEN_TYPES[self.types[index]]
+    
+    def symbol_of(self, index:int) -> int:
+        return self.symbol_ids[index]
+    
+    def value_of(self, index:int) -> str:
+        ret:str|None = self._values.get(index)
+        
+        if (ret is None):
+            ret = self._text(self.starts[index], self.ends[index])
+        
+        return ret
+    
+    def _text(self, start:int, end:int) -> str:
+        if (self._binary):
+            return str(self.source[start:end], "utf-8")
+        
+        return self.source[start:end]
+    
+    def _newline_index(self) -> array:
+        """Offsets of every newline in the source, built on first use"""
+        if (self._newlines is None):
+            pattern:re.Pattern = _BYTE_NEWLINE if self._binary else _NEWLINE
+            self._newlines = array("Q", (found.start() for found in pattern.finditer(self.source)))
+        
+        return self._newlines
+    
+    def line_of(self, index:int) -> int:
+        # lines are one more than the number of newlines before the token
+        return bisect_left(self._newline_index(), self.starts[index]) + 1
+    
+    def column_of(self, index:int) -> int:
+        start:int = self.starts[index]
+        line:int = self.line_of(index)
+        line_start:int = 0
+        
+        if (line > 1):
+            line_start = self._newline_index()[line - 2] + 1
+        
+        # columns are characters, not bytes
+        if (self._binary):
+            return len(self._text(line_start, start)) + 1
+        
+        return start - line_start + 1
@@ -0,0 +1,198 @@
+from bisect import (
+    bisect_left,
+    bisect_right,
+    insort,
+)
+
+class AllocationReport():
+    """How an allocator's memory is carved up at the moment"""
+    def __init__(self, free_bytes:int, allocated_bytes:int, free_blocks:int, largest_free_block:int):
+        self.free_bytes:int = free_bytes
+        """Bytes not handed out"""
+        
+        self.allocated_bytes:int = allocated_bytes
+        """Bytes handed out"""
+        
+        self.free_blocks:int = free_blocks
+        """How many separate runs the free bytes are in"""
+        
+        self.largest_free_block:int = largest_free_block
+        """The biggest single thing that could still be allocated"""
+    
+    @property
+    def fragmentation(self) -> float:
+        """0 when all the free space is in one run, heading to 1 as it's scattered"""
+        if (self.free_bytes == 0):
+            return 0.0
+        
+        return 1.0 - (self.largest_free_block / self.free_bytes)
+    
+    def __repr__(self):
+        return f"AllocationReport({self.allocated_bytes} allocated, {self.free_bytes} free in {self.free_blocks} blocks, largest {self.largest_free_block}, {self.fragmentation:.0%} fragmented)"
+
+class RAMAllocator():
+    """
+    Hands out runs of addresses.
+    
+    Free space is kept as a list of blocks sorted by address, plus the same
+    blocks sorted by size. Freed blocks merge with free neighbours straight
+    away, found through the address list, and allocate_any goes to the size list
+    for the smallest block that could work. Lookups are all bisects.
+    """
+    def __init__(self, start:int, length:int):
+        self.start:int = start
+        self.length:int = length
+        
+        self._starts:list[int] = [start]
+        """Start of each free block, sorted"""
+        
+        self._ends:dict[int, int] = {start: start + length}
+        """dict[free block start, end]"""
+        
+        self._by_end:dict[int, int] = {start + length: start}
+        """dict[free block end, start]"""
+        
+        self._by_size:list[tuple[int, int]] = [(length, start)]
+        """(length, start) of each free block, sorted"""
+        
+        self.allocations:dict[int, int] = {}
+        """dict[start, length] of everything handed out"""
+    
+    def _add_free(self, start:int, end:int) -> None:
+        # merge with whatever's free either side
+        if (end in self._ends):
+            swp:int = self._ends[end]
+            self._remove_free(end)
+            end = swp
+        
+        if (start in self._by_end):
+            swp:int = self._by_end[start]
+            self._remove_free(swp)
+            start = swp
+        
+        insort(self._starts, start)
+        insort(self._by_size, (end - start, start))
+        self._ends[start] = end
+        self._by_end[end] = start
+    
+    def _remove_free(self, start:int) -> None:
+        end:int = self._ends.pop(start)
+        del self._by_end[end]
+        del self._starts[bisect_left(self._starts, start)]
+        del self._by_size[bisect_left(self._by_size, (end - start, start))]
+    
+    def _claim(self, block:int, address:int, length:int) -> int:
+        """Take a run out of a free block, giving back whatever's left over"""
+        end:int = self._ends[block]
+        self._remove_free(block)
+        
+        if (block < address):
+            self._add_free(block, address)
+        
+        if ((address + length) < end):
+            self._add_free(address + length, end)
+        
+        self.allocations[address] = length
+        
+        return address
+    
+    def allocate(self, address:int, length:int) -> int:
+        """
+        Allocate a run at a particular address.
+        
+        Args:
+            address: where it has to go
+            length: how many bytes
+        
+        Returns:
+            int: address
+        """
+        if (length <= 0):
+            raise ValueError(f"Can't allocate {length} bytes")
+        
+        index:int = bisect_right(self._starts, address) - 1
+        
+        if ((index < 0) or (self._ends[self._starts[index]] < (address + length))):
+            raise ValueError(f"{length} bytes at {hex(address)} aren't free")
+        
+        return self._claim(self._starts[index], address, length)
+    
+    def _fit(self, start:int, end:int, length:int, align:int, boundary:int) -> int|None:
+        """Where in a free block a run fits, if it does"""
+        ret:int = start + (-start % align)
+        
+        # crossing a boundary means starting again from the next one
+        if ((boundary > 0) and ((ret // boundary) != ((ret + length - 1) // boundary))):
+            ret = ((ret // boundary) + 1) * boundary
+            ret += -ret % align
+        
+        if ((ret + length) > end):
+            return None
+        
+        return ret
+    
+    def allocate_any(self, length:int, align:int = 1, boundary:int = 0x10000) -> int:
+        """
+        Allocate a run wherever it fits best.
+        
+        Goes for the smallest free block that can take it, to keep the big
+        blocks big.
+        
+        Args:
+            length: how many bytes
+            align: what the address has to be a multiple of
+            boundary: a multiple of this can't fall inside the run - the bank
+                      size by default, so nothing straddles two banks. 0 for
+                      no limit
+        
+        Returns:
+            int: where it went
+        """
+        if (length <= 0):
+            raise ValueError(f"Can't allocate {length} bytes")
+        
+        if (align <= 0):
+            raise ValueError(f"Can't align to {align}")
+        
+        if ((boundary > 0) and (length > boundary)):
+            raise ValueError(f"{length} bytes will never fit between {hex(boundary)} boundaries")
+        
+        # by index, the first that could fit is usually the one, no need to copy the rest
+        for i in range(bisect_left(self._by_size, (length, -1)), len(self._by_size)):
+            size, start = self._by_size[i]
+            address:int|None = self._fit(start, start + size, length, align, boundary)
+            
+            if (address is not None):
+                return self._claim(start, address, length)
+        
+        raise MemoryError(f"No room for {length} bytes (aligned to {align})")
+    
+    def deallocate(self, address:int, length:int|None = None) -> None:
+        """
+        Give a run back.
+        
+        Args:
+            address: where it was allocated
+            length: how many bytes, has to match what was allocated if given
+        """
+        swp:int|None = self.allocations.get(address)
+        
+        if (swp is None):
+            raise ValueError(f"Nothing was allocated at {hex(address)}")
+        
+        if ((length is not None) and (length != swp)):
+            raise ValueError(f"{hex(address)} was allocated {swp} bytes, not {length}")
+        
+        del self.allocations[address]
+        self._add_free(address, address + swp)
+    
+    def report(self) -> AllocationReport:
+        """How fragmented things are"""
+        free:int = sum(size for size, _ in self._by_size)
+        
+        return AllocationReport(
+            free,
+            self.length - free,
+            len(self._by_size),
+            self._by_size[-1][0] if self._by_size else 0,
+        )
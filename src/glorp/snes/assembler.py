@@ -0,0 +1,450 @@
+from typing import (
+    Hashable,
+    Iterator,
+)
+
+from .opcodes import (
+    OPCODES_BY_MNEMONIC_THEN_MODE,
+    Opcode,
+    SnesAddressMode,
+    lookup,
+)
+
+_ABS = SnesAddressMode.ABSOLUTE
+_ABX = SnesAddressMode.ABSOLUTE_INDEXED_BY_X
+_ABL = SnesAddressMode.ABSOLUTE_LONG
+_ALX = SnesAddressMode.ABSOLUTE_LONG_INDEXED_BY_X
+_AXI = SnesAddressMode.ABSOLUTE_INDEXED_INDIRECT
+_DP = SnesAddressMode.DIRECT_PAGE
+_REL = SnesAddressMode.RELATIVE
+_RELL = SnesAddressMode.RELATIVE_LONG
+
+BRANCH_INVERSES:dict[str, str] = {
+    "bcc": "bcs",
+    "bcs": "bcc",
+    "beq": "bne",
+    "bne": "beq",
+    "bmi": "bpl",
+    "bpl": "bmi",
+    "bvc": "bvs",
+    "bvs": "bvc",
+}
+"""dict[conditional branch, the branch on the opposite condition]"""
+
+JUMPS:frozenset[str] = frozenset(("bra", "brl", "jmp", "jml"))
+"""Unconditional jumps that don't come back - any of them will do for any other, but BRL stays in its bank"""
+
+_JUMP_FORMS:tuple[tuple[tuple[str, SnesAddressMode], ...], ...] = (
+    (("bra", _REL),),
+    (("jmp", _ABS),),
+    (("jml", _ABL),),
+)
+"""Smallest first - BRA if it's close, JMP if it's in the same bank, JML if not"""
+
+_NEAR_JUMP_FORMS:tuple[tuple[tuple[str, SnesAddressMode], ...], ...] = _JUMP_FORMS[:2]
+"""What a BRL can be instead - it can't leave the bank, and the JMP says so if it has to"""
+
+_IN_BANK:frozenset[tuple[str, SnesAddressMode]] = frozenset((
+    ("jmp", _ABS),
+    ("jmp", _AXI),
+    ("jsr", _ABS),
+    ("jsr", _AXI),
+))
+"""Forms that only take 16 bits, and stay in the bank they're in"""
+
+class IRLabel():
+    """Marks a place in an IRBlock"""
+    __slots__ = (
+        "key",
+    )
+    
+    def __init__(self, key:Hashable):
+        self.key:Hashable = key
+        """What it's called - a symbol ID, or anything else hashable"""
+    
+    def __repr__(self):
+        return f"IRLabel({self.key!r})"
+
+class IRData():
+    """Raw bytes in an IRBlock"""
+    __slots__ = (
+        "data",
+    )
+    
+    def __init__(self, data:bytes):
+        self.data:bytes = bytes(data)
+    
+    def __repr__(self):
+        return f"IRData({self.data.hex(' ')})"
+
+class IRInstruction():
+    """One instruction in an IRBlock, operand and all, before it has an address"""
+    __slots__ = (
+        "mnemonic",
+        "mode",
+        "operand",
+        "target",
+        "size",
+        "relax",
+    )
+    
+    def __init__(self, mnemonic:str, mode:SnesAddressMode, operand:int = 0, target:Hashable|None = None, size:int|None = None, relax:bool = True):
+        self.mnemonic:str = mnemonic
+        self.mode:SnesAddressMode = mode
+        
+        self.operand:int = operand
+        """The operand, or what to add to the target's address if there is one"""
+        
+        self.target:Hashable|None = target
+        """Label the operand is relative to, None for a plain number"""
+        
+        self.size:int|None = size
+        """Operand bytes for immediates that follow M or X, None for everything else"""
+        
+        self.relax:bool = relax
+        """Whether the assembler can swap this for a shorter form that does the same thing"""
+    
+    def __repr__(self):
+        return f"IRInstruction({self.mnemonic}, {self.mode.name}, {hex(self.operand)}, {self.target!r})"
+
+IRItem = IRInstruction|IRLabel|IRData
+
+class IRBlock():
+    """
+    A run of code with symbolic labels, waiting to be assembled.
+    
+    Nothing has an address until it's assembled, so labels can be used before
+    they're placed, and the assembler's free to pick how big each instruction
+    ends up.
+    """
+    def __init__(self):
+        self.items:list[IRItem] = []
+    
+    def __len__(self) -> int:
+        return len(self.items)
+    
+    def __iter__(self) -> Iterator[IRItem]:
+        return iter(self.items)
+    
+    def emit(self, mnemonic:str, mode:SnesAddressMode = SnesAddressMode.IMPLIED, operand:int = 0, *, target:Hashable|None = None, size:int|None = None, relax:bool = True) -> IRInstruction:
+        """
+        Add an instruction.
+        
+        Args:
+            mnemonic: the mnemonic, lowercase
+            mode: the addressing mode
+            operand: the operand, or an offset from the target
+            target: label to aim at, if any
+            size: operand bytes, needed for immediates that follow M or X
+            relax: whether it can be swapped for a shorter form
+        
+        Returns:
+            IRInstruction: what was added
+        """
+        opcode:Opcode = lookup(mnemonic, mode)
+        
+        if (opcode.width_flag and (size is None)):
+            raise ValueError(f"{mnemonic} #{hex(operand)} needs a size, the width depends on P")
+        
+        ret:IRInstruction = IRInstruction(mnemonic, mode, operand, target, size, relax)
+        self.items.append(ret)
+        
+        return ret
+    
+    def label(self, key:Hashable) -> IRLabel:
+        """Place a label here"""
+        ret:IRLabel = IRLabel(key)
+        self.items.append(ret)
+        
+        return ret
+    
+    def data(self, data:bytes) -> IRData:
+        """Add raw bytes here"""
+        ret:IRData = IRData(data)
+        self.items.append(ret)
+        
+        return ret
+
+class AssembledBlock():
+    """What came out of assembling an IRBlock"""
+    def __init__(self, origin:int, code:bytearray, labels:dict, passes:int):
+        self.origin:int = origin
+        """Address the code starts at"""
+        
+        self.code:bytearray = code
+        
+        self.labels:dict = labels
+        """dict[label key, address] for every label placed in the block"""
+        
+        self.passes:int = passes
+        """How many layout passes it took for the sizes to settle"""
+
+def _is_system_bank(bank:int) -> bool:
+    """Banks $00-$3F and $80-$BF, where $0000-$7FFF is the same everywhere"""
+    return (bank & 0x7F) < 0x40
+
+class _Layout():
+    """An instruction's options, and which one it's on"""
+    __slots__ = (
+        "instruction",
+        "forms",
+        "form",
+        "sizes",
+    )
+    
+    def __init__(self, instruction:IRInstruction, forms:list[tuple[tuple[str, SnesAddressMode], ...]]):
+        self.instruction:IRInstruction = instruction
+        self.forms:list[tuple[tuple[str, SnesAddressMode], ...]] = forms
+        self.form:int = 0
+        self.sizes:list[int] = [sum(self._step_size(mnemonic, mode) for mnemonic, mode in form) for form in forms]
+    
+    def _step_size(self, mnemonic:str, mode:SnesAddressMode) -> int:
+        opcode:Opcode = lookup(mnemonic, mode)
+        return 1 + (self.instruction.size if opcode.width_flag else opcode.size)
+    
+    @property
+    def size(self) -> int:
+        return self.sizes[self.form]
+
+class Assembler():
+    """
+    Lays out and encodes IRBlocks.
+    
+    Every instruction starts out in its smallest form. Each pass gives
+    everything an address, then bumps up anything whose form doesn't reach -
+    a branch too far away for 8 bits, a JMP to another bank - to its next form,
+    until a pass goes by with nothing changing. Forms only ever grow, so it
+    always settles.
+    
+    The forms, smallest first:
+    
+    - BRA, JMP and JML to a label: BRA, JMP, JML
+    - conditional branches to a label: the branch, or the opposite branch over
+      a JMP, or over a JML
+    - absolute and long data accesses: direct page, absolute, long - as far as
+      the direct page and data bank registers are known to reach
+    """
+    def __init__(self, labels:dict|None = None, direct_page:int|None = None, data_bank:int|None = None):
+        self.labels:dict = {} if (labels is None) else labels
+        """dict[label key, address] for labels placed somewhere else already"""
+        
+        self.direct_page:int|None = direct_page
+        """What D holds, None if it isn't known"""
+        
+        self.data_bank:int|None = data_bank
+        """What DBR holds, None if it isn't known"""
+    
+    def _forms(self, instruction:IRInstruction) -> list[tuple[tuple[str, SnesAddressMode], ...]]:
+        """Every way an instruction could be encoded, smallest first"""
+        mnemonic:str = instruction.mnemonic
+        mode:SnesAddressMode = instruction.mode
+        ret:list[tuple[tuple[str, SnesAddressMode], ...]] = [((mnemonic, mode),)]
+        
+        if (not instruction.relax):
+            return ret
+        
+        if (instruction.target is not None):
+            if ((mnemonic in JUMPS) and (mode in (_REL, _RELL, _ABS, _ABL))):
+                return list(_NEAR_JUMP_FORMS if (mnemonic == "brl") else _JUMP_FORMS)
+            
+            if ((mnemonic in BRANCH_INVERSES) and (mode == _REL)):
+                inverse:str = BRANCH_INVERSES[mnemonic]
+                return [ret[0], ((inverse, _REL), ("jmp", _ABS)), ((inverse, _REL), ("jml", _ABL))]
+        
+        if (mnemonic in JUMPS):
+            return ret
+        
+        modes:dict[SnesAddressMode, Opcode] = OPCODES_BY_MNEMONIC_THEN_MODE[mnemonic]
+        candidates:tuple[SnesAddressMode, ...] = ()
+        
+        if (mode == _ABS):
+            candidates = (_DP, _ABS)
+        elif (mode == _ABL):
+            candidates = (_DP, _ABS, _ABL)
+        elif (mode == _ALX):
+            candidates = (_ABX, _ALX)
+        
+        if (candidates):
+            ret = [((mnemonic, candidate),) for candidate in candidates if (candidate in modes)]
+        
+        return ret
+    
+    def _value(self, instruction:IRInstruction, labels:dict) -> int:
+        """What the operand works out to, label and all"""
+        if (instruction.target is None):
+            return instruction.operand
+        
+        swp:int|None = labels.get(instruction.target)
+        
+        if (swp is None):
+            swp = self.labels.get(instruction.target)
+        
+        if (swp is None):
+            raise ValueError(f"Label {instruction.target!r} was never placed")
+        
+        return swp + instruction.operand
+    
+    def _data_address(self, instruction:IRInstruction, value:int) -> int|None:
+        """The full address a data access touches, None if the bank isn't known"""
+        if (instruction.mode in (_ABL, _ALX)):
+            return value
+        
+        if (self.data_bank is None):
+            return None
+        
+        return (self.data_bank << 16) | (value & 0xFFFF)
+    
+    def _fits(self, instruction:IRInstruction, step:int, steps:int, mode:SnesAddressMode, address:int, value:int) -> bool:
+        """Whether one step of a form does what the instruction asked for"""
+        if (mode == _REL):
+            if (step < (steps - 1)):
+                # the hop over the long jump always fits
+                return True
+            
+            # and it wraps round in the bank it's in, rather than leaving
+            return ((value >> 16) == (address >> 16)) and (-128 <= (value - (address + 2)) <= 127)
+        
+        if ((instruction.target is not None) and ((instruction.mnemonic in JUMPS) or (instruction.mnemonic in BRANCH_INVERSES))):
+            # jmp stays in the bank it's in, jml goes anywhere
+            return (mode == _ABL) or ((value >> 16) == (address >> 16))
+        
+        if (mode == instruction.mode):
+            return True
+        
+        full:int|None = self._data_address(instruction, value)
+        
+        if (full is None):
+            return False
+        
+        if (mode == _DP):
+            if ((self.direct_page is None) or (not _is_system_bank(full >> 16)) or ((full & 0xFFFF) >= 0x8000)):
+                return False
+            
+            return 0 <= ((full & 0xFFFF) - self.direct_page) <= 0xFF
+        
+        # absolute, indexed or not, from long
+        if (self.data_bank is None):
+            return False
+        
+        if ((full >> 16) == self.data_bank):
+            return True
+        
+        return _is_system_bank(full >> 16) and _is_system_bank(self.data_bank) and ((full & 0xFFFF) < 0x8000)
+    
+    def _operand(self, instruction:IRInstruction, step:int, steps:int, mode:SnesAddressMode, address:int, value:int, size:int) -> int:
+        """The number that actually goes in one step of a form"""
+        if (mode == _REL):
+            if (step < (steps - 1)):
+                # hop over the long jump after it
+                return 3 if (size == 5) else 4
+            
+            return value - (address + 2)
+        
+        if (mode == _RELL):
+            return value - (address + 3)
+        
+        if (mode == _DP):
+            return (value & 0xFFFF) - self.direct_page
+        
+        if ((mode == _ABS) or (mode == _ABX)):
+            return value & 0xFFFF
+        
+        return value
+    
+    def assemble(self, block:IRBlock, origin:int) -> AssembledBlock:
+        """
+        Lay out and encode a block.
+        
+        Args:
+            block: the code
+            origin: the address it's going at
+        
+        Returns:
+            AssembledBlock: the code, and where its labels landed
+        """
+        layouts:list[_Layout|IRItem] = [
+            _Layout(item, self._forms(item)) if isinstance(item, IRInstruction) else item
+            for item in block
+        ]
+        
+        labels:dict = {}
+        passes:int = 0
+        changed:bool = True
+        
+        while (changed):
+            passes += 1
+            changed = False
+            address:int = origin
+            
+            # where everything is, with the forms as they are
+            addresses:list[int] = []
+            
+            for item in layouts:
+                addresses.append(address)
+                
+                if (isinstance(item, IRLabel)):
+                    if ((passes == 1) and (item.key in labels)):
+                        raise ValueError(f"Label {item.key!r} is placed more than once")
+                    
+                    labels[item.key] = address
+                elif (isinstance(item, IRData)):
+                    address += len(item.data)
+                else:
+                    address += item.size
+            
+            end:int = address
+            
+            # and whatever doesn't reach moves up a form
+            for item, address in zip(layouts, addresses):
+                if (not isinstance(item, _Layout)):
+                    continue
+                
+                value:int = self._value(item.instruction, labels)
+                
+                while (not self._form_fits(item, address, value)):
+                    item.form += 1
+                    changed = True
+        
+        code:bytearray = bytearray(end - origin)
+        
+        for item, address in zip(layouts, addresses):
+            if (isinstance(item, IRData)):
+                code[address - origin:address - origin + len(item.data)] = item.data
+            elif (isinstance(item, _Layout)):
+                self._encode(item, address, self._value(item.instruction, labels), code, address - origin)
+        
+        return AssembledBlock(origin, code, labels, passes)
+    
+    def _form_fits(self, layout:_Layout, address:int, value:int) -> bool:
+        form:tuple[tuple[str, SnesAddressMode], ...] = layout.forms[layout.form]
+        
+        if (layout.form == (len(layout.forms) - 1)):
+            # the last form has to do, if it doesn't the encoder will say so
+            return True
+        
+        for i, (_, mode) in enumerate(form):
+            if (not self._fits(layout.instruction, i, len(form), mode, address, value)):
+                return False
+            
+            address += layout._step_size(*form[i])
+        
+        return True
+    
+    def _encode(self, layout:_Layout, address:int, value:int, code:bytearray, offset:int) -> None:
+        form:tuple[tuple[str, SnesAddressMode], ...] = layout.forms[layout.form]
+        
+        for i, (mnemonic, mode) in enumerate(form):
+            # JSR can't just become JSL, the callee would have to RTL
+            if (((mnemonic, mode) in _IN_BANK) and (layout.instruction.target is not None) and ((value >> 16) != (address >> 16))):
+                raise ValueError(f"{mnemonic.upper()} at {address:06X} can't reach {layout.instruction.target!r} at {value:06X}, it's in another bank")
+            
+            opcode:Opcode = lookup(mnemonic, mode)
+            size:int = layout.instruction.size if opcode.width_flag else opcode.size
+            operand:int = self._operand(layout.instruction, i, len(form), mode, address, value, layout.size)
+            
+            if ((mode not in (_REL, _RELL)) and (size > 0)):
+                operand &= (1 << (size * 8)) - 1
+            
+            swp:int = opcode.encode_into(code, offset, operand, size)
+            offset += swp
+            address += swp
@@ -0,0 +1,66 @@
+_BIT_TABLES:dict[int, bytes] = {}
+
+def _bit_table(code:int) -> bytes:
+    """translate table turning one byte value into "1", and everything else into "0"."""
+    ret:bytes|None = _BIT_TABLES.get(code)
+    
+    if (ret is None):
+        swp:bytearray = bytearray(b"0" * 256)
+        swp[code] = ord("1")
+        ret = bytes(swp)
+        _BIT_TABLES[code] = ret
+    
+    return ret
+
+def pack(lanes, code:int) -> int:
+    """
+    Pack a plane into a bitset of where it holds one code.
+    
+    The bytes are translated to "0"s and "1"s and read back as a binary number,
+    so the whole thing is three C loops - no Python per byte.
+    
+    Args:
+        lanes: the plane, one byte per address
+        code: which value to look for
+    
+    Returns:
+        int: bit i is set if lanes[i] is code
+    """
+    if (len(lanes) == 0):
+        return 0
+    
+    return int(bytes(lanes).translate(_bit_table(code))[::-1], 2)
+
+def runs_of(bits:int, length:int) -> int:
+    """
+    Find where runs of set bits start.
+    
+    Each pass ands the set with itself shifted down, doubling the length of run
+    it's checked for, so it's log2(length) passes over the whole set at once.
+    
+    Args:
+        bits: the bitset
+        length: how long a run has to be
+    
+    Returns:
+        int: bit i is set if bits i to i + length - 1 are all set
+    """
+    checked:int = 1
+    
+    while ((checked < length) and (bits != 0)):
+        step:int = min(checked, length - checked)
+        bits &= bits >> step
+        checked += step
+    
+    return bits
+
+def every(align:int, count:int, phase:int = 0) -> int:
+    """A bitset with every align-th bit set, starting from phase, count bits long"""
+    if (count <= 0):
+        return 0
+    
+    return (int(("0" * (align - 1) + "1") * ((count // align) + 1), 2) << phase) & ((1 << count) - 1)
+
+def lowest(bits:int) -> int:
+    """Index of the lowest set bit, -1 if there isn't one"""
+    return (bits & -bits).bit_length() - 1
@@ -1,75 +1,323 @@
-from .ram import SnesRAM
+from .ram import (
+    FLAG_CARRY,
+    FLAG_EMULATION,
+    FLAG_INDEX_REGISTER_SELECT,
+    FLAG_MEMORY_ACCUMULATOR_SELECT,
+    SNESProcessStatusRegister,
+    SnesCPURegisters,
+    SnesRAM,
+)
 from .rom import SnesROM
-from ..lexparse.ast import AST
+from ..lexparse.ast import (
+    AST,
+    ASTFunctionCall,
+    ASTFunctionDef,
+)
+from ..lexparse.symbols import SymbolTable
 
-from enum import Enum
+from .assembler import (
+    AssembledBlock,
+    Assembler,
+    IRBlock,
+)
 
-class SnesAddressMode(Enum):
-    ABSOLUTE  = "absolute"
-    ABSOLUTE_INDEXED_BY_X = "absolute indexed by x"
-    ABSOLUTE_INDEXED_BY_Y = "absolute indexed by y"
-    ABSOLUTE_LONG = "absolute_long"
-    ABSOLUTE_LONG_INDEXED_BY_X = "absolute long indexed by x"
-    DIRECT_PAGE = "direct page"
-    DIRECT_PAGE_INDEXED_BY_X = "direct page indexed by x"
-    DIRECT_PAGE_INDEXED_BY_Y = "direct page indexed by y"
-    DIRECT_PAGE_INDEXED_INDIRECT_BY_X = "direct page indexed indirect by x"
-    DIRECT_PAGE_INDIRECT = "direct page indirect"
-    DIRECT_PAGE_INDIRECT_LONG = "direct page indirect long"
-    DIRECT_PAGE_INDIRECT_LONG_INDEXED_BY_Y = "direct page indirect long indexed by y"
-    IMMEDIATE = "immediate"
-    IMPLIED = "implied"
-    STACK_RELATIVE = "stack relative"
-    STACK_RELATIVE_INDIRECT_INDEXED_BY_Y = "stack_relative_indirect_indexed_by_y"
+from .opcodes import (
+    OPCODES_BY_MNEMONIC_THEN_MODE,
+    Opcode,
+    SnesAddressMode,
+    lookup,
+)
+
+from .flow import WidthFlow
+from .folding import Folder
+from .inliner import Inliner
+from .peephole import (
+    REG_A,
+    REG_X,
+    REG_Y,
+    Peephole,
+)
+from .summaries import (
+    FunctionSummary,
+    SummaryFlow,
+    summarize,
+)
 
 OPS_BY_MENUMONIC_THEN_MODE:dict[str, dict[SnesAddressMode, int]] = {
-    "clc": {
-        SnesAddressMode.IMPLIED: 0x18,
-    },
-    "lda": {
-        SnesAddressMode.ABSOLUTE_LONG: 0xAF,
-        SnesAddressMode.IMMEDIATE: 0xA9,
-    },
-    "nop": {
-        SnesAddressMode.IMPLIED: 0xEA,
-    },
-    "rep": {
-        SnesAddressMode.IMMEDIATE: 0xE2,
-    },
-    "sec": {
-        SnesAddressMode.IMPLIED: 0x38,
-    },
-    "sei": {
-        SnesAddressMode.IMPLIED: 0x78,
-    },
-    "sep": {
-        SnesAddressMode.IMMEDIATE: 0xE2,
-    },
-    "sta": {
-        SnesAddressMode.ABSOLUTE: 0x8D,
-        SnesAddressMode.ABSOLUTE_LONG: 0xAF,
-    },
-    "tcd": {
-        SnesAddressMode.IMPLIED: 0x5B
-    },
-    "xce": {
-        SnesAddressMode.IMPLIED: 0xFB
-    }
+    mnemonic: {mode: opcode.opcode for mode, opcode in modes.items()}
+    for mnemonic, modes in OPCODES_BY_MNEMONIC_THEN_MODE.items()
 }
-"""dict[mnemonic, dict[mode, opcode]]"""
+"""dict[mnemonic, dict[mode, opcode]] - see opcodes for the rest of what's known about each"""
+
+INTERRUPT_HANDLERS:tuple[str, ...] = (
+    "abort",
+    "brk",
+    "cop",
+    "irq",
+    "nmi",
+)
+"""Functions the hardware can go to whenever, without anything calling them"""
+
+_SETS_DIRECT_PAGE:frozenset[str] = frozenset(("pld", "tcd"))
+"""Instructions that change D"""
+
+_SETS_DATA_BANK:frozenset[str] = frozenset(("mvn", "mvp", "plb"))
+"""Instructions that change DBR - block moves leave it at the destination bank"""
 
 class SnesCompiler():
-    def __init__(self):
-        self.src:AST = AST()
+    def __init__(self, src:AST|None = None):
+        self.src:AST = AST() if (src is None) else src
         self.rom:SnesROM = SnesROM()
         self.ram:SnesRAM = SnesRAM()
+        
+        self.functions:dict[int, ASTFunctionDef] = {}
+        """dict[symbol, function def] for every function in src"""
+        
+        self.labels:dict[int, int] = {}
+        """dict[symbol, ROM address] for everything placed so far"""
+        
+        self.ir:IRBlock = IRBlock()
+        """Code waiting to be assembled into the ROM, at the end of the segment"""
+        
+        self.dead_functions:set[int] = set()
+        """Symbols of the functions nothing can reach, left out of the ROM"""
+        
+        self.inliner:Inliner|None = Inliner()
+        """Pastes small functions in where they're called, None to keep every call"""
+        
+        self.folder:Folder|None = Folder()
+        """Keeps code that's in the ROM more than once just the once, None to leave it"""
+        
+        self.summaries:dict[int, FunctionSummary] = {}
+        """dict[function symbol, what calling it does], once they're compiled"""
+        
+        self.flow:WidthFlow|None = SummaryFlow(self.summaries)
+        """Sorts out REP and SEP before the peephole runs, None to leave them as written"""
+        
+        self.peephole:Peephole|None = Peephole()
+        """Tidies up code before it's assembled, None to leave it as written"""
+    
+    @property
+    def symbols(self) -> SymbolTable:
+        """The table every symbol ID in here comes from, which is src's"""
+        return self.src.symbols
+    
+    def helper_index_functions(self) -> dict[int, ASTFunctionDef]:
+        """
+        Index the top level functions in src by symbol.
+        
+        Returns:
+            dict[int, ASTFunctionDef]: dict[symbol, function def]
+        """
+        self.functions = {}
+        
+        for node in self.src.body:
+            if (isinstance(node, ASTFunctionDef)):
+                if (node.symbol in self.functions):
+                    raise ValueError(f"Function {node.name} is defined more than once!")
+                
+                self.functions[node.symbol] = node
+        
+        return self.functions
+    
+    def helper_call_graph(self) -> dict[int, set[int]]:
+        """
+        Work out who calls who.
+        
+        Returns:
+            dict[int, set[int]]: dict[caller symbol, callee symbols], for every
+                                 indexed function
+        """
+        ret:dict[int, set[int]] = {}
+        
+        for symbol, function in self.functions.items():
+            ret[symbol] = {node.symbol for node in function.body if isinstance(node, ASTFunctionCall)}
+        
+        return ret
+    
+    def helper_reachable(self, roots:list[int]|None = None) -> set[int]:
+        """
+        Work out which functions can ever run.
+        
+        Args:
+            roots: symbols of where running starts - main and any interrupt
+                   handlers, if not given
+        
+        Returns:
+            set[int]: symbols of every indexed function reachable from a root
+        """
+        if (roots is None):
+            roots = [self.symbols.lookup(name) for name in ("main",) + INTERRUPT_HANDLERS]
+        
+        graph:dict[int, set[int]] = self.helper_call_graph()
+        ret:set[int] = set()
+        work:list[int] = [symbol for symbol in roots if (symbol in graph)]
+        
+        while (work):
+            symbol:int = work.pop()
+            
+            if (symbol in ret):
+                continue
+            
+            ret.add(symbol)
+            work.extend(callee for callee in graph[symbol] if ((callee in graph) and (callee not in ret)))
+        
+        return ret
+    
+    def helper_function_ir(self, function:ASTFunctionDef) -> IRBlock:
+        """
+        The code for one function - its label, a JSR for every call, and RTS.
+        
+        Interrupt handlers end in RTI instead, since the hardware goes to them
+        through a vector rather than a JSR - so nothing can call one.
+        
+        Args:
+            function: the function
+        
+        Returns:
+            IRBlock: its code
+        """
+        ret:IRBlock = IRBlock()
+        ret.label(function.symbol)
+        
+        for node in function.body:
+            if (isinstance(node, ASTFunctionCall)):
+                if (node.symbol not in self.functions):
+                    raise ValueError(f"Function {node.name} isn't defined!")
+                
+                if (self.functions[node.symbol].name in INTERRUPT_HANDLERS):
+                    raise ValueError(f"{node.name} is an interrupt handler, it can't be called!")
+                
+                ret.emit("jsr", SnesAddressMode.ABSOLUTE, target=node.symbol)
+        
+        ret.emit("rti" if (function.name in INTERRUPT_HANDLERS) else "rts")
+        
+        return ret
+    
+    def helper_compile_functions(self, entry:SNESProcessStatusRegister|None = None, direct_page:int|None = None, data_bank:int|None = None) -> None:
+        """
+        Compile every function that can ever run into one segment, main first.
+        
+        Anything main or an interrupt handler can't reach is left out
+        altogether, and goes in dead_functions. What's left goes through the
+        inliner and the folder, if there are any, and then they're all
+        summarized before any of them are assembled, so each one comes in
+        knowing whatever all its callers leave set, and skips setting up what's
+        set up already. Copies folded away keep their labels, on the one kept.
+        
+        Args:
+            entry: what's known coming into main, nothing if not given
+            direct_page: what D holds all through the functions, if it's known
+            data_bank: what DBR holds all through the functions, if it's known
+        """
+        main:int|None = self.symbols.lookup("main")
+        live:set[int] = self.helper_reachable()
+        self.dead_functions = set(self.functions) - live
+        
+        blocks:dict[int, IRBlock] = {
+            symbol: self.helper_function_ir(function)
+            for symbol, function in self.functions.items() if (symbol in live)
+        }
+        
+        if (len(blocks) == 0):
+            return
+        
+        # interrupts come in from anywhere
+        entries:dict[int, SNESProcessStatusRegister] = {
+            symbol: SNESProcessStatusRegister()
+            for symbol in (self.symbols.lookup(name) for name in INTERRUPT_HANDLERS) if (symbol in blocks)
+        }
+        
+        if (self.inliner is not None):
+            self.inliner.inline(blocks, set(entries) | {main})
+        
+        aliases:dict[int, int] = {}
+        
+        if (self.folder is not None):
+            aliases = self.folder.fold_functions(blocks, [main, *entries])
+            
+            # whatever came in to a copy can come in to what's kept
+            for symbol, kept in aliases.items():
+                if (symbol in entries):
+                    incoming:SNESProcessStatusRegister = entries.pop(symbol)
+                    entries[kept] = incoming if (kept not in entries) else entries[kept].join(incoming)
+        
+        if ((main in blocks) and (entry is not None)):
+            entries[main] = entry if (main not in entries) else entries[main].join(entry)
+        
+        self.summaries.clear()
+        self.summaries.update(summarize(blocks, entries))
+        self.summaries.update((symbol, self.summaries[kept]) for symbol, kept in aliases.items())
+        
+        self.helper_start_segment("functions")
+        self.ram._cpu_registers._direct_page = direct_page
+        self.ram._cpu_registers._data_bank = data_bank
+        
+        # main goes first, the rest stay in the order they were written
+        order:list[int] = sorted(blocks, key=lambda symbol: symbol != main)
+        
+        for symbol in order:
+            self.ir.items.extend(blocks[symbol].items)
+        
+        if (self.flow is None):
+            self.helper_end_segment("functions")
+            return
+        
+        # every function's label is a way in
+        swp:tuple = (self.flow.entry, self.flow.entries)
+        self.flow.entry = self.summaries[order[0]].entry or SNESProcessStatusRegister()
+        self.flow.entries = {symbol: summary.entry for symbol, summary in self.summaries.items() if (summary.entry is not None)}
+        
+        try:
+            self.helper_end_segment("functions")
+        finally:
+            self.flow.entry, self.flow.entries = swp
+    
+    def helper_label(self, symbol:int) -> None:
+        """Pin a symbol to wherever the next instruction goes"""
+        if (symbol in self.labels):
+            raise ValueError(f"Label {self.symbols.name(symbol)} is already placed!")
+        
+        if (len(self.ir) == 0):
+            # nothing waiting, so it's known already
+            self.labels[symbol] = self.rom.current_address
+        else:
+            self.ir.label(symbol)
+    
+    def helper_flush(self) -> None:
+        """Assemble whatever code's waiting into the ROM"""
+        if (len(self.ir) == 0):
+            return
+        
+        if (self.flow is not None):
+            self.flow.optimize(self.ir)
+        
+        if (self.peephole is not None):
+            self.peephole.optimize(self.ir)
+        
+        # last, so nothing changes one copy and not the other
+        if (self.folder is not None):
+            self.folder.fold_tails(self.ir)
+        
+        # only ever known from the start of a segment, and forgotten as soon as
+        # anything changes them, so if they're known now they held all along
+        registers:SnesCPURegisters = self.ram._cpu_registers
+        assembled:AssembledBlock = Assembler(self.labels, registers._direct_page, registers._data_bank).assemble(self.ir, self.rom.current_address)
+        
+        for symbol in assembled.labels:
+            if (symbol in self.labels):
+                raise ValueError(f"Label {self.symbols.name(symbol)} is already placed!")
+        
+        self.labels.update(assembled.labels)
+        self.rom.inject_next(assembled.code)
+        self.ir = IRBlock()
     
     def helper_start_segment(self, name:str):
         """Start a new code segment"""
         self.ram.state_unknown()
     
     def helper_end_segment(self, name:str):
-        pass
+        self.helper_flush()
     
     def helper_reorder_bytes(self, val:int, size_in_bytes:int) -> list[int]:
         """
@@ -78,11 +326,11 @@ class SnesCompiler():
         
         The SNES is little-endian. This means that, for example, the values go
         LLHH for a 16 bit hex value. (So 0x00FF becomes 0xFF00.)
-
+        
         Args:
             val: the value you need to transform
             size_in_bytes: number of bytes you need back
-
+        
         Returns:
             list[int]: list of input bytes reordered accordingly
         """
@@ -105,161 +353,113 @@ class SnesCompiler():
         """
         Inject an operation that's only the operator
         """
-        self.rom.inject_next([op])
+        self.ir.data(bytes((op,)))
     
-    def asm_assemble_absolute(self, **kwargs):
-        # set ourselves up
-        mneumonic:str = kwargs.get("mneumonic", "NOP")
-        mneumonic = mneumonic.lower()
-        
-        mode:SnesAddressMode = kwargs.get("mode", SnesAddressMode.IMPLIED)
+    def asm(self, mnemonic:str, mode:SnesAddressMode = SnesAddressMode.IMPLIED, operand:int = 0, *, target:int|None = None, size:int|None = None) -> None:
+        """
+        Queue one instruction for the end of the ROM.
         
-        address:int = kwargs.get("address", 0x0000)
-        address_bytes:list[int] = self.helper_reorder_bytes(address, 2)
+        It's assembled, along with the rest of the segment, when the segment
+        ends - so it can aim at labels that aren't placed yet, and branches and
+        jumps come out as short as they can.
         
-        opcode:int = OPS_BY_MENUMONIC_THEN_MODE[mneumonic][mode]
+        Args:
+            mnemonic: the mnemonic, lowercase
+            mode: the addressing mode
+            operand: the operand, bank and all for long modes, or an offset
+                     from target
+            target: symbol of a label to aim at
+            size: operand bytes for immediates whose width follows M or X - if
+                  not given, whatever's known about P decides
+        """
+        opcode:Opcode = lookup(mnemonic, mode)
         
-        # put it all together
-        asm:list[int] = [opcode, address_bytes[0], address_bytes[1]]
+        if ((size is None) and opcode.width_flag):
+            size = opcode.operand_size(self.ram._cpu_registers._processor_status)
+            
+            if (size is None):
+                raise ValueError(f"Can't tell how wide {mnemonic} #{hex(operand)} is, the register width isn't known")
         
-        # inject
-        self.rom.inject_next(asm)
+        # D and DBR have to hold for the whole segment, see helper_flush
+        if (mnemonic in _SETS_DIRECT_PAGE):
+            self.ram._cpu_registers._direct_page = None
+        elif (mnemonic in _SETS_DATA_BANK):
+            self.ram._cpu_registers._data_bank = None
         
+        self.ir.emit(mnemonic, mode, operand, target=target, size=size)
+    
+    def asm_assemble_absolute(self, **kwargs):
+        self.asm(kwargs.get("mneumonic", "NOP").lower(), kwargs.get("mode", SnesAddressMode.ABSOLUTE), kwargs.get("address", 0x0000))
+    
     def asm_assemble_absolute_long(self, **kwargs):
-         # set ourselves up
-        mneumonic:str = kwargs.get("mneumonic", "NOP")
-        mneumonic = mneumonic.lower()
-        
-        mode:SnesAddressMode = kwargs.get("mode", SnesAddressMode.IMPLIED)
-        
-        address:int = kwargs.get("address", 0x0000)
-        address_bytes:list[int] = self.helper_reorder_bytes(address, 2)
-        
-        bank:int = kwargs.get("bank", 0x00)
-        
-        opcode:int = OPS_BY_MENUMONIC_THEN_MODE[mneumonic][mode]
-        
-        # put it all together
-        asm:list[int] = [opcode, address_bytes[0], address_bytes[1], bank]
-        
-        # inject
-        self.rom.inject_next(asm)
+        address:int = (kwargs.get("bank", 0x00) << 16) | kwargs.get("address", 0x0000)
+        self.asm(kwargs.get("mneumonic", "NOP").lower(), kwargs.get("mode", SnesAddressMode.ABSOLUTE_LONG), address)
     
     def asm_assemble_immediate(self, **kwargs):
-        status_reg = self.ram._cpu_registers._processor_status
-        
-        # figure out our addressing width
-        width:int = 1
-        
-        if (status_reg.emulation is not None):
-            if (status_reg.emulation == 0):
-                # native mode
-                if (status_reg.m is not None):
-                    if (status_reg.m == 1):
-                        # 16 bit addressing?
-                        width = 2
-
-                # x is zero?
-                if (self.ram._cpu_registers._x_index is not None):
-                    if (self.ram._cpu_registers._x_index == 0):
-                        # 16 bit addressing?
-                        width = 2
-        
-        # aight, swing it
-        mneumonic:str = kwargs.get("mneumonic", "NOP")
-        mneumonic = mneumonic.lower()
-        
-        mode:SnesAddressMode = kwargs.get("mode", SnesAddressMode.IMPLIED)
-        
-        # certain mneumonics are always 8 bit
-        if (mneumonic == "rep"):
-            width = 1
-        
-        address:int = kwargs.get("address", 0x0000)
-        address_bytes:list[int] = self.helper_reorder_bytes(address, width)
+        self.asm(kwargs.get("mneumonic", "NOP").lower(), SnesAddressMode.IMMEDIATE, kwargs.get("address", 0x0000), size=kwargs.get("width"))
+    
+    def asm_assemble_implied(self, **kwargs):
+        # TODO: Mode 1
+        # TODO: Mode 2
+        # TODO: Mode 3
+        self.asm(kwargs.get("mneumonic", "NOP").lower(), kwargs.get("mode", SnesAddressMode.IMPLIED))
+    
+    def asm_jsr(self, symbol:int) -> None:
+        """
+        Call a function.
         
-        opcode:int = OPS_BY_MENUMONIC_THEN_MODE[mneumonic][mode]
+        If it's been summarized, whatever it leaves alone is still known after
+        it returns, and whatever it always sets is known too - otherwise
+        nothing is.
+        """
+        self.asm("jsr", SnesAddressMode.ABSOLUTE, target=symbol)
         
-        # put it all together
-        asm:list[int] = [opcode]
+        registers:SnesCPURegisters = self.ram._cpu_registers
+        summary:FunctionSummary|None = self.summaries.get(symbol)
         
-        for i in range(len(address_bytes)):
-            asm.append(address_bytes [i])
+        if (summary is None):
+            registers.state_unknown()
+            return
         
-        # inject
-        self.rom.inject_next(asm)
+        summary.apply(registers._processor_status)
         
-    def asm_assemble_implied(self, **kwargs):
-        # TODO: Mode 1
-        # TODO: Mode 2
-        # TODO: Mode 3
-        mneumonic:str = kwargs.get("mneumonic", "NOP")
-        mneumonic = mneumonic.lower()
+        if (summary.clobbers & REG_A):
+            registers._accumulator = None
         
-        mode:SnesAddressMode = kwargs.get("mode", SnesAddressMode.IMPLIED)
-        opcode:int = OPS_BY_MENUMONIC_THEN_MODE[mneumonic][mode]
+        if (summary.clobbers & REG_X):
+            registers._x_index = None
         
-        self.rom.inject_next([opcode])
-
+        if (summary.clobbers & REG_Y):
+            registers._y_index = None
     
     def asm_clc(self) -> None:
         """
         Clear the carry flag
         """
-        self.asm_assemble_implied(mneumonic="clc")
+        self.asm("clc")
         self.ram._cpu_registers._processor_status.carry = 0
     
-    def asm_lda(self, val:int, *, bank:int|None = None, mode:SnesAddressMode=SnesAddressMode.IMMEDIATE, val_length_in_bytes:int|None = None,) -> None:
-        """
-        Load a value into the accumulator with mode
-        """
-        raise NotImplementedError()
-        if (mode == SnesAddressMode.ABSOLUTE_LONG):
+    def _asm_with_address(self, mnemonic:str, val:int, bank:int|None, mode:SnesAddressMode, val_length_in_bytes:int|None) -> None:
+        """Shared by the load and store helpers"""
+        if (mode == SnesAddressMode.IMMEDIATE):
+            self.asm(mnemonic, mode, val, size=val_length_in_bytes)
+        elif (mode in (SnesAddressMode.ABSOLUTE_LONG, SnesAddressMode.ABSOLUTE_LONG_INDEXED_BY_X)):
             # bank is required
             if (bank is None):
                 raise ValueError("Bank must be set!")
-            else:
-                # convert
-                val_bytes:list[int] = self.helper_reorder_bytes(val, 2)
-            
-                # assemble
-                _asm:list[int] = [0xAF, bank, val_bytes[0], val_bytes[1]]
-                
-                # inject
-                self.rom.inject_next(_asm)
-
-        elif (mode == SnesAddressMode.IMMEDIATE):
-            # we need to figure out if the val is 8 or 16 bit
-            val_bytes:list[int] = []
-            val_len:int = 1 # in bytes
-            
-            # could try pulling the val length, right?
-            if (val_length_in_bytes is not None):
-                val_len = val_length_in_bytes
-            else:
-                # let's guess
-                if (val < 0xFF):
-                    # 1 byte?
-                    val_len = 1
-                else:
-                    # 2 bytes?
-                    val_len = 2
             
-            # build val bytes
-            val_bytes:list[int] = self.helper_reorder_bytes(val, val_len)
-            
-            # assemble the op
-            # opcode A9 for immediate mode so
-            _asm:list[int] = [] * (len(val_bytes) + 1)
-            _asm[0] = 0xA9
-            for i in range(len(val_bytes)):
-                _asm[i+1] = val_bytes[i]
-            
-            # and now we can inject it
-            self.rom.inject_next(_asm)
-        
+            self.asm(mnemonic, mode, (bank << 16) | val)
         else:
-            raise NotImplementedError()
+            self.asm(mnemonic, mode, val)
+    
+    def asm_lda(self, val:int, *, bank:int|None = None, mode:SnesAddressMode=SnesAddressMode.IMMEDIATE, val_length_in_bytes:int|None = None,) -> None:
+        """
+        Load a value into the accumulator with mode
+        
+        Immediates are as wide as the accumulator is known to be, unless
+        val_length_in_bytes says otherwise.
+        """
+        self._asm_with_address("lda", val, bank, mode, val_length_in_bytes)
     
     def asm_rep(self, mask:int) -> None:
         """
@@ -269,79 +469,34 @@ class SnesCompiler():
         zero.
         """
         # assemble
-        self.asm_assemble_immediate(mneumonic="rep", address=mask)
+        self.asm("rep", SnesAddressMode.IMMEDIATE, mask)
         
         # use what we know about the CPU to set it up
-        status = self.ram._cpu_registers._processor_status
-        
-        # carry
-        if (mask & 0x01):
-            status.carry = 0
-        
-        # zero
-        if (mask & 0x02):
-            status.zero = 0
-        
-        # IRQ disable
-        if (mask & 0x04):
-            status.irq_disable = 0
-        
-        # decimal mode
-        if (mask & 0x08):
-            status.decimal_mode = 0
-        
-        # index register select
-        if (mask & 0x10):
-            status.index_register_select = 0
-        
-        # memory / accumulator select
-        if (mask & 0x20):
-            status.memory_accumulator_select = 0
-        
-        # overflow
-        if (mask & 0x40):
-            status.overflow = 0
-        
-        # negative
-        if (mask & 0x80):
-            status.negative = 0
+        self.ram._cpu_registers._processor_status.rep(mask)
     
-    def asm_sta(self, val:int, *, bank:int|None = None, mode:SnesAddressMode=SnesAddressMode.IMMEDIATE, val_length_in_bytes:int|None = None,) -> None:
+    def asm_sta(self, val:int, *, bank:int|None = None, mode:SnesAddressMode=SnesAddressMode.ABSOLUTE, val_length_in_bytes:int|None = None,) -> None:
         """Store accumulator"""
-        raise NotImplementedError
-        if (mode == SnesAddressMode.ABSOLUTE):
-            val_bytes:list[int] = self.helper_reorder_bytes(val, 2)
-            self.rom.inject_next([0x8D, val_bytes[0], val_bytes[1]])
-        if (mode == SnesAddressMode.ABSOLUTE_LONG):
-            # bank is required
-            if (bank is None):
-                raise ValueError("Bank must be set!")
-            else:
-                # convert
-                val_bytes:list[int] = self.helper_reorder_bytes(val, 2)
-            
-                # assemble
-                _asm:list[int] = [0xAF, bank, val_bytes[0], val_bytes[1]]
-                
-                # inject
-                self.rom.inject_next(_asm)
+        self._asm_with_address("sta", val, bank, mode, val_length_in_bytes)
+    
     def asm_tcd(self) -> None:
         """
         Transfer accumulator to direct page register
         """
-        self.asm_inject_no_args(0x5B)
+        self.asm("tcd")
     
     def asm_sec(self) -> None:
         """
         Set the carry flag
         """
-        self.asm_inject_no_args(0x38)
+        self.asm("sec")
+        self.ram._cpu_registers._processor_status.carry = 1
     
     def asm_sei(self) -> None:
         """
         Set interrupt
         """
-        self.asm_inject_no_args(0x78)
+        self.asm("sei")
+        self.ram._cpu_registers._processor_status.irq_disable = 1
     
     def asm_sep(self, nvmdizc:int) -> None:
         """
@@ -350,13 +505,31 @@ class SnesCompiler():
         # TODO: optimization - see if only one bit is set and use more efficient
         #       op if available.
         
-        self.rom.inject_next([0xE2, nvmdizc])
+        self.asm("sep", SnesAddressMode.IMMEDIATE, nvmdizc)
+        
+        self.ram._cpu_registers._processor_status.sep(nvmdizc)
     
     def asm_xce(self) -> None:
         """
         Exchanges values of carry and emulation bits.
         """
-        self.asm_inject_no_args(0xFB)
+        self.asm("xce")
+        
+        status:SNESProcessStatusRegister = self.ram._cpu_registers._processor_status
+        carry:int|None = status.carry
+        emulation:int|None = status.emulation
+        
+        status.forget(FLAG_CARRY | FLAG_EMULATION)
+        
+        if (carry is not None):
+            status.emulation = carry
+            
+            # emulation mode forces 8 bit registers
+            if (carry):
+                status.sep(FLAG_MEMORY_ACCUMULATOR_SELECT | FLAG_INDEX_REGISTER_SELECT)
+        
+        if (emulation is not None):
+            status.carry = emulation
     
     def macro_set_mode_emulated(self) -> None:
         """
@@ -375,6 +548,10 @@ class SnesCompiler():
     def builtin_init(self) -> None:
         self.helper_start_segment("SNES init")
         
+        # straight out of reset, both are 0
+        self.ram._cpu_registers._direct_page = 0x0000
+        self.ram._cpu_registers._data_bank = 0x00
+        
         # TODO: Set address
         self.asm_sei()
         self.macro_set_mode_native()
@@ -382,26 +559,27 @@ class SnesCompiler():
         self.asm_lda(0x0000, mode=SnesAddressMode.IMMEDIATE, val_length_in_bytes=2)
         self.asm_sep(0x20)
         self.asm_lda(0x80, mode=SnesAddressMode.IMMEDIATE, val_length_in_bytes=1)
-        self.asm_sta(0x2100, mode=SnesAddressMode.IMMEDIATE)
+        self.asm_sta(0x2100, mode=SnesAddressMode.ABSOLUTE)
         self.asm_lda(0x00, mode=SnesAddressMode.IMMEDIATE, val_length_in_bytes=1)
-        self.asm_sta(0x4200, mode=SnesAddressMode.IMMEDIATE)
-        self.asm_lda(0x0200, bank=0x7E, mode=SnesAddressMode.ABSOLUTE_LONG)
+        self.asm_sta(0x4200, mode=SnesAddressMode.ABSOLUTE)
         
-        # TODO: BEQ
-        self.rom.inject_next([0xF0, 0xFB])
+        # wait for $7E0200 to go non-zero
+        wait:int = self.symbols.intern("__snes_init_wait")
+        self.helper_label(wait)
+        self.asm_lda(0x0200, bank=0x7E, mode=SnesAddressMode.ABSOLUTE_LONG)
+        self.asm("beq", SnesAddressMode.RELATIVE, target=wait)
         
         self.asm_lda(0x00, mode=SnesAddressMode.IMMEDIATE, val_length_in_bytes=1)
         
-        # TODO: STA 24 bit
-        self.rom.inject_next([0x8F, 0x00, 0x02, 0x7E])
-        
-        # TODO: JML 24 bit
-        self.rom.inject_next([0x5C, 0x00, 0x80, 0x01])
+        self.asm_sta(0x0200, bank=0x7E, mode=SnesAddressMode.ABSOLUTE_LONG)
+        self.asm("jml", SnesAddressMode.ABSOLUTE_LONG, 0x018000)
         
         self.helper_end_segment("SNES init")
         
     def compile(self):
         self.rom = SnesROM()
+        self.labels = {}
+        self.helper_index_functions()
         
         # set the reset vector?
         self.rom.inject_direct(0x7FFC, [0x00, 0x80])
@@ -410,5 +588,10 @@ class SnesCompiler():
         self.rom.current_address = 0x8000
         self.builtin_init()
         
+        # init jumps to $018000 with what it set up still set
+        self.rom.current_address = 0x018000
+        registers:SnesCPURegisters = self.ram._cpu_registers
+        self.helper_compile_functions(registers._processor_status.fork(), registers._direct_page, registers._data_bank)
+        
         # try outputting rom
         self.rom.write("grey.smc")
\ No newline at end of file
@@ -0,0 +1,452 @@
+"""
+Dataflow over an IRBlock's control flow.
+
+The block is cut into basic blocks at labels and after anything that branches,
+and what's known about E, M, X (and carry, since XCE swaps it into E) is pushed
+through them to a fixpoint, joining wherever paths meet. With that known at
+every instruction, REP and SEP that don't change anything can go, and the
+switches immediates actually need can be put in where the width isn't already
+right.
+"""
+from typing import (
+    Hashable,
+)
+
+from .assembler import (
+    BRANCH_INVERSES,
+    JUMPS,
+    IRBlock,
+    IRData,
+    IRInstruction,
+    IRItem,
+    IRLabel,
+)
+
+from .opcodes import (
+    Opcode,
+    SnesAddressMode,
+    lookup,
+)
+
+from .peephole import effects
+
+from .ram import (
+    FLAG_CARRY,
+    FLAG_EMULATION,
+    FLAG_INDEX_REGISTER_SELECT,
+    FLAG_MEMORY_ACCUMULATOR_SELECT,
+    SNESProcessStatusRegister,
+)
+
+_WIDTHS:int = FLAG_MEMORY_ACCUMULATOR_SELECT | FLAG_INDEX_REGISTER_SELECT
+
+TRACKED:int = FLAG_CARRY | _WIDTHS | FLAG_EMULATION
+"""The flags the analysis keeps track of"""
+
+RETURNS:frozenset[str] = frozenset(("rti", "rtl", "rts", "stp"))
+"""Instructions nothing falls through"""
+
+CALLS:frozenset[str] = frozenset(("jsl", "jsr"))
+
+_SWITCH_BYTES:int = 2
+_SWITCH_CYCLES:int = 3
+
+class BasicBlock():
+    """A straight run of items - in at the top, out at the bottom"""
+    __slots__ = (
+        "start",
+        "end",
+        "successors",
+        "predecessors",
+        "entry",
+    )
+    
+    def __init__(self, start:int, end:int):
+        self.start:int = start
+        self.end:int = end
+        """Items [start, end) of the IRBlock"""
+        
+        self.successors:list[int] = []
+        self.predecessors:list[int] = []
+        """Indexes of other basic blocks"""
+        
+        self.entry:bool = False
+        """Whether it can be reached from outside the IRBlock"""
+    
+    def __repr__(self):
+        return f"BasicBlock({self.start}, {self.end}, -> {self.successors})"
+
+def is_jump(instruction:IRInstruction) -> bool:
+    """Whether it's a branch or a jump - somewhere else in the code, not a call"""
+    return (instruction.mnemonic in JUMPS) or (instruction.mnemonic in BRANCH_INVERSES)
+
+def jump_targets(items:list[IRItem]) -> set[Hashable]:
+    """Every label something in the block branches or jumps to"""
+    return {
+        item.target for item in items
+        if (isinstance(item, IRInstruction) and (item.target is not None) and is_jump(item))
+    }
+
+def basic_blocks(items:list[IRItem], entries:set[Hashable]|frozenset[Hashable] = frozenset()) -> list[BasicBlock]:
+    """
+    Cut a block's items into basic blocks, and link them up.
+    
+    The first basic block is always an entry. So is any label in entries, and
+    any label nothing in the block branches or jumps to - something outside
+    must be going there, or it wouldn't be there. Labels that are only
+    branched to from inside are taken as only reachable from inside.
+    
+    Args:
+        items: the IRBlock's items
+        entries: labels that can be reached from outside the block
+    
+    Returns:
+        list[BasicBlock]: in the order they're in the block
+    """
+    targets:set[Hashable] = jump_targets(items)
+    starts:set[int] = {0}
+    
+    for i, item in enumerate(items):
+        if (isinstance(item, IRLabel)):
+            # labels in a row all start the same block
+            if ((i == 0) or (not isinstance(items[i - 1], IRLabel))):
+                starts.add(i)
+        elif (isinstance(item, IRInstruction) and (is_jump(item) or (item.mnemonic in RETURNS))):
+            starts.add(i + 1)
+    
+    swp:list[int] = sorted(start for start in starts if (start < len(items))) or [0]
+    ret:list[BasicBlock] = [BasicBlock(start, end) for start, end in zip(swp, swp[1:] + [len(items)])]
+    at_label:dict[Hashable, int] = {}
+    
+    for index, block in enumerate(ret):
+        for item in items[block.start:block.end]:
+            if (not isinstance(item, IRLabel)):
+                break
+            
+            at_label[item.key] = index
+            
+            if ((item.key in entries) or (item.key not in targets)):
+                block.entry = True
+    
+    ret[0].entry = True
+    
+    for index, block in enumerate(ret):
+        last:IRItem|None = items[block.end - 1] if (block.end > block.start) else None
+        falls_through:bool = True
+        
+        if (isinstance(last, IRInstruction)):
+            if (is_jump(last) and (last.target in at_label)):
+                block.successors.append(at_label[last.target])
+            
+            if ((last.mnemonic in JUMPS) or (last.mnemonic in RETURNS)):
+                falls_through = False
+        
+        if (falls_through and ((index + 1) < len(ret))):
+            block.successors.append(index + 1)
+        
+        for successor in block.successors:
+            ret[successor].predecessors.append(index)
+    
+    return ret
+
+class FlowStats():
+    """What a WidthFlow has done to the code"""
+    def __init__(self):
+        self.removed:int = 0
+        """REP and SEP dropped"""
+        
+        self.inserted:int = 0
+        """REP and SEP put in ahead of immediates"""
+        
+        self.trimmed:int = 0
+        """REP and SEP kept, with bits they didn't need taken out"""
+    
+    @property
+    def bytes_saved(self) -> int:
+        return (self.removed - self.inserted) * _SWITCH_BYTES
+    
+    @property
+    def cycles_saved(self) -> int:
+        """Base cycles, going straight through once"""
+        return (self.removed - self.inserted) * _SWITCH_CYCLES
+    
+    def __repr__(self):
+        return f"FlowStats({self.removed} removed, {self.inserted} inserted, {self.trimmed} trimmed)"
+
+class WidthFlow():
+    """
+    Tracks E, M and X through a block, and fixes up the width switches.
+    
+    Immediates already say how wide they are, so each one is taken as needing
+    that width. Where it isn't already known to be that, a REP or SEP goes in
+    ahead of it - and any REP or SEP that only sets what's known already comes
+    out.
+    """
+    def __init__(self, entry:SNESProcessStatusRegister|None = None, entries:dict[Hashable, SNESProcessStatusRegister]|None = None):
+        self.entry:SNESProcessStatusRegister = SNESProcessStatusRegister() if (entry is None) else entry
+        """What's known coming into the top of the block"""
+        
+        self.entries:dict[Hashable, SNESProcessStatusRegister] = {} if (entries is None) else entries
+        """
+        dict[label, what's known coming in] for labels reached from outside,
+        anything else reached from outside comes in knowing nothing
+        """
+        
+        self.stats:FlowStats = FlowStats()
+        """Over every block so far"""
+    
+    def call(self, instruction:IRInstruction, state:SNESProcessStatusRegister) -> bool:
+        """
+        What a call does to the state - could be anything, as far as this knows.
+        
+        Returns:
+            bool: False if it never comes back
+        """
+        state.forget(TRACKED)
+        
+        return True
+    
+    def _switch(self, state:SNESProcessStatusRegister, mnemonic:str, mask:int) -> None:
+        """REP or SEP - in emulation mode M and X stay set, whatever it says"""
+        emulation:int|None = state.emulation
+        widths:int = mask & _WIDTHS
+        
+        if (mnemonic == "sep"):
+            state.sep(mask)
+            return
+        
+        state.rep(mask & ~_WIDTHS)
+        
+        if (emulation == 0):
+            state.rep(widths)
+        elif (emulation is None):
+            # cleared, unless it's in emulation mode
+            state.forget(widths)
+    
+    def _xce(self, state:SNESProcessStatusRegister) -> None:
+        carry:int|None = state.carry
+        emulation:int|None = state.emulation
+        state.forget(FLAG_CARRY | FLAG_EMULATION)
+        
+        if (carry is not None):
+            state.emulation = carry
+        
+        if (emulation is not None):
+            state.carry = emulation
+        
+        if (carry != 0):
+            # going into emulation mode sets M and X, maybe going in forgets them
+            if (carry == 1):
+                state.sep(_WIDTHS)
+            else:
+                state.forget(_WIDTHS & ~(state.known & state.value))
+    
+    def width_needed(self, instruction:IRInstruction) -> tuple[int, int]|None:
+        """(flag, value it needs) for immediates whose width follows M or X"""
+        if (instruction.mode != SnesAddressMode.IMMEDIATE):
+            return None
+        
+        opcode:Opcode = lookup(instruction.mnemonic, instruction.mode)
+        
+        if (not opcode.width_flag):
+            return None
+        
+        return (opcode.width_flag, 1 if (instruction.size == 1) else 0)
+    
+    def step(self, item:IRItem, state:SNESProcessStatusRegister) -> bool:
+        """
+        Move a state past one item.
+        
+        Immediates leave their width behind them, whether it was there already
+        or a switch has to go in to get it.
+        
+        Returns:
+            bool: False if nothing ever comes out the other side
+        """
+        if (isinstance(item, IRLabel)):
+            return True
+        
+        if (isinstance(item, IRData)):
+            state.forget(TRACKED)
+            return True
+        
+        mnemonic:str = item.mnemonic
+        
+        if ((mnemonic == "rep") or (mnemonic == "sep")):
+            self._switch(state, mnemonic, item.operand)
+            return True
+        
+        if ((mnemonic == "clc") or (mnemonic == "sec")):
+            state.carry = 1 if (mnemonic == "sec") else 0
+            return True
+        
+        if (mnemonic == "xce"):
+            self._xce(state)
+            return True
+        
+        if (mnemonic in CALLS):
+            return self.call(item, state)
+        
+        needs:tuple[int, int]|None = self.width_needed(item)
+        
+        if (needs is not None):
+            flag, value = needs
+            self._switch(state, "sep" if value else "rep", flag)
+        
+        swp:tuple[int, int]|None = effects(item)
+        
+        if (swp is None):
+            if (not (is_jump(item) or (mnemonic in RETURNS))):
+                state.forget(TRACKED)
+            
+            return True
+        
+        # only XCE touches E - bit 8 is A, in effects' masks
+        writes:int = swp[1] & TRACKED & ~FLAG_EMULATION
+        
+        if (writes):
+            emulation:int|None = state.emulation
+            state.forget(writes)
+            
+            if (emulation == 1):
+                state.sep(_WIDTHS)
+        
+        return True
+    
+    def analyze(self, block:IRBlock) -> tuple[list[BasicBlock], list[SNESProcessStatusRegister|None]]:
+        """
+        What's known at the top of every basic block.
+        
+        Args:
+            block: the code
+        
+        Returns:
+            tuple: (the basic blocks, what's known coming into each - None for
+                   ones nothing reaches)
+        """
+        items:list[IRItem] = block.items
+        
+        if (len(items) == 0):
+            return ([], [])
+        
+        entries:dict[Hashable, SNESProcessStatusRegister] = self.entries
+        blocks:list[BasicBlock] = basic_blocks(items, entries.keys())
+        targets:set[Hashable] = jump_targets(items)
+        states:list[SNESProcessStatusRegister|None] = [None] * len(blocks)
+        
+        for index, basic in enumerate(blocks):
+            if (not basic.entry):
+                continue
+            
+            # labels at the very top are where the block starts anyway
+            seed:SNESProcessStatusRegister|None = self.entry.fork() if (index == 0) else None
+            
+            for item in items[basic.start:basic.end]:
+                if (not isinstance(item, IRLabel)):
+                    break
+                
+                if (item.key in entries):
+                    incoming:SNESProcessStatusRegister = entries[item.key]
+                elif ((index != 0) and (item.key not in targets)):
+                    incoming = SNESProcessStatusRegister()
+                else:
+                    continue
+                
+                seed = incoming.fork() if (seed is None) else seed.join(incoming)
+            
+            states[index] = seed
+        
+        work:list[int] = [index for index, state in enumerate(states) if (state is not None)]
+        
+        while (work):
+            index:int = work.pop()
+            basic:BasicBlock = blocks[index]
+            state:SNESProcessStatusRegister = states[index].fork()
+            
+            if (not all(self.step(item, state) for item in items[basic.start:basic.end])):
+                continue
+            
+            for successor in basic.successors:
+                old:SNESProcessStatusRegister|None = states[successor]
+                new:SNESProcessStatusRegister = state.fork() if (old is None) else old.join(state)
+                
+                if ((old is None) or (new != old)):
+                    states[successor] = new
+                    work.append(successor)
+        
+        return (blocks, states)
+    
+    def optimize(self, block:IRBlock) -> int:
+        """
+        Drop the width switches that aren't needed and add the ones that are.
+        
+        Only the tracked bits are taken out of a REP or SEP - it still goes
+        in if it touches anything else.
+        
+        Args:
+            block: the code, rewritten in place
+        
+        Returns:
+            int: how many switches were removed, trimmed or inserted
+        """
+        blocks, states = self.analyze(block)
+        items:list[IRItem] = block.items
+        out:list[IRItem] = []
+        ret:int = 0
+        
+        for basic, state in zip(blocks, states):
+            if (state is None):
+                # nothing gets here, leave it be
+                out.extend(items[basic.start:basic.end])
+                continue
+            
+            for i in range(basic.start, basic.end):
+                item:IRItem = items[i]
+                
+                if (isinstance(item, IRInstruction) and ((item.mnemonic == "rep") or (item.mnemonic == "sep"))):
+                    needed:int = self._needed(state, item.mnemonic, item.operand & 0xFF)
+                    
+                    if (needed != (item.operand & 0xFF)):
+                        ret += 1
+                        
+                        if (needed == 0):
+                            self.stats.removed += 1
+                            continue
+                        
+                        self.stats.trimmed += 1
+                        item.operand = needed
+                
+                elif (isinstance(item, IRInstruction)):
+                    needs:tuple[int, int]|None = self.width_needed(item)
+                    
+                    if (needs is not None):
+                        flag, value = needs
+                        
+                        if ((value == 0) and (state.emulation != 0)):
+                            raise ValueError(f"{item.mnemonic} #{hex(item.operand)} is 16 bit, but it might be in emulation mode")
+                        
+                        if (not ((state.known & flag) and (bool(state.value & flag) == bool(value)))):
+                            out.append(IRInstruction("sep" if value else "rep", SnesAddressMode.IMMEDIATE, flag))
+                            self.stats.inserted += 1
+                            ret += 1
+                
+                out.append(item)
+                
+                if (not self.step(item, state)):
+                    # nothing after a call that never comes back runs
+                    out.extend(items[i + 1:basic.end])
+                    break
+        
+        block.items[:] = out
+        
+        return ret
+    
+    def _needed(self, state:SNESProcessStatusRegister, mnemonic:str, mask:int) -> int:
+        """The bits of a REP or SEP that actually change something that's tracked"""
+        established:int = state.known & (state.value if (mnemonic == "sep") else ~state.value) & TRACKED
+        
+        if ((mnemonic == "rep") and (state.emulation == 1)):
+            # can't clear them in emulation mode anyway
+            established |= _WIDTHS
+        
+        return mask & ~established
@@ -0,0 +1,255 @@
+"""
+Folding identical code together, so the ROM only holds it once.
+
+Two ways: functions whose bodies are the same, calls and all, become one
+function with both labels on it, and code that ends the same way - the same
+instructions, up to the same jump or return - is kept once, with the others
+jumping into it where it starts matching.
+"""
+from typing import (
+    Hashable,
+)
+
+from .assembler import (
+    JUMPS,
+    IRBlock,
+    IRData,
+    IRInstruction,
+    IRItem,
+    IRLabel,
+)
+
+from .flow import RETURNS
+from .inliner import body_size
+from .opcodes import SnesAddressMode
+
+_JUMP_BYTES:int = 3
+"""What jumping into a shared tail costs, at worst - a BRL, which stays a BRA or JMP"""
+
+class FoldStats():
+    """What a Folder has done"""
+    def __init__(self):
+        self.functions:int = 0
+        """Functions that turned out to be copies of another"""
+        
+        self.tails:int = 0
+        """Endings swapped for a jump to the same ending somewhere else"""
+        
+        self.bytes_saved:int = 0
+        """ROM reclaimed, going by the biggest each jump might be"""
+    
+    def __repr__(self):
+        return f"FoldStats({self.functions} functions, {self.tails} tails, {self.bytes_saved} bytes)"
+
+def _instruction_key(item:IRInstruction, target:Hashable|None) -> tuple:
+    return (item.mnemonic, item.mode, item.operand, target, item.size, item.relax)
+
+def function_key(symbol:Hashable, block:IRBlock, aliases:set[Hashable]|frozenset[Hashable] = frozenset()) -> tuple:
+    """
+    Something hashable that's the same for functions that do the same.
+    
+    Labels inside are numbered in the order they come, and going back to the
+    function's own label is marked as that, so neither depends on the names.
+    
+    Args:
+        symbol: the function's label
+        block: its code, starting at that label
+        aliases: labels of functions already folded into it, which are the
+                 same as its own
+    
+    Returns:
+        tuple: the key
+    """
+    local:dict[Hashable, int] = {symbol: 0}
+    
+    for item in block.items[1:]:
+        if (isinstance(item, IRLabel)):
+            local[item.key] = 0 if (item.key in aliases) else len(local)
+    
+    ret:list[tuple] = []
+    
+    for item in block.items[1:]:
+        if (isinstance(item, IRLabel)):
+            if (item.key not in aliases):
+                ret.append(("label", local[item.key]))
+        elif (isinstance(item, IRData)):
+            ret.append(("data", item.data))
+        else:
+            target:Hashable|None = ("local", local[item.target]) if (item.target in local) else item.target
+            ret.append(_instruction_key(item, target))
+    
+    return tuple(ret)
+
+def _retarget(blocks:dict[Hashable, IRBlock], old:Hashable, new:Hashable) -> None:
+    """Point everything that went to one label at another"""
+    for block in blocks.values():
+        for i, item in enumerate(block.items):
+            if (isinstance(item, IRInstruction) and (item.target == old)):
+                block.items[i] = IRInstruction(item.mnemonic, item.mode, item.operand, new, item.size, item.relax)
+
+class Folder():
+    """
+    Finds code that's in the ROM more than once, and keeps one copy.
+    
+    Functions are folded before anything's summarized, so calls are pointed
+    at the copy that's kept, and what's known coming in is joined from both.
+    Tails are folded last thing before assembling, once nothing else is going
+    to change the code - the same bytes do the same thing wherever they are.
+    """
+    def __init__(self, min_tail:int = 4):
+        self.min_tail:int = min_tail
+        """Fewest bytes worth jumping to, always more than the jump"""
+        
+        self.stats:FoldStats = FoldStats()
+        
+        self._tails:int = 0
+        """Tails shared so far, to keep their labels apart"""
+    
+    def fold_functions(self, blocks:dict[Hashable, IRBlock], keep:list[Hashable]|tuple[Hashable, ...] = ()) -> dict[Hashable, Hashable]:
+        """
+        Fold functions that are copies of each other.
+        
+        The copy's label goes in after the kept one's, and everything that
+        called it calls the kept one. Folding can make callers copies of each
+        other too, so it goes round until there's nothing left.
+        
+        Args:
+            blocks: dict[function label, its code] - changed in place
+            keep: labels to keep over others if they're copies, best first,
+                  like main
+        
+        Returns:
+            dict[Hashable, Hashable]: dict[folded label, label of the one kept]
+        """
+        ret:dict[Hashable, Hashable] = {}
+        rank:dict[Hashable, int] = {symbol: i for i, symbol in enumerate(keep)}
+        changed:bool = True
+        
+        while (changed):
+            changed = False
+            groups:dict[tuple, list[Hashable]] = {}
+            
+            for symbol, block in blocks.items():
+                groups.setdefault(function_key(symbol, block, ret.keys()), []).append(symbol)
+            
+            for group in groups.values():
+                if (len(group) < 2):
+                    continue
+                
+                group.sort(key=lambda symbol: rank.get(symbol, len(rank)))
+                kept:Hashable = group[0]
+                
+                for symbol in group[1:]:
+                    self.stats.functions += 1
+                    self.stats.bytes_saved += body_size(blocks[symbol].items)
+                    
+                    del blocks[symbol]
+                    _retarget(blocks, symbol, kept)
+                    blocks[kept].items.insert(1, IRLabel(symbol))
+                    
+                    # anything already folded into it goes along too
+                    for folded, target in ret.items():
+                        if (target == symbol):
+                            ret[folded] = kept
+                    
+                    ret[symbol] = kept
+                
+                changed = True
+        
+        return ret
+    
+    def _tail(self, items:list[IRItem], end:int) -> int:
+        """Where the straight run of instructions ending at end starts"""
+        start:int = end
+        
+        while ((start > 0) and isinstance(items[start - 1], IRInstruction) and not self._ends(items[start - 1])):
+            start -= 1
+        
+        return start
+    
+    def _ends(self, item:IRItem) -> bool:
+        """Whether nothing runs straight on past an item"""
+        return isinstance(item, IRInstruction) and ((item.mnemonic in JUMPS) or (item.mnemonic in RETURNS))
+    
+    def fold_tails(self, block:IRBlock) -> None:
+        """
+        Share matching endings within a block.
+        
+        Every jump or return ends a run of instructions. Where two runs end the
+        same way for at least min_tail bytes, the later one jumps into the
+        earlier one instead, starting from where they match. A run that's been
+        cut short isn't anything to share any more, so nothing jumps into it.
+        
+        Args:
+            block: the code, changed in place
+        """
+        items:list[IRItem] = block.items
+        ends:list[int] = [i for i, item in enumerate(items) if self._ends(item)]
+        
+        # the same last instruction is a must, so only those get compared
+        groups:dict[tuple, list[int]] = {}
+        
+        for end in ends:
+            groups.setdefault(_instruction_key(items[end], items[end].target), []).append(end)
+        
+        # dict[donor's end, (its tail's start, keeper's end, how many instructions)]
+        folds:dict[int, tuple[int, int, int]] = {}
+        
+        for group in groups.values():
+            for j, end in enumerate(group):
+                best:tuple[int, int, int]|None = None
+                best_size:int = 0
+                
+                for other in group[:j]:
+                    if (other in folds):
+                        continue
+                    
+                    limit:int = min(end - self._tail(items, end), other - self._tail(items, other)) + 1
+                    count:int = 0
+                    
+                    while ((count < limit) and (_instruction_key(items[other - count], items[other - count].target) == _instruction_key(items[end - count], items[end - count].target))):
+                        count += 1
+                    
+                    size:int = body_size(items[end - count + 1:end + 1])
+                    
+                    if (size > best_size):
+                        best = (end - count + 1, other, count)
+                        best_size = size
+                
+                if ((best is not None) and (best_size >= max(self.min_tail, _JUMP_BYTES + 1))):
+                    folds[end] = best
+                    self.stats.tails += 1
+                    self.stats.bytes_saved += best_size - _JUMP_BYTES
+        
+        if (len(folds) == 0):
+            return
+        
+        # dict[index in items, labels to go in ahead of it]
+        labels:dict[int, list[Hashable]] = {}
+        jumps:dict[int, tuple[int, Hashable]] = {}
+        
+        for end, (start, other, count) in folds.items():
+            self._tails += 1
+            key:Hashable = ("fold", self._tails)
+            labels.setdefault(other - count + 1, []).append(key)
+            jumps[start] = (end, key)
+        
+        ret:list[IRItem] = []
+        i:int = 0
+        
+        while (i < len(items)):
+            for key in labels.get(i, ()):
+                ret.append(IRLabel(key))
+            
+            if (i in jumps):
+                end, key = jumps[i]
+                
+                # the tail's return goes back to the bank it's in, so this can't leave it
+                ret.append(IRInstruction("brl", SnesAddressMode.RELATIVE_LONG, 0, key))
+                i = end + 1
+                continue
+            
+            ret.append(items[i])
+            i += 1
+        
+        block.items = ret
@@ -0,0 +1,325 @@
+"""
+Inlining and tail calls, over a set of functions' IR.
+
+A JSR and its RTS cost 12 cycles between them before the callee's done
+anything, and JSL and RTL 14. Pasting the callee's body in place of the call
+saves all of that, at the price of however many bytes the body is over the
+call's. The Inliner pastes in whatever's small enough, as long as the ROM
+doesn't grow by more than its budget, and turns calls straight before a return
+into jumps.
+"""
+from typing import (
+    Hashable,
+)
+
+from .assembler import (
+    IRBlock,
+    IRData,
+    IRInstruction,
+    IRItem,
+    IRLabel,
+)
+
+from .flow import is_jump
+from .opcodes import SnesAddressMode
+from .peephole import cost
+
+_CALLS:dict[tuple[str, SnesAddressMode], tuple[str, int, int, str, SnesAddressMode]] = {
+    ("jsr", SnesAddressMode.ABSOLUTE): ("rts", 3, 12, "brl", SnesAddressMode.RELATIVE_LONG),
+    ("jsl", SnesAddressMode.ABSOLUTE_LONG): ("rtl", 4, 14, "jml", SnesAddressMode.ABSOLUTE_LONG),
+}
+"""
+dict[(call, mode), (its return, bytes, cycles with the return, the jump for a
+tail call and its mode)] - the RTS at the end of a JSR's callee only comes back
+to the bank it's in, so that jump's a BRL, which won't leave it
+"""
+
+_PUSHES:frozenset[str] = frozenset(("pea", "pei", "per", "pha", "phb", "phd", "phk", "php", "phx", "phy"))
+_PULLS:frozenset[str] = frozenset(("pla", "plb", "pld", "plp", "plx", "ply"))
+
+_STACK_POINTER:frozenset[str] = frozenset(("tcs", "tsc", "tsx", "txs"))
+"""Instructions that see or move S itself"""
+
+_STACK_MODES:tuple[SnesAddressMode, ...] = (
+    SnesAddressMode.STACK_RELATIVE,
+    SnesAddressMode.STACK_RELATIVE_INDIRECT_INDEXED_BY_Y,
+)
+
+_TAIL_CYCLES:dict[str, int] = {
+    "rts": 12 - 3,
+    "rtl": 14 - 4,
+}
+"""dict[return, cycles saved jumping instead] - the BRA or JMP a BRL turns into takes 3 cycles, JML 4"""
+
+class InlineStats():
+    """What an Inliner has done"""
+    def __init__(self):
+        self.inlined:int = 0
+        """Call sites replaced with the callee's body"""
+        
+        self.removed:int = 0
+        """Functions nothing calls any more, so they've gone"""
+        
+        self.tail_calls:int = 0
+        """Calls and returns turned into jumps"""
+        
+        self.bytes_saved:int = 0
+        """Can go negative - inlining trades bytes for cycles"""
+        
+        self.cycles_saved:int = 0
+        """Per time through each call site, added up"""
+    
+    def __repr__(self):
+        return f"InlineStats({self.inlined} inlined, {self.removed} removed, {self.tail_calls} tail calls, {self.bytes_saved} bytes, {self.cycles_saved} cycles)"
+
+def _call(item:IRItem) -> tuple[str, int, int, str, SnesAddressMode]|None:
+    """What's known about a call straight to a label, None if it isn't one"""
+    if ((not isinstance(item, IRInstruction)) or (item.target is None)):
+        return None
+    
+    return _CALLS.get((item.mnemonic, item.mode))
+
+def body_size(items:list[IRItem]) -> int:
+    """Bytes some items take, with everything at its smallest"""
+    ret:int = 0
+    
+    for item in items:
+        if (isinstance(item, IRData)):
+            ret += len(item.data)
+        elif (isinstance(item, IRInstruction)):
+            ret += cost(item)[0]
+    
+    return ret
+
+def _recursive(graph:dict[Hashable, set[Hashable]]) -> set[Hashable]:
+    """Every function that can end up calling itself"""
+    ret:set[Hashable] = set()
+    
+    for symbol in graph:
+        seen:set[Hashable] = set()
+        work:list[Hashable] = list(graph[symbol])
+        
+        while (work):
+            swp:Hashable = work.pop()
+            
+            if (swp == symbol):
+                ret.add(symbol)
+                break
+            
+            if ((swp in seen) or (swp not in graph)):
+                continue
+            
+            seen.add(swp)
+            work.extend(graph[swp])
+    
+    return ret
+
+class Inliner():
+    """
+    Decides which calls to inline, and does it.
+    
+    Functions are taken callees first, so what's pasted in has had its own
+    calls inlined already. A function's inlined at every call site or none,
+    and only if it isn't recursive, has a single RTS or RTL at the end and no
+    raw data, leaves the stack as it found it without looking at its return
+    address, is no bigger than max_size, and the ROM grows no more than
+    what's left of the budget. Anything that shrinks the ROM always goes.
+    """
+    def __init__(self, budget:int = 64, max_size:int = 16):
+        self.budget:int = budget
+        """How many bytes, all told, the ROM's allowed to grow by"""
+        
+        self.max_size:int = max_size
+        """Biggest body, in bytes, that's ever pasted in"""
+        
+        self.stats:InlineStats = InlineStats()
+        
+        self._pasted:int = 0
+        """Pastes so far, to keep each copy's labels apart"""
+    
+    def _body(self, block:IRBlock) -> list[IRItem]|None:
+        """What gets pasted in - everything between the label and the return, None if it can't be"""
+        items:list[IRItem] = block.items
+        
+        if ((len(items) < 2) or (not isinstance(items[0], IRLabel)) or (not isinstance(items[-1], IRInstruction))):
+            return None
+        
+        if (items[-1].mnemonic not in ("rts", "rtl")):
+            return None
+        
+        body:list[IRItem] = items[1:-1]
+        pushed:int = 0
+        
+        for item in body:
+            if (isinstance(item, IRData)):
+                return None
+            
+            # anything that sees the return address on the stack would see
+            # the caller's stack instead
+            if (isinstance(item, IRInstruction) and ((item.mnemonic in _STACK_POINTER) or (item.mode in _STACK_MODES))):
+                return None
+            
+            # pulls have to be of what it pushed itself, in the order written
+            if (isinstance(item, IRInstruction) and (item.mnemonic in _PUSHES)):
+                pushed += 1
+            elif (isinstance(item, IRInstruction) and (item.mnemonic in _PULLS)):
+                if (pushed == 0):
+                    return None
+                
+                pushed -= 1
+            
+            # returns from the middle would need jumps to the end
+            if (isinstance(item, IRInstruction) and (item.mnemonic in ("rti", "rtl", "rts"))):
+                return None
+            
+            # and other things jumping to the function itself mean it's a loop
+            if (isinstance(item, IRInstruction) and is_jump(item) and (item.target == items[0].key)):
+                return None
+        
+        if (pushed != 0):
+            return None
+        
+        return body
+    
+    def _paste(self, body:list[IRItem]) -> list[IRItem]:
+        """A copy of a body, with its labels made its own"""
+        self._pasted += 1
+        local:set[Hashable] = {item.key for item in body if isinstance(item, IRLabel)}
+        ret:list[IRItem] = []
+        
+        for item in body:
+            if (isinstance(item, IRLabel)):
+                ret.append(IRLabel(("inline", self._pasted, item.key)))
+            else:
+                target:Hashable|None = ("inline", self._pasted, item.target) if (item.target in local) else item.target
+                ret.append(IRInstruction(item.mnemonic, item.mode, item.operand, target, item.size, item.relax))
+        
+        return ret
+    
+    def inline(self, blocks:dict[Hashable, IRBlock], roots:set[Hashable]|frozenset[Hashable] = frozenset()) -> dict[Hashable, IRBlock]:
+        """
+        Inline and tail call what's worth it.
+        
+        Args:
+            blocks: dict[function label, its code], each its label, then its
+                    body, then RTS or RTL - changed in place
+            roots: functions called from outside, which stay even when
+                   nothing in here calls them
+        
+        Returns:
+            dict[Hashable, IRBlock]: blocks, without the functions that were
+                                     inlined everywhere, aren't roots, and
+                                     nothing else points at
+        """
+        graph:dict[Hashable, set[Hashable]] = {
+            symbol: {item.target for item in block if (_call(item) is not None)}
+            for symbol, block in blocks.items()
+        }
+        recursive:set[Hashable] = _recursive(graph)
+        budget:int = self.budget
+        
+        for callee in self._callees_first(graph):
+            if ((callee in recursive) or (callee not in blocks)):
+                continue
+            
+            body:list[IRItem]|None = self._body(blocks[callee])
+            
+            if (body is None):
+                continue
+            
+            size:int = body_size(body)
+            
+            if (size > self.max_size):
+                continue
+            
+            sites:list[tuple[Hashable, int]] = [
+                (caller, i)
+                for caller, block in blocks.items() if (caller != callee)
+                for i, item in enumerate(block.items) if ((_call(item) is not None) and (item.target == callee))
+            ]
+            
+            if (len(sites) == 0):
+                continue
+            
+            calls:list[tuple[str, int, int, str, SnesAddressMode]] = [_call(blocks[caller].items[i]) for caller, i in sites]
+            
+            # jumps, pointers, anything else aimed at it keeps it around
+            references:int = sum(
+                1
+                for caller, block in blocks.items() if (caller != callee)
+                for item in block.items if (isinstance(item, IRInstruction) and (item.target == callee))
+            )
+            removable:bool = (callee not in roots) and (references == len(sites))
+            
+            # the callee's own return goes too, if nothing else needs it
+            growth:int = sum(size - swp[1] for swp in calls)
+            
+            if (removable):
+                growth -= size + cost(blocks[callee].items[-1])[0]
+            
+            if ((growth > 0) and (growth > budget)):
+                continue
+            
+            budget -= max(growth, 0)
+            
+            # back to front, so the indexes stay good
+            for caller, i in reversed(sites):
+                blocks[caller].items[i:i + 1] = self._paste(body)
+                graph[caller].discard(callee)
+                graph[caller].update(graph[callee])
+            
+            self.stats.inlined += len(sites)
+            self.stats.cycles_saved += sum(swp[2] for swp in calls)
+            self.stats.bytes_saved -= growth
+            
+            if (removable):
+                del blocks[callee]
+                del graph[callee]
+                self.stats.removed += 1
+        
+        for block in blocks.values():
+            self._tail_calls(block)
+        
+        return blocks
+    
+    def _callees_first(self, graph:dict[Hashable, set[Hashable]]) -> list[Hashable]:
+        """Every function, each after everything it calls - recursion aside"""
+        ret:list[Hashable] = []
+        seen:set[Hashable] = set()
+        
+        def visit(symbol:Hashable) -> None:
+            seen.add(symbol)
+            
+            for callee in sorted(graph.get(symbol, ()), key=repr):
+                if (callee not in seen):
+                    visit(callee)
+            
+            ret.append(symbol)
+        
+        for symbol in graph:
+            if (symbol not in seen):
+                visit(symbol)
+        
+        return ret
+    
+    def _tail_calls(self, block:IRBlock) -> None:
+        """Calls straight before their own kind of return become jumps"""
+        items:list[IRItem] = block.items
+        i:int = 0
+        
+        while (i < (len(items) - 1)):
+            swp:tuple[str, int, int, str, SnesAddressMode]|None = _call(items[i])
+            after:IRItem = items[i + 1]
+            
+            if ((swp is not None) and isinstance(after, IRInstruction) and (after.mnemonic == swp[0])):
+                call:IRInstruction = items[i]
+                
+                # nothing can get to the return but through the call, there's no label between
+                items[i] = IRInstruction(swp[3], swp[4], call.operand, call.target, call.size, call.relax)
+                del items[i + 1]
+                
+                self.stats.tail_calls += 1
+                self.stats.bytes_saved += cost(after)[0]
+                self.stats.cycles_saved += _TAIL_CYCLES[swp[0]]
+            
+            i += 1
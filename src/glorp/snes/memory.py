@@ -0,0 +1,619 @@
+from array import array
+from enum import Enum
+from functools import cache
+
+from typing import (
+    Iterator,
+)
+
+STATUS_UNKNOWN:int = 0
+"""Status code for RAMStatus.UNKNOWN"""
+
+STATUS_EMPTY:int = 1
+"""Status code for RAMStatus.EMPTY"""
+
+STATUS_FILLED:int = 2
+"""Status code for RAMStatus.FILLED"""
+
+VALUE_UNKNOWN:int = 0
+"""Value status code for RAMValueStatus.UNKNOWN"""
+
+VALUE_KNOWN:int = 1
+"""Value status code for RAMValueStatus.KNOWN"""
+
+WRAM_SIZE:int = 0x20000
+"""Work RAM, all of banks $7E and $7F"""
+
+IO_SIZE:int = 0x6000
+"""$2000-$7FFF of the system banks - PPU, APU, controllers, CPU, DMA, expansion"""
+
+ROM_SIZE:int = 0x600000
+"""
+Everything the map treats as ROM, laid end to end - $8000-$FFFF of banks $00-$3F,
+then all of banks $40-$7D, then all of $FE and $FF
+"""
+
+class MemoryRegion(Enum):
+    WRAM = "wram"
+    """Work RAM"""
+    
+    IO = "io"
+    """Hardware registers and the expansion area"""
+    
+    ROM = "rom"
+    """Cartridge ROM"""
+    
+    OPEN_BUS = "open bus"
+    """Nothing's listening - reads float, writes go nowhere"""
+
+OPEN_BUS_RANGES:tuple[tuple[int, int], ...] = (
+    (0x2000, 0x20FF),
+    (0x2184, 0x3FFF),
+    (0x4000, 0x4015),
+    (0x4018, 0x41FF),
+    (0x4220, 0x42FF),
+    (0x4380, 0x5FFF),
+)
+"""(first, last) offsets in the system banks that nothing answers to"""
+
+REGIONS:tuple[MemoryRegion, ...] = (
+    MemoryRegion.WRAM,
+    MemoryRegion.IO,
+    MemoryRegion.ROM,
+    MemoryRegion.OPEN_BUS,
+)
+"""MemoryRegion for each region code in the page tables"""
+
+PAGE_SIZE:int = 0x100
+"""How many addresses each page table entry covers"""
+
+_WRAM, _IO, _ROM, _OPEN_BUS = range(len(REGIONS))
+
+_MIXED:int = len(REGIONS)
+"""Region code for the few pages that are part IO, part open bus"""
+
+def _build_page_tables() -> tuple[bytearray, array, bytearray]:
+    """
+    Work out where every page of the address space lives.
+    
+    Returns:
+        tuple: (region code of each page, store index of the start of each
+               page, which system bank offsets are open bus)
+    """
+    pages_per_bank:int = 0x10000 // PAGE_SIZE
+    regions:bytearray = bytearray(0x100 * pages_per_bank)
+    bases:array = array("l", [0]) * len(regions)
+    
+    # open bus, by offset first, then by page
+    open_bus:bytearray = bytearray(0x10000)
+    
+    for first, last in OPEN_BUS_RANGES:
+        open_bus[first:last + 1] = b"\x01" * (last + 1 - first)
+    
+    system:bytearray = bytearray(pages_per_bank)
+    system_bases:array = array("l", [0] * pages_per_bank)
+    
+    for page in range(pages_per_bank):
+        offset:int = page * PAGE_SIZE
+        
+        if (offset < 0x2000):
+            system[page] = _WRAM
+            system_bases[page] = offset
+        elif (offset < 0x8000):
+            swp:int = sum(open_bus[offset:offset + PAGE_SIZE])
+            system[page] = _OPEN_BUS if (swp == PAGE_SIZE) else (_IO if (swp == 0) else _MIXED)
+            system_bases[page] = offset - 0x2000
+        else:
+            system[page] = _ROM
+            system_bases[page] = offset - 0x8000
+    
+    for bank in range(0x100):
+        first:int = bank * pages_per_bank
+        last:int = first + pages_per_bank
+        base:int = 0
+        
+        if ((bank == 0x7E) or (bank == 0x7F)):
+            # wram proper
+            regions[first:last] = bytes([_WRAM]) * pages_per_bank
+            base = (bank - 0x7E) * 0x10000
+        elif ((bank & 0x7F) < 0x40):
+            # system banks, both halves - rom is in 32K slices
+            regions[first:last] = system
+            
+            for page in range(pages_per_bank):
+                bases[first + page] = system_bases[page]
+            
+            for page in range(0x8000 // PAGE_SIZE, pages_per_bank):
+                bases[first + page] += (bank & 0x3F) * 0x8000
+            
+            continue
+        elif (bank >= 0xFE):
+            # the two banks on the end have nothing mirroring them
+            regions[first:last] = bytes([_ROM]) * pages_per_bank
+            base = 0x5E0000 + ((bank - 0xFE) * 0x10000)
+        else:
+            regions[first:last] = bytes([_ROM]) * pages_per_bank
+            base = 0x200000 + (((bank & 0x7F) - 0x40) * 0x10000)
+        
+        bases[first:last] = array("l", range(base, base + 0x10000, PAGE_SIZE))
+    
+    return (regions, bases, open_bus)
+
+class RAMStore():
+    """
+    One piece of physical memory, as flat arrays.
+    
+    Each byte is a value, a status code and a value status code, kept in three
+    bytearrays of the same length. Everything starts as zero, which is
+    unknown / unknown, so making one is a single zeroed allocation per array.
+    """
+    def __init__(self, size:int):
+        self.values:bytearray = bytearray(size)
+        """The value of each byte"""
+        
+        self.statuses:bytearray = bytearray(size)
+        """STATUS_* code of each byte"""
+        
+        self.value_statuses:bytearray = bytearray(size)
+        """VALUE_* code of each byte"""
+    
+    def __len__(self) -> int:
+        return len(self.values)
+
+STORE_PAGE_BITS:int = 12
+"""log2 of STORE_PAGE_SIZE"""
+
+STORE_PAGE_SIZE:int = 1 << STORE_PAGE_BITS
+"""How much of a PagedStore gets allocated at once"""
+
+_STORE_PAGE_MASK:int = STORE_PAGE_SIZE - 1
+
+class _PagedPlane():
+    """
+    One of a PagedStore's planes.
+    
+    Indexes like a bytearray does, but looks the page up first. A page that's
+    never been written reads as zeros - unknown, for the status planes - and
+    only gets allocated when something's written to it.
+    """
+    __slots__ = (
+        "_store",
+        "_plane",
+    )
+    
+    def __init__(self, store:"PagedStore", plane:int):
+        self._store:PagedStore = store
+        self._plane:int = plane
+    
+    def __len__(self) -> int:
+        return self._store.size
+    
+    def __getitem__(self, index):
+        if (isinstance(index, slice)):
+            return self._store._read(self._plane, index)
+        
+        page:list|None = self._store.pages[index >> STORE_PAGE_BITS]
+        
+        if (page is None):
+            return 0
+        
+        return page[self._plane][index & _STORE_PAGE_MASK]
+    
+    def __setitem__(self, index, value) -> None:
+        if (isinstance(index, slice)):
+            self._store._write(self._plane, index, value)
+        else:
+            self._store.page(index >> STORE_PAGE_BITS)[self._plane][index & _STORE_PAGE_MASK] = value
+
+_LANE_LOW:int = int.from_bytes(b"\x7F" * STORE_PAGE_SIZE, "little")
+_LANE_HIGH:int = int.from_bytes(b"\x80" * STORE_PAGE_SIZE, "little")
+_LANE_ONE:int = int.from_bytes(b"\x01" * STORE_PAGE_SIZE, "little")
+
+def _lanes_differ(left:bytearray, right:bytearray) -> int:
+    """
+    Compare two pages a byte at a time, all at once.
+    
+    The pages are turned into big integers and compared as one, with the usual
+    trick for spotting non-zero bytes in a word - the word's just a page wide.
+    
+    Returns:
+        int: 0x01 in every byte where they differ, 0x00 where they don't
+    """
+    swp:int = int.from_bytes(left, "little") ^ int.from_bytes(right, "little")
+    return ((((swp & _LANE_LOW) + _LANE_LOW) | swp) & _LANE_HIGH) >> 7
+
+def _join_page(left:list, right:list, owner:object) -> list:
+    """Merge two pages into what they both agree on"""
+    values_differ:int = _lanes_differ(left[0], right[0])
+    statuses_differ:int = _lanes_differ(left[1], right[1])
+    
+    known:int = int.from_bytes(left[2], "little") & int.from_bytes(right[2], "little") & (values_differ ^ _LANE_ONE)
+    statuses:int = int.from_bytes(left[1], "little") & ((statuses_differ ^ _LANE_ONE) * 0xFF)
+    
+    return [
+        bytearray(left[0]),
+        bytearray(statuses.to_bytes(STORE_PAGE_SIZE, "little")),
+        bytearray(known.to_bytes(STORE_PAGE_SIZE, "little")),
+        owner,
+    ]
+
+class _OpenBusPlane():
+    """A plane that reads as zeros and throws writes away"""
+    __slots__ = ()
+    
+    def __getitem__(self, index):
+        if (isinstance(index, slice)):
+            return bytes(len(range(*index.indices(1 << 24))))
+        
+        return 0
+    
+    def __setitem__(self, index, value) -> None:
+        pass
+    
+    def __len__(self) -> int:
+        return 1
+
+class PagedStore(RAMStore):
+    """
+    A RAMStore that only allocates the pages that get written to.
+    
+    Its planes index just like a plain store's, so nothing using it has to
+    care. Pages are STORE_PAGE_SIZE bytes, each one a value, status and value
+    status bytearray.
+    
+    Forks share pages until one side writes to them. Each page remembers which
+    store owns it, and only its owner writes to it in place - anyone else
+    copies it first. Forking just hands both sides new identities, so nobody
+    owns anything that's shared any more, and shares the page list itself
+    until one of them needs to change it.
+    """
+    def __init__(self, size:int):
+        self.size:int = size
+        """How many bytes this covers"""
+        
+        self.pages:list[list|None] = [None] * (((size - 1) >> STORE_PAGE_BITS) + 1)
+        """[values, statuses, value statuses, owner] for each page, None until it's used"""
+        
+        self.values = _PagedPlane(self, 0)
+        self.statuses = _PagedPlane(self, 1)
+        self.value_statuses = _PagedPlane(self, 2)
+        
+        self._owner:object = object()
+        self._shared_pages:bool = False
+    
+    def page(self, index:int) -> list:
+        """A page's planes, ready to write to - allocated or copied as needed"""
+        ret:list|None = self.pages[index]
+        
+        if ((ret is None) or (ret[3] is not self._owner)):
+            if (self._shared_pages):
+                self.pages = list(self.pages)
+                self._shared_pages = False
+            
+            if (ret is None):
+                ret = [bytearray(STORE_PAGE_SIZE), bytearray(STORE_PAGE_SIZE), bytearray(STORE_PAGE_SIZE), self._owner]
+            else:
+                ret = [bytearray(ret[0]), bytearray(ret[1]), bytearray(ret[2]), self._owner]
+            
+            self.pages[index] = ret
+        
+        return ret
+    
+    def _disown(self) -> None:
+        """Stop writing to any page in place, and to the page list"""
+        self._owner = object()
+        self._shared_pages = True
+    
+    def fork(self) -> "PagedStore":
+        """
+        Copy this store, in constant time.
+        
+        Returns:
+            PagedStore: a store with the same contents, that either side can
+                        write to without the other seeing it
+        """
+        ret:PagedStore = PagedStore.__new__(PagedStore)
+        ret.size = self.size
+        ret.values = _PagedPlane(ret, 0)
+        ret.statuses = _PagedPlane(ret, 1)
+        ret.value_statuses = _PagedPlane(ret, 2)
+        ret.restore(self)
+        
+        return ret
+    
+    def restore(self, other:"PagedStore") -> None:
+        """Take on another store's contents, in constant time"""
+        if (other.size != self.size):
+            raise ValueError(f"Can't restore a {self.size} byte store from a {other.size} byte one")
+        
+        other._disown()
+        self._disown()
+        self.pages = other.pages
+    
+    def join(self, other:"PagedStore") -> "PagedStore":
+        """
+        Work out what two stores agree on.
+        
+        Values known and equal in both stay known, any other value becomes
+        unknown, and statuses that differ become unknown. Pages both sides
+        still share are kept as they are, the rest are merged a whole page at
+        a time.
+        
+        Args:
+            other: the other store
+        
+        Returns:
+            PagedStore: a new store holding the common knowledge
+        """
+        if (other.size != self.size):
+            raise ValueError(f"Can't join a {self.size} byte store with a {other.size} byte one")
+        
+        ret:PagedStore = PagedStore(self.size)
+        self._disown()
+        other._disown()
+        
+        for i, (left, right) in enumerate(zip(self.pages, other.pages)):
+            if (left is right):
+                ret.pages[i] = left
+            elif ((left is not None) and (right is not None)):
+                ret.pages[i] = _join_page(left, right, ret._owner)
+            
+            # and a page only one side has is all unknown, as far as the
+            # other side's concerned, so it stays None
+        
+        return ret
+    
+    @property
+    def resident_pages(self) -> int:
+        """How many pages have actually been allocated"""
+        return len(self.pages) - self.pages.count(None)
+    
+    def _spans(self, index:slice) -> list[tuple[int, int, int]]:
+        """Break a slice up at page boundaries into (page, start, stop)"""
+        start, stop, step = index.indices(self.size)
+        
+        if (step != 1):
+            raise ValueError("Paged stores can only be sliced contiguously")
+        
+        ret:list[tuple[int, int, int]] = []
+        
+        while (start < stop):
+            page:int = start >> STORE_PAGE_BITS
+            end:int = min(stop, (page + 1) << STORE_PAGE_BITS)
+            ret.append((page, start & _STORE_PAGE_MASK, ((end - 1) & _STORE_PAGE_MASK) + 1))
+            start = end
+        
+        return ret
+    
+    def _read(self, plane:int, index:slice) -> bytearray:
+        ret:bytearray = bytearray()
+        
+        for page, start, stop in self._spans(index):
+            swp:list|None = self.pages[page]
+            
+            if (swp is None):
+                ret += bytes(stop - start)
+            else:
+                ret += swp[plane][start:stop]
+        
+        return ret
+    
+    def _write(self, plane:int, index:slice, value) -> None:
+        data:memoryview = memoryview(value).cast("B")
+        spans:list[tuple[int, int, int]] = self._spans(index)
+        
+        if (len(data) != sum(stop - start for _, start, stop in spans)):
+            raise ValueError("Paged stores can't be resized by slice assignment")
+        
+        done:int = 0
+        
+        for page, start, stop in spans:
+            self.page(page)[plane][start:stop] = data[done:done + (stop - start)]
+            done += stop - start
+
+class OpenBusStore(RAMStore):
+    """
+    Where open bus addresses end up.
+    
+    Nothing's there, so every byte reads back as unknown and writes vanish.
+    All open bus addresses share it.
+    """
+    def __init__(self):
+        self.values = _OpenBusPlane()
+        self.statuses = _OpenBusPlane()
+        self.value_statuses = _OpenBusPlane()
+
+class FlatMemory():
+    """A run of addresses backed by a store of its own, with no mirroring"""
+    def __init__(self, start:int, length:int):
+        self.start:int = start
+        self.store:RAMStore = RAMStore(length)
+    
+    def locate(self, address:int) -> tuple[RAMStore, int]:
+        """
+        Find where an address actually lives.
+        
+        Args:
+            address: the address
+        
+        Returns:
+            tuple[RAMStore, int]: the store and the index into it
+        """
+        index:int = address - self.start
+        
+        if ((index < 0) or (index >= len(self.store))):
+            raise IndexError(f"Address {hex(address)} is outside of this memory")
+        
+        return (self.store, index)
+    
+    def runs(self, address:int, length:int) -> Iterator[tuple[RAMStore, int, int]]:
+        """
+        Find where a run of addresses actually lives, in as few pieces as
+        possible.
+        
+        Args:
+            address: the first address
+            length: how many addresses
+        
+        Yields:
+            tuple[RAMStore, int, int]: a store, the index into it, and how many
+                                       bytes from there on are in the run
+        """
+        if (length > 0):
+            store, index = self.locate(address)
+            self.locate(address + length - 1)
+            yield (store, index, length)
+
+@cache
+def default_page_tables() -> tuple[bytearray, array, bytearray]:
+    """The page tables, built the first time a map needs them - see memory_image for loading them prebuilt instead"""
+    return _build_page_tables()
+
+_OPEN_BUS_STORE:OpenBusStore = OpenBusStore()
+"""There's nothing in it, so every map can share the one"""
+
+class SNESMemoryMap():
+    """
+    The SNES address space, as a handful of physical stores.
+    
+    Every 24 bit address resolves to exactly one byte in exactly one store, so
+    mirrors don't need linking up - they're the same byte. The mapping is:
+    
+    - $7E-$7F: WRAM
+    - $00-$3F and $80-$BF, $0000-$1FFF: the first 8K of WRAM
+    - $00-$3F and $80-$BF, $2000-$7FFF: IO, bar OPEN_BUS_RANGES
+    - $00-$3F and $80-$BF, $8000-$FFFF: ROM
+    - $40-$7D and $C0-$FD: ROM, the same in both halves
+    - $FE-$FF: ROM, not mirrored anywhere
+    
+    It's all worked out ahead of time into a table with an entry per page, so
+    finding an address is a lookup and an add however many mirrors it has. The
+    tables are built on first use, or come from a MemoryImage already built.
+    
+    The stores are paged, so only the parts that actually get written to take
+    up any memory.
+    """
+    def __init__(self):
+        self._set_stores(PagedStore(WRAM_SIZE), PagedStore(IO_SIZE), PagedStore(ROM_SIZE), default_page_tables())
+    
+    def _set_stores(self, wram:PagedStore, io:PagedStore, rom:PagedStore, tables:tuple) -> None:
+        self.wram:PagedStore = wram
+        self.io:PagedStore = io
+        self.rom:PagedStore = rom
+        self.open_bus:RAMStore = _OPEN_BUS_STORE
+        
+        self.tables:tuple = tables
+        """(region code of each page, store index of each page, open bus offsets)"""
+        
+        self._stores:tuple[RAMStore, ...] = (self.wram, self.io, self.rom, self.open_bus)
+        self._page_regions, self._page_bases, self._open_bus_offsets = tables
+    
+    def locate(self, address:int) -> tuple[RAMStore, int]:
+        """
+        Find where an address actually lives.
+        
+        Args:
+            address: the 24 bit address
+        
+        Returns:
+            tuple[RAMStore, int]: the store and the index into it
+        """
+        if ((address < 0) or (address > 0xFFFFFF)):
+            raise IndexError(f"Address {hex(address)} is outside of the SNES address space")
+        
+        page:int = address >> 8
+        region:int = self._page_regions[page]
+        
+        if (region == _MIXED):
+            region = _OPEN_BUS if self._open_bus_offsets[address & 0xFFFF] else _IO
+        
+        return (self._stores[region], self._page_bases[page] + (address & 0xFF))
+    
+    def runs(self, address:int, length:int) -> Iterator[tuple[RAMStore, int, int]]:
+        """
+        Find where a run of addresses actually lives, in as few pieces as
+        possible.
+        
+        Goes a page at a time, gluing pages that land next to each other in
+        the same store back together.
+        
+        Args:
+            address: the first address
+            length: how many addresses
+        
+        Yields:
+            tuple[RAMStore, int, int]: a store, the index into it, and how many
+                                       bytes from there on are in the run
+        """
+        end:int = address + length
+        
+        if ((address < 0) or (end > 0x1000000)):
+            raise IndexError(f"{length} bytes at {hex(address)} run outside of the SNES address space")
+        
+        regions = self._page_regions
+        bases = self._page_bases
+        open_bus = self._open_bus_offsets
+        
+        run_store:RAMStore|None = None
+        run_index:int = 0
+        run_length:int = 0
+        
+        while (address < end):
+            page:int = address >> 8
+            region:int = regions[page]
+            stop:int = min(end, (page + 1) << 8)
+            
+            if (region == _MIXED):
+                # carry on until it flips between io and open bus
+                offset:int = address & 0xFFFF
+                region = _OPEN_BUS if open_bus[offset] else _IO
+                swp:int = open_bus.find(b"\x00" if (region == _OPEN_BUS) else b"\x01", offset, offset + (stop - address))
+                
+                if (swp >= 0):
+                    stop = address + (swp - offset)
+            
+            store:RAMStore = self._stores[region]
+            index:int = bases[page] + (address & 0xFF)
+            
+            if ((store is run_store) and (index == (run_index + run_length))):
+                run_length += stop - address
+            else:
+                if (run_length > 0):
+                    yield (run_store, run_index, run_length)
+                
+                run_store, run_index, run_length = store, index, stop - address
+            
+            address = stop
+        
+        if (run_length > 0):
+            yield (run_store, run_index, run_length)
+    
+    def region(self, address:int) -> MemoryRegion:
+        """Which kind of memory an address ends up in"""
+        store:RAMStore = self.locate(address)[0]
+        return REGIONS[self._stores.index(store)]
+    
+    def fork(self) -> "SNESMemoryMap":
+        """A copy of the whole map, in constant time - see PagedStore.fork"""
+        ret:SNESMemoryMap = SNESMemoryMap.__new__(SNESMemoryMap)
+        ret._set_stores(self.wram.fork(), self.io.fork(), self.rom.fork(), self.tables)
+        
+        return ret
+    
+    def restore(self, other:"SNESMemoryMap") -> None:
+        """Take on another map's contents, in constant time"""
+        self.wram.restore(other.wram)
+        self.io.restore(other.io)
+        self.rom.restore(other.rom)
+    
+    def join(self, other:"SNESMemoryMap") -> "SNESMemoryMap":
+        """What two maps agree on - see PagedStore.join"""
+        ret:SNESMemoryMap = SNESMemoryMap.__new__(SNESMemoryMap)
+        ret._set_stores(self.wram.join(other.wram), self.io.join(other.io), self.rom.join(other.rom), self.tables)
+        
+        return ret
+    
+    @property
+    def resident_bytes(self) -> int:
+        """How much memory the pages allocated so far take up"""
+        return (self.wram.resident_pages + self.io.resident_pages + self.rom.resident_pages) * STORE_PAGE_SIZE * 3
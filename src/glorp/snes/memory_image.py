@@ -0,0 +1,188 @@
+"""
+The SNES memory map, prebuilt into a file.
+
+The page tables never change from run to run, so they can be built once, along
+with whatever starting state the stores should have, and written out. Loading
+the file maps it in read only - every process that loads it shares the same
+physical pages, and maps made from it copy a page the first time they write to
+it, the same way forks do.
+
+Build one with `invoke memory-image`, or write_image.
+"""
+import mmap
+import struct
+
+from array import array
+from pathlib import Path
+
+from .memory import (
+    IO_SIZE,
+    ROM_SIZE,
+    STORE_PAGE_SIZE,
+    WRAM_SIZE,
+    PagedStore,
+    SNESMemoryMap,
+)
+
+IMAGE_MAGIC:bytes = b"GLORPMAP"
+"""What every image starts with"""
+
+IMAGE_VERSION:int = 1
+"""Bumped whenever the layout changes, so stale images get turned away"""
+
+_HEADER:struct.Struct = struct.Struct("<8sIII")
+"""magic, version, store page size, how many store pages follow"""
+
+_DIRECTORY_ENTRY:struct.Struct = struct.Struct("<II")
+"""which store, which page in it"""
+
+_TABLE_ENTRIES:int = 0x10000
+"""Entries in each page table - a page per 256 addresses, and 64K open bus offsets"""
+
+_STORE_SIZES:tuple[int, ...] = (
+    WRAM_SIZE,
+    IO_SIZE,
+    ROM_SIZE,
+)
+"""Size of each store, in the order they're numbered in the directory"""
+
+def _align(offset:int) -> int:
+    """Round up to a store page, so page data lines up with the OS's pages"""
+    return offset + (-offset % STORE_PAGE_SIZE)
+
+def write_image(path, memory:SNESMemoryMap|None = None) -> int:
+    """
+    Write a memory map out as an image.
+    
+    Layout, all little endian:
+    
+    - header: magic, version, store page size, page count
+    - region code of each page, a byte each
+    - store index of each page, 4 bytes each
+    - open bus flag of each system bank offset, a byte each
+    - directory: (store, page) of each stored page, 4 bytes each
+    - padding up to a store page
+    - values, statuses and value statuses of each stored page
+    
+    Only pages that have been written are stored, the rest read back as
+    unknown like they always do.
+    
+    Args:
+        path: where to write it
+        memory: the map to write, a fresh one if not given
+    
+    Returns:
+        int: how many bytes were written
+    """
+    memory = SNESMemoryMap() if (memory is None) else memory
+    regions, bases, open_bus = memory.tables
+    
+    pages:list[tuple[int, int, list]] = []
+    
+    for code, store in enumerate((memory.wram, memory.io, memory.rom)):
+        for index, page in enumerate(store.pages):
+            if (page is not None):
+                pages.append((code, index, page))
+    
+    out:bytearray = bytearray(_HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, STORE_PAGE_SIZE, len(pages)))
+    out += bytes(regions)
+    out += array("I", bases).tobytes()
+    out += bytes(open_bus)
+    
+    for code, index, _ in pages:
+        out += _DIRECTORY_ENTRY.pack(code, index)
+    
+    out += bytes(_align(len(out)) - len(out))
+    
+    for _, _, page in pages:
+        out += page[0]
+        out += page[1]
+        out += page[2]
+    
+    Path(path).write_bytes(out)
+    
+    return len(out)
+
+class MemoryImage():
+    """
+    A memory map image, mapped in read only.
+    
+    Nothing's read until it's used, so loading one costs a page-in rather than
+    building the tables. Pickling one just sends the path, so a worker process
+    maps the same file for itself.
+    """
+    def __init__(self, path):
+        self.path:str = str(path)
+        """Where the image lives"""
+        
+        with open(self.path, "rb") as file:
+            self._mmap:mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        view:memoryview = memoryview(self._mmap)
+        
+        if (len(view) < _HEADER.size):
+            raise ValueError(f"{self.path} is too short to be a memory image")
+        
+        magic, version, page_size, count = _HEADER.unpack_from(view)
+        
+        if (magic != IMAGE_MAGIC):
+            raise ValueError(f"{self.path} isn't a memory image")
+        
+        if ((version != IMAGE_VERSION) or (page_size != STORE_PAGE_SIZE)):
+            raise ValueError(f"{self.path} was built by a different version, rebuild it")
+        
+        offset:int = _HEADER.size
+        regions:memoryview = view[offset:offset + _TABLE_ENTRIES]
+        offset += _TABLE_ENTRIES
+        bases:memoryview = view[offset:offset + (_TABLE_ENTRIES * 4)].cast("I")
+        offset += _TABLE_ENTRIES * 4
+        
+        # the map searches this one, so it wants to be real bytes - it's 64K
+        open_bus:bytes = bytes(view[offset:offset + _TABLE_ENTRIES])
+        offset += _TABLE_ENTRIES
+        
+        self.tables:tuple = (regions, bases, open_bus)
+        """The page tables, as SNESMemoryMap wants them"""
+        
+        directory:list[tuple[int, int]] = [
+            _DIRECTORY_ENTRY.unpack_from(view, offset + (i * _DIRECTORY_ENTRY.size))
+            for i in range(count)
+        ]
+        
+        offset = _align(offset + (count * _DIRECTORY_ENTRY.size))
+        
+        if (len(view) < (offset + (count * STORE_PAGE_SIZE * 3))):
+            raise ValueError(f"{self.path} has been cut short")
+        
+        self.pages:list[tuple[int, int, tuple[memoryview, ...]]] = []
+        """(store, page, (values, statuses, value statuses)) of each stored page"""
+        
+        for code, index in directory:
+            self.pages.append((code, index, tuple(view[offset + (plane * STORE_PAGE_SIZE):offset + ((plane + 1) * STORE_PAGE_SIZE)] for plane in range(3))))
+            offset += STORE_PAGE_SIZE * 3
+        
+        self._owner:object = object()
+        """Owns the image's pages, so no store ever writes to them in place"""
+    
+    def __reduce__(self):
+        return (MemoryImage, (self.path,))
+    
+    def memory_map(self) -> SNESMemoryMap:
+        """
+        A memory map starting from the image.
+        
+        Its pages are the image's until it writes to them, when it gets its own
+        copy - see PagedStore.page.
+        
+        Returns:
+            SNESMemoryMap: a map that's free to change
+        """
+        stores:list[PagedStore] = [PagedStore(size) for size in _STORE_SIZES]
+        
+        for code, index, planes in self.pages:
+            stores[code].pages[index] = [*planes, self._owner]
+        
+        ret:SNESMemoryMap = SNESMemoryMap.__new__(SNESMemoryMap)
+        ret._set_stores(*stores, self.tables)
+        
+        return ret
@@ -0,0 +1,289 @@
+import struct
+
+from enum import Enum
+
+from .ram import (
+    FLAG_INDEX_REGISTER_SELECT,
+    FLAG_MEMORY_ACCUMULATOR_SELECT,
+    SNESProcessStatusRegister,
+)
+
+class SnesAddressMode(Enum):
+    ABSOLUTE  = "absolute"
+    ABSOLUTE_INDEXED_BY_X = "absolute indexed by x"
+    ABSOLUTE_INDEXED_BY_Y = "absolute indexed by y"
+    ABSOLUTE_INDEXED_INDIRECT = "absolute indexed indirect"
+    ABSOLUTE_INDIRECT = "absolute indirect"
+    ABSOLUTE_INDIRECT_LONG = "absolute indirect long"
+    ABSOLUTE_LONG = "absolute_long"
+    ABSOLUTE_LONG_INDEXED_BY_X = "absolute long indexed by x"
+    ACCUMULATOR = "accumulator"
+    BLOCK_MOVE = "block move"
+    DIRECT_PAGE = "direct page"
+    DIRECT_PAGE_INDEXED_BY_X = "direct page indexed by x"
+    DIRECT_PAGE_INDEXED_BY_Y = "direct page indexed by y"
+    DIRECT_PAGE_INDEXED_INDIRECT_BY_X = "direct page indexed indirect by x"
+    DIRECT_PAGE_INDIRECT = "direct page indirect"
+    DIRECT_PAGE_INDIRECT_INDEXED_BY_Y = "direct page indirect indexed by y"
+    DIRECT_PAGE_INDIRECT_LONG = "direct page indirect long"
+    DIRECT_PAGE_INDIRECT_LONG_INDEXED_BY_Y = "direct page indirect long indexed by y"
+    IMMEDIATE = "immediate"
+    IMPLIED = "implied"
+    RELATIVE = "relative"
+    RELATIVE_LONG = "relative long"
+    STACK_RELATIVE = "stack relative"
+    STACK_RELATIVE_INDIRECT_INDEXED_BY_Y = "stack_relative_indirect_indexed_by_y"
+
+_MODES:dict[str, tuple[SnesAddressMode, int]] = {
+    "abl": (SnesAddressMode.ABSOLUTE_LONG, 3),
+    "abs": (SnesAddressMode.ABSOLUTE, 2),
+    "abx": (SnesAddressMode.ABSOLUTE_INDEXED_BY_X, 2),
+    "aby": (SnesAddressMode.ABSOLUTE_INDEXED_BY_Y, 2),
+    "acc": (SnesAddressMode.ACCUMULATOR, 0),
+    "alx": (SnesAddressMode.ABSOLUTE_LONG_INDEXED_BY_X, 3),
+    "blk": (SnesAddressMode.BLOCK_MOVE, 2),
+    "di": (SnesAddressMode.DIRECT_PAGE_INDIRECT, 1),
+    "dil": (SnesAddressMode.DIRECT_PAGE_INDIRECT_LONG, 1),
+    "dix": (SnesAddressMode.DIRECT_PAGE_INDEXED_INDIRECT_BY_X, 1),
+    "diy": (SnesAddressMode.DIRECT_PAGE_INDIRECT_INDEXED_BY_Y, 1),
+    "dly": (SnesAddressMode.DIRECT_PAGE_INDIRECT_LONG_INDEXED_BY_Y, 1),
+    "dp": (SnesAddressMode.DIRECT_PAGE, 1),
+    "dpx": (SnesAddressMode.DIRECT_PAGE_INDEXED_BY_X, 1),
+    "dpy": (SnesAddressMode.DIRECT_PAGE_INDEXED_BY_Y, 1),
+    "iax": (SnesAddressMode.ABSOLUTE_INDEXED_INDIRECT, 2),
+    "ial": (SnesAddressMode.ABSOLUTE_INDIRECT_LONG, 2),
+    "imm": (SnesAddressMode.IMMEDIATE, 1),
+    "imp": (SnesAddressMode.IMPLIED, 0),
+    "ind": (SnesAddressMode.ABSOLUTE_INDIRECT, 2),
+    "rel": (SnesAddressMode.RELATIVE, 1),
+    "rell": (SnesAddressMode.RELATIVE_LONG, 2),
+    "sig": (SnesAddressMode.IMMEDIATE, 1),
+    "sr": (SnesAddressMode.STACK_RELATIVE, 1),
+    "sry": (SnesAddressMode.STACK_RELATIVE_INDIRECT_INDEXED_BY_Y, 1),
+}
+"""dict[table shorthand, (mode, operand bytes)] - sig is an immediate that's always a byte, like REP's"""
+
+MODE_SHORTHANDS:dict[str, SnesAddressMode] = {shorthand: mode for shorthand, (mode, _) in _MODES.items() if (shorthand != "sig")}
+"""dict[shorthand, mode] - the table's short names for modes, for anything else that wants them"""
+
+_ACCUMULATOR_IMMEDIATES:frozenset[str] = frozenset(("adc", "and", "bit", "cmp", "eor", "lda", "ora", "sbc"))
+"""Immediates as wide as A, so they follow M"""
+
+_INDEX_IMMEDIATES:frozenset[str] = frozenset(("cpx", "cpy", "ldx", "ldy"))
+"""Immediates as wide as X and Y, so they follow X"""
+
+_TABLE:str = """
+00: brk sig 7, ora dix 6, cop sig 7, ora sr 4, tsb dp 5, ora dp 3, asl dp 5, ora dil 6
+08: php imp 3, ora imm 2, asl acc 2, phd imp 4, tsb abs 6, ora abs 4, asl abs 6, ora abl 5
+10: bpl rel 2, ora diy 5, ora di 5, ora sry 7, trb dp 5, ora dpx 4, asl dpx 6, ora dly 6
+18: clc imp 2, ora aby 4, inc acc 2, tcs imp 2, trb abs 6, ora abx 4, asl abx 7, ora alx 5
+20: jsr abs 6, and dix 6, jsl abl 8, and sr 4, bit dp 3, and dp 3, rol dp 5, and dil 6
+28: plp imp 4, and imm 2, rol acc 2, pld imp 5, bit abs 4, and abs 4, rol abs 6, and abl 5
+30: bmi rel 2, and diy 5, and di 5, and sry 7, bit dpx 4, and dpx 4, rol dpx 6, and dly 6
+38: sec imp 2, and aby 4, dec acc 2, tsc imp 2, bit abx 4, and abx 4, rol abx 7, and alx 5
+40: rti imp 6, eor dix 6, wdm sig 2, eor sr 4, mvp blk 7, eor dp 3, lsr dp 5, eor dil 6
+48: pha imp 3, eor imm 2, lsr acc 2, phk imp 3, jmp abs 3, eor abs 4, lsr abs 6, eor abl 5
+50: bvc rel 2, eor diy 5, eor di 5, eor sry 7, mvn blk 7, eor dpx 4, lsr dpx 6, eor dly 6
+58: cli imp 2, eor aby 4, phy imp 3, tcd imp 2, jml abl 4, eor abx 4, lsr abx 7, eor alx 5
+60: rts imp 6, adc dix 6, per rell 6, adc sr 4, stz dp 3, adc dp 3, ror dp 5, adc dil 6
+68: pla imp 4, adc imm 2, ror acc 2, rtl imp 6, jmp ind 5, adc abs 4, ror abs 6, adc abl 5
+70: bvs rel 2, adc diy 5, adc di 5, adc sry 7, stz dpx 4, adc dpx 4, ror dpx 6, adc dly 6
+78: sei imp 2, adc aby 4, ply imp 4, tdc imp 2, jmp iax 6, adc abx 4, ror abx 7, adc alx 5
+80: bra rel 3, sta dix 6, brl rell 4, sta sr 4, sty dp 3, sta dp 3, stx dp 3, sta dil 6
+88: dey imp 2, bit imm 2, txa imp 2, phb imp 3, sty abs 4, sta abs 4, stx abs 4, sta abl 5
+90: bcc rel 2, sta diy 6, sta di 5, sta sry 7, sty dpx 4, sta dpx 4, stx dpy 4, sta dly 6
+98: tya imp 2, sta aby 5, txs imp 2, txy imp 2, stz abs 4, sta abx 5, stz abx 5, sta alx 5
+A0: ldy imm 2, lda dix 6, ldx imm 2, lda sr 4, ldy dp 3, lda dp 3, ldx dp 3, lda dil 6
+A8: tay imp 2, lda imm 2, tax imp 2, plb imp 4, ldy abs 4, lda abs 4, ldx abs 4, lda abl 5
+B0: bcs rel 2, lda diy 5, lda di 5, lda sry 7, ldy dpx 4, lda dpx 4, ldx dpy 4, lda dly 6
+B8: clv imp 2, lda aby 4, tsx imp 2, tyx imp 2, ldy abx 4, lda abx 4, ldx aby 4, lda alx 5
+C0: cpy imm 2, cmp dix 6, rep sig 3, cmp sr 4, cpy dp 3, cmp dp 3, dec dp 5, cmp dil 6
+C8: iny imp 2, cmp imm 2, dex imp 2, wai imp 3, cpy abs 4, cmp abs 4, dec abs 6, cmp abl 5
+D0: bne rel 2, cmp diy 5, cmp di 5, cmp sry 7, pei di 6, cmp dpx 4, dec dpx 6, cmp dly 6
+D8: cld imp 2, cmp aby 4, phx imp 3, stp imp 3, jml ial 6, cmp abx 4, dec abx 7, cmp alx 5
+E0: cpx imm 2, sbc dix 6, sep sig 3, sbc sr 4, cpx dp 3, sbc dp 3, inc dp 5, sbc dil 6
+E8: inx imp 2, sbc imm 2, nop imp 2, xba imp 3, cpx abs 4, sbc abs 4, inc abs 6, sbc abl 5
+F0: beq rel 2, sbc diy 5, sbc di 5, sbc sry 7, pea abs 5, sbc dpx 4, inc dpx 6, sbc dly 6
+F8: sed imp 2, sbc aby 4, plx imp 4, xce imp 2, jsr iax 8, sbc abx 4, inc abx 7, sbc alx 5
+"""
+"""
+Every opcode, eight to a line - mnemonic, _MODES shorthand and base cycles. The
+cycles are for 8 bit A and index registers, native mode, no page crossings and
+a page aligned direct page, the same as the usual references give.
+"""
+
+_STRUCTS:dict[tuple[int, bool], struct.Struct] = {
+    (0, False): struct.Struct("<B"),
+    (1, False): struct.Struct("<BB"),
+    (2, False): struct.Struct("<BH"),
+    (3, False): struct.Struct("<BHB"),
+    (1, True): struct.Struct("<Bb"),
+    (2, True): struct.Struct("<Bh"),
+}
+"""Packs an opcode and its operand - dict[(operand bytes, signed), format]"""
+
+class Opcode():
+    """One entry in the opcode table"""
+    __slots__ = (
+        "opcode",
+        "mnemonic",
+        "mode",
+        "size",
+        "width_flag",
+        "cycles",
+        "_structs",
+    )
+    
+    def __init__(self, opcode:int, mnemonic:str, mode:SnesAddressMode, size:int, width_flag:int, cycles:int):
+        self.opcode:int = opcode
+        """The byte itself"""
+        
+        self.mnemonic:str = mnemonic
+        """Lowercase, like the compiler uses"""
+        
+        self.mode:SnesAddressMode = mode
+        
+        self.size:int = size
+        """Operand bytes - with 8 bit registers, if width_flag is set"""
+        
+        self.width_flag:int = width_flag
+        """The status flag that picks the operand width, 0 if it's fixed"""
+        
+        self.cycles:int = cycles
+        """Base cycle count"""
+        
+        signed:bool = mode in (SnesAddressMode.RELATIVE, SnesAddressMode.RELATIVE_LONG)
+        self._structs:tuple[struct.Struct, ...] = tuple(_STRUCTS.get((i, signed)) for i in range(4))
+    
+    def __repr__(self):
+        return f"Opcode({hex(self.opcode)}, {self.mnemonic}, {self.mode.name})"
+    
+    def operand_size(self, status:SNESProcessStatusRegister|None = None) -> int|None:
+        """
+        How many bytes of operand this takes.
+        
+        Args:
+            status: what's known about P, only needed for M and X dependent
+                    immediates
+        
+        Returns:
+            int|None: how many bytes, None if it depends on a flag that isn't
+                      known
+        """
+        if (self.width_flag == 0):
+            return self.size
+        
+        if (status is None):
+            return None
+        
+        if (self.width_flag == FLAG_MEMORY_ACCUMULATOR_SELECT):
+            return status.accumulator_width
+        
+        return status.index_width
+    
+    def encode_into(self, buffer:bytearray, offset:int, operand:int = 0, size:int|None = None) -> int:
+        """
+        Pack the instruction straight into a buffer.
+        
+        Args:
+            buffer: where it goes, long enough already
+            offset: where in the buffer
+            operand: the operand - a signed offset for branches, and
+                     destination bank in the low byte, source in the high
+                     byte, for block moves
+            size: operand bytes, only needed for M and X dependent immediates
+        
+        Returns:
+            int: how many bytes it took
+        """
+        size = self.size if (size is None) else size
+        swp:struct.Struct|None = self._structs[size]
+        
+        try:
+            if (size == 3):
+                swp.pack_into(buffer, offset, self.opcode, operand & 0xFFFF, operand >> 16)
+            elif (size == 0):
+                swp.pack_into(buffer, offset, self.opcode)
+            else:
+                swp.pack_into(buffer, offset, self.opcode, operand)
+        except struct.error as ex:
+            raise ValueError(f"{hex(operand)} doesn't fit in {size} bytes for {self.mnemonic}") from ex
+        
+        return size + 1
+
+def _build_table() -> tuple[tuple[Opcode, ...], dict[str, dict[SnesAddressMode, Opcode]]]:
+    """Unpack _TABLE into both lookups"""
+    opcodes:list[Opcode] = []
+    by_mnemonic:dict[str, dict[SnesAddressMode, Opcode]] = {}
+    
+    for line in _TABLE.split("\n"):
+        if (not line):
+            continue
+        
+        for entry in line.split(":")[1].split(","):
+            mnemonic, shorthand, cycles = entry.split()
+            mode, size = _MODES[shorthand]
+            width_flag:int = 0
+            
+            if ((shorthand == "imm") and (mnemonic in _ACCUMULATOR_IMMEDIATES)):
+                width_flag = FLAG_MEMORY_ACCUMULATOR_SELECT
+            elif ((shorthand == "imm") and (mnemonic in _INDEX_IMMEDIATES)):
+                width_flag = FLAG_INDEX_REGISTER_SELECT
+            
+            swp:Opcode = Opcode(len(opcodes), mnemonic, mode, size, width_flag, int(cycles))
+            opcodes.append(swp)
+            by_mnemonic.setdefault(mnemonic, {})[mode] = swp
+    
+    return (tuple(opcodes), by_mnemonic)
+
+OPCODES, OPCODES_BY_MNEMONIC_THEN_MODE = _build_table()
+"""Every opcode by its byte, and dict[mnemonic, dict[mode, opcode]]"""
+
+def lookup(mnemonic:str, mode:SnesAddressMode) -> Opcode:
+    """
+    Find the opcode for a mnemonic in a mode.
+    
+    Args:
+        mnemonic: the mnemonic, lowercase
+        mode: the addressing mode
+    
+    Returns:
+        Opcode: the table entry
+    """
+    try:
+        return OPCODES_BY_MNEMONIC_THEN_MODE[mnemonic][mode]
+    except KeyError:
+        raise ValueError(f"There's no {mnemonic} with {mode.value} addressing") from None
+
+def encode_into(buffer:bytearray, offset:int, mnemonic:str, mode:SnesAddressMode, operand:int = 0, *, status:SNESProcessStatusRegister|None = None, size:int|None = None) -> int:
+    """
+    Assemble one instruction straight into a buffer.
+    
+    Args:
+        buffer: where it goes, long enough already
+        offset: where in the buffer
+        mnemonic: the mnemonic, lowercase
+        mode: the addressing mode
+        operand: the operand - see Opcode.encode_into
+        status: what's known about P, for M and X dependent immediates
+        size: operand bytes, for M and X dependent immediates, over status
+    
+    Returns:
+        int: how many bytes it took
+    """
+    opcode:Opcode = lookup(mnemonic, mode)
+    
+    if ((size is None) and opcode.width_flag):
+        size = opcode.operand_size(status)
+        
+        if (size is None):
+            raise ValueError(f"Can't tell how wide {mnemonic} #{hex(operand)} is, the register width isn't known")
+    
+    return opcode.encode_into(buffer, offset, operand, size)
+
+def encode(mnemonic:str, mode:SnesAddressMode, operand:int = 0, *, status:SNESProcessStatusRegister|None = None, size:int|None = None) -> bytearray:
+    """Assemble one instruction into a new buffer - see encode_into"""
+    ret:bytearray = bytearray(4)
+    del ret[encode_into(ret, 0, mnemonic, mode, operand, status=status, size=size):]
+    
+    return ret
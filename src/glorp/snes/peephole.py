@@ -0,0 +1,463 @@
+"""
+Peephole optimization over an IRBlock.
+
+Rules are written as a pattern and a rewrite:
+    
+    @peephole_rule("stz for zero stores", "lda imm; sta dp|dpx|abs|abx")
+    def _stz(window, items, end):
+        ...
+
+A pattern is instructions separated by semicolons, each one mnemonics and then
+modes, with | between alternatives and * (or nothing) for any mode - the modes
+are the opcode table's shorthands. The rewrite gets the matched instructions,
+the block's items and the index just past the match, and hands back what to
+put in their place, or None to leave them be. The items are the block's own,
+not a copy, so rewrites shouldn't change them.
+
+Whether a register or flag is still needed is worked out by scanning forward
+through the block - see is_dead.
+"""
+from typing import (
+    Callable,
+)
+
+from .assembler import (
+    IRBlock,
+    IRData,
+    IRInstruction,
+    IRItem,
+    IRLabel,
+)
+
+from .opcodes import (
+    MODE_SHORTHANDS,
+    Opcode,
+    SnesAddressMode,
+    lookup,
+)
+
+from .ram import (
+    FLAG_CARRY,
+    FLAG_DECIMAL_MODE,
+    FLAG_INDEX_REGISTER_SELECT,
+    FLAG_IRQ_DISABLE,
+    FLAG_MEMORY_ACCUMULATOR_SELECT,
+    FLAG_NEGATIVE,
+    FLAG_OVERFLOW,
+    FLAG_ZERO,
+)
+
+REG_A:int = 0x100
+"""The accumulator, in the same masks as the flags"""
+
+REG_X:int = 0x200
+REG_Y:int = 0x400
+
+_NZ:int = FLAG_NEGATIVE | FLAG_ZERO
+_NZC:int = _NZ | FLAG_CARRY
+_ALL:int = 0x7FF
+
+_EFFECTS:dict[str, tuple[int, int]] = {
+    "adc": (REG_A | FLAG_CARRY | FLAG_DECIMAL_MODE, REG_A | _NZC | FLAG_OVERFLOW),
+    "and": (REG_A, REG_A | _NZ),
+    "asl": (0, _NZC),
+    "bit": (REG_A, _NZ | FLAG_OVERFLOW),
+    "clc": (0, FLAG_CARRY),
+    "cld": (0, FLAG_DECIMAL_MODE),
+    "cli": (0, FLAG_IRQ_DISABLE),
+    "clv": (0, FLAG_OVERFLOW),
+    "cmp": (REG_A, _NZC),
+    "cpx": (REG_X, _NZC),
+    "cpy": (REG_Y, _NZC),
+    "dec": (0, _NZ),
+    "dex": (REG_X, REG_X | _NZ),
+    "dey": (REG_Y, REG_Y | _NZ),
+    "eor": (REG_A, REG_A | _NZ),
+    "inc": (0, _NZ),
+    "inx": (REG_X, REG_X | _NZ),
+    "iny": (REG_Y, REG_Y | _NZ),
+    "lda": (0, REG_A | _NZ),
+    "ldx": (0, REG_X | _NZ),
+    "ldy": (0, REG_Y | _NZ),
+    "lsr": (0, _NZC),
+    "nop": (0, 0),
+    "ora": (REG_A, REG_A | _NZ),
+    "pha": (REG_A, 0),
+    "phb": (0, 0),
+    "phd": (0, 0),
+    "phk": (0, 0),
+    "php": (_ALL & 0xFF, 0),
+    "phx": (REG_X, 0),
+    "phy": (REG_Y, 0),
+    "pla": (0, REG_A | _NZ),
+    "plb": (0, _NZ),
+    "pld": (0, _NZ),
+    "plp": (0, 0xFF),
+    "plx": (0, REG_X | _NZ),
+    "ply": (0, REG_Y | _NZ),
+    "rol": (FLAG_CARRY, _NZC),
+    "ror": (FLAG_CARRY, _NZC),
+    "sbc": (REG_A | FLAG_CARRY | FLAG_DECIMAL_MODE, REG_A | _NZC | FLAG_OVERFLOW),
+    "sec": (0, FLAG_CARRY),
+    "sed": (0, FLAG_DECIMAL_MODE),
+    "sei": (0, FLAG_IRQ_DISABLE),
+    "sta": (REG_A, 0),
+    "stx": (REG_X, 0),
+    "sty": (REG_Y, 0),
+    "stz": (0, 0),
+    "tax": (REG_A, REG_X | _NZ),
+    "tay": (REG_A, REG_Y | _NZ),
+    "tcd": (REG_A, _NZ),
+    "tcs": (REG_A, 0),
+    "tdc": (0, REG_A | _NZ),
+    "trb": (REG_A, FLAG_ZERO),
+    "tsb": (REG_A, FLAG_ZERO),
+    "tsc": (0, REG_A | _NZ),
+    "tsx": (0, REG_X | _NZ),
+    "txa": (REG_X, REG_A | _NZ),
+    "txs": (REG_X, 0),
+    "txy": (REG_X, REG_Y | _NZ),
+    "tya": (REG_Y, REG_A | _NZ),
+    "tyx": (REG_Y, REG_X | _NZ),
+    "xba": (REG_A, REG_A | _NZ),
+}
+"""
+dict[mnemonic, (what it reads, what it writes)], as REG_ and FLAG_ masks.
+Anything not in here - branches, jumps, calls, returns, block moves - is
+taken as reading everything, so nothing gets past it.
+"""
+
+_INDEXED_BY_X:frozenset[SnesAddressMode] = frozenset((
+    SnesAddressMode.ABSOLUTE_INDEXED_BY_X,
+    SnesAddressMode.ABSOLUTE_INDEXED_INDIRECT,
+    SnesAddressMode.ABSOLUTE_LONG_INDEXED_BY_X,
+    SnesAddressMode.DIRECT_PAGE_INDEXED_BY_X,
+    SnesAddressMode.DIRECT_PAGE_INDEXED_INDIRECT_BY_X,
+))
+
+_INDEXED_BY_Y:frozenset[SnesAddressMode] = frozenset((
+    SnesAddressMode.ABSOLUTE_INDEXED_BY_Y,
+    SnesAddressMode.DIRECT_PAGE_INDEXED_BY_Y,
+    SnesAddressMode.DIRECT_PAGE_INDIRECT_INDEXED_BY_Y,
+    SnesAddressMode.DIRECT_PAGE_INDIRECT_LONG_INDEXED_BY_Y,
+    SnesAddressMode.STACK_RELATIVE_INDIRECT_INDEXED_BY_Y,
+))
+
+_ACCUMULATOR_ONLY:frozenset[str] = frozenset(("asl", "dec", "inc", "lsr", "rol", "ror"))
+"""Read-modify-writes that work on A in accumulator mode, and memory otherwise"""
+
+def effects(instruction:IRInstruction) -> tuple[int, int]|None:
+    """
+    What an instruction reads and writes.
+    
+    Args:
+        instruction: the instruction
+    
+    Returns:
+        tuple[int, int]|None: (reads, writes) as REG_ and FLAG_ masks, None if
+                              it could go anywhere or do anything
+    """
+    mnemonic:str = instruction.mnemonic
+    
+    if ((mnemonic == "rep") or (mnemonic == "sep")):
+        return (0, instruction.operand & 0xFF)
+    
+    swp:tuple[int, int]|None = _EFFECTS.get(mnemonic)
+    
+    if (swp is None):
+        return None
+    
+    reads, writes = swp
+    mode:SnesAddressMode = instruction.mode
+    
+    if (mnemonic in _ACCUMULATOR_ONLY):
+        if (mode == SnesAddressMode.ACCUMULATOR):
+            reads |= REG_A
+            writes |= REG_A
+    elif ((mnemonic == "bit") and (mode == SnesAddressMode.IMMEDIATE)):
+        writes = FLAG_ZERO
+    
+    if (mode in _INDEXED_BY_X):
+        reads |= REG_X
+    elif (mode in _INDEXED_BY_Y):
+        reads |= REG_Y
+    
+    return (reads, writes)
+
+def is_dead(items:list[IRItem], mask:int, start:int = 0) -> bool:
+    """
+    Whether registers and flags get overwritten before anything reads them.
+    
+    Scans forward - labels are fine to walk past, since whatever comes in
+    through them gets overwritten all the same, but data, anything that could
+    jump off somewhere, and the end of the block all count as reading
+    everything. So does a change of width while A, X or Y are still being
+    looked for, since the overwrite mightn't cover the whole register.
+    
+    Args:
+        items: the block's items
+        mask: REG_ and FLAG_ bits to check
+        start: where to start looking
+    
+    Returns:
+        bool: True if every one of them is overwritten first
+    """
+    for i in range(start, len(items)):
+        item:IRItem = items[i]
+        
+        if (isinstance(item, IRLabel)):
+            continue
+        
+        if (isinstance(item, IRData)):
+            return False
+        
+        swp:tuple[int, int]|None = effects(item)
+        
+        if (swp is None):
+            return False
+        
+        reads, writes = swp
+        
+        if (reads & mask):
+            return False
+        
+        if ((mask & REG_A) and (writes & FLAG_MEMORY_ACCUMULATOR_SELECT)):
+            return False
+        
+        if ((mask & (REG_X | REG_Y)) and (writes & FLAG_INDEX_REGISTER_SELECT)):
+            return False
+        
+        mask &= ~writes
+        
+        if (mask == 0):
+            return True
+    
+    return False
+
+def cost(instruction:IRInstruction) -> tuple[int, int]:
+    """(bytes, base cycles) of an instruction as it stands"""
+    opcode:Opcode = lookup(instruction.mnemonic, instruction.mode)
+    
+    if (opcode.width_flag):
+        return (1 + instruction.size, opcode.cycles + instruction.size - 1)
+    
+    return (1 + opcode.size, opcode.cycles)
+
+def like(instruction:IRInstruction, mnemonic:str|None = None, mode:SnesAddressMode|None = None, operand:int|None = None) -> IRInstruction:
+    """A copy of an instruction, with whatever's given swapped out"""
+    return IRInstruction(
+        instruction.mnemonic if (mnemonic is None) else mnemonic,
+        instruction.mode if (mode is None) else mode,
+        instruction.operand if (operand is None) else operand,
+        instruction.target,
+        instruction.size,
+        instruction.relax,
+    )
+
+class RuleStats():
+    """What one rule has done"""
+    def __init__(self, name:str):
+        self.name:str = name
+        
+        self.hits:int = 0
+        """How many times it's fired"""
+        
+        self.bytes_saved:int = 0
+        self.cycles_saved:int = 0
+        """Base cycles, going straight through once"""
+    
+    def __repr__(self):
+        return f"RuleStats({self.name}: {self.hits} hits, {self.bytes_saved} bytes, {self.cycles_saved} cycles)"
+
+Rewrite = Callable[[list[IRInstruction], list[IRItem], int], list[IRInstruction]|None]
+
+class PeepholeRule():
+    """A pattern, and what to turn it into"""
+    def __init__(self, name:str, pattern:str, rewrite:Rewrite):
+        self.name:str = name
+        
+        self.pattern:list[tuple[frozenset[str], frozenset[SnesAddressMode]|None]] = []
+        """(mnemonics, modes or None for any) for each instruction in the window"""
+        
+        self.rewrite:Rewrite = rewrite
+        
+        for element in pattern.split(";"):
+            parts:list[str] = element.split()
+            
+            if (len(parts) not in (1, 2)):
+                raise ValueError(f"Can't make sense of '{element.strip()}' in rule {name}")
+            
+            modes:frozenset[SnesAddressMode]|None = None
+            
+            if ((len(parts) == 2) and (parts[1] != "*")):
+                modes = frozenset(MODE_SHORTHANDS[mode] for mode in parts[1].split("|"))
+            
+            self.pattern.append((frozenset(parts[0].split("|")), modes))
+    
+    def __repr__(self):
+        return f"PeepholeRule({self.name})"
+    
+    def match(self, items:list[IRItem], index:int) -> list[IRInstruction]|None:
+        """The instructions at index, if they fit the pattern"""
+        if ((index + len(self.pattern)) > len(items)):
+            return None
+        
+        ret:list[IRInstruction] = items[index:index + len(self.pattern)]
+        
+        for item, (mnemonics, modes) in zip(ret, self.pattern):
+            if (not isinstance(item, IRInstruction)):
+                return None
+            
+            if ((item.mnemonic not in mnemonics) or ((modes is not None) and (item.mode not in modes))):
+                return None
+        
+        return ret
+
+RULES:list[PeepholeRule] = []
+"""The rules every Peephole uses unless it's given others, in the order they're tried"""
+
+def peephole_rule(name:str, pattern:str) -> Callable[[Rewrite], Rewrite]:
+    """Add a rewrite to RULES - see the module docs"""
+    def wrapper(rewrite:Rewrite) -> Rewrite:
+        RULES.append(PeepholeRule(name, pattern, rewrite))
+        return rewrite
+    
+    return wrapper
+
+def _same_immediate(left:IRInstruction, right:IRInstruction) -> bool:
+    return (left.mnemonic == right.mnemonic) and (left.operand == right.operand) and (left.target == right.target) and (left.size == right.size)
+
+_LOADED:dict[str, int] = {
+    "lda": REG_A,
+    "ldx": REG_X,
+    "ldy": REG_Y,
+}
+
+@peephole_rule("redundant load", "lda|ldx|ldy imm; sta|stx|sty|stz; lda|ldx|ldy imm")
+def _redundant_load(window:list[IRInstruction], items:list[IRItem], end:int) -> list[IRInstruction]|None:
+    # stores don't touch registers or flags, so loading the same again does nothing
+    if (not _same_immediate(window[0], window[2])):
+        return None
+    
+    return window[:2]
+
+@peephole_rule("dead load", "lda|ldx|ldy imm")
+def _dead_load(window:list[IRInstruction], items:list[IRItem], end:int) -> list[IRInstruction]|None:
+    # only immediates - reading some registers does things
+    if (not is_dead(items, _LOADED[window[0].mnemonic] | _NZ, end)):
+        return None
+    
+    return []
+
+@peephole_rule("stz for zero stores", "lda imm; sta dp|dpx|abs|abx")
+def _stz(window:list[IRInstruction], items:list[IRItem], end:int) -> list[IRInstruction]|None:
+    if ((window[0].operand != 0) or (window[0].target is not None) or (not is_dead(items, REG_A | _NZ, end))):
+        return None
+    
+    return [like(window[1], "stz")]
+
+@peephole_rule("merge rep and sep", "rep|sep imm; rep|sep imm")
+def _merge_rep_sep(window:list[IRInstruction], items:list[IRItem], end:int) -> list[IRInstruction]|None:
+    first, second = window
+    
+    if (first.mnemonic == second.mnemonic):
+        return [like(first, operand=(first.operand | second.operand) & 0xFF)]
+    
+    # the second one wins wherever they overlap, so the first only matters if
+    # it touches something the second doesn't - or if it sets X, which clears
+    # the top of X and Y on the way
+    if (first.operand & ~second.operand & 0xFF):
+        return None
+    
+    if ((first.mnemonic == "sep") and (first.operand & FLAG_INDEX_REGISTER_SELECT)):
+        return None
+    
+    # interrupts get a look in between any two instructions, so even a window
+    # one instruction wide is there on purpose
+    if (first.operand & FLAG_IRQ_DISABLE):
+        return None
+    
+    return [second]
+
+@peephole_rule("empty rep or sep", "rep|sep imm")
+def _empty_rep_sep(window:list[IRInstruction], items:list[IRItem], end:int) -> list[IRInstruction]|None:
+    if (window[0].operand & 0xFF):
+        return None
+    
+    return []
+
+@peephole_rule("dead flag op", "clc|sec|cld|sed|clv")
+def _dead_flag_op(window:list[IRInstruction], items:list[IRItem], end:int) -> list[IRInstruction]|None:
+    # not CLI or SEI - I's read before every instruction, not just by PHP
+    if (not is_dead(items, _EFFECTS[window[0].mnemonic][1], end)):
+        return None
+    
+    return []
+
+class Peephole():
+    """
+    Runs rules over blocks until none of them fire.
+    
+    After each rewrite it backs up far enough to catch anything the rewrite
+    made possible. Every rule makes the block shorter, so it always stops.
+    """
+    def __init__(self, rules:list[PeepholeRule]|None = None):
+        self.rules:list[PeepholeRule] = RULES if (rules is None) else rules
+        
+        self.stats:dict[str, RuleStats] = {rule.name: RuleStats(rule.name) for rule in self.rules}
+        """dict[rule name, what it's done], over every block so far"""
+    
+    def optimize(self, block:IRBlock) -> int:
+        """
+        Rewrite a block in place.
+        
+        Args:
+            block: the code
+        
+        Returns:
+            int: how many rewrites were made
+        """
+        items:list[IRItem] = block.items
+        longest:int = max((len(rule.pattern) for rule in self.rules), default=1)
+        ret:int = 0
+        i:int = 0
+        
+        while (i < len(items)):
+            for rule in self.rules:
+                window:list[IRInstruction]|None = rule.match(items, i)
+                
+                if (window is None):
+                    continue
+                
+                swp:list[IRInstruction]|None = rule.rewrite(window, items, i + len(window))
+                
+                if (swp is None):
+                    continue
+                
+                self._count(rule, window, swp)
+                items[i:i + len(window)] = swp
+                ret += 1
+                i = max(0, i - longest + 1)
+                break
+            else:
+                i += 1
+        
+        return ret
+    
+    def _count(self, rule:PeepholeRule, before:list[IRInstruction], after:list[IRInstruction]) -> None:
+        stats:RuleStats = self.stats[rule.name]
+        stats.hits += 1
+        
+        for instruction in before:
+            size, cycles = cost(instruction)
+            stats.bytes_saved += size
+            stats.cycles_saved += cycles
+        
+        for instruction in after:
+            size, cycles = cost(instruction)
+            stats.bytes_saved -= size
+            stats.cycles_saved -= cycles
+    
+    def report(self) -> list[RuleStats]:
+        """Every rule that's fired, the biggest byte savings first"""
+        return sorted((stats for stats in self.stats.values() if stats.hits), key=lambda stats: -stats.bytes_saved)
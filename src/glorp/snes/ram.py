@@ -1,4 +1,30 @@
 from enum import Enum
+from functools import cached_property
+
+from typing import (
+    Iterator,
+)
+
+from . import bitset
+
+from .allocator import (
+    RAMAllocator,
+)
+
+from .memory_image import (
+    MemoryImage,
+)
+
+from .memory import (
+    STATUS_EMPTY,
+    STATUS_FILLED,
+    STATUS_UNKNOWN,
+    VALUE_KNOWN,
+    VALUE_UNKNOWN,
+    FlatMemory,
+    RAMStore,
+    SNESMemoryMap,
+)
 
 class RAMStatus(Enum):
     UNKNOWN = "unknown"
@@ -17,13 +43,34 @@ class RAMValueStatus(Enum):
     KNOWN = "known"
     """We know the value of the RAM now"""
 
+class _RAMCell():
+    """The state a group of mirrored RAMBytes share"""
+    __slots__ = (
+        "status",
+        "value",
+        "value_status",
+        "members",
+    )
+    
+    def __init__(self, owner:"RAMByte"):
+        self.status:RAMStatus = RAMStatus.UNKNOWN
+        self.value:int = 0x00
+        self.value_status:RAMValueStatus = RAMValueStatus.UNKNOWN
+        self.members:list[RAMByte] = [owner]
+
 class RAMByte():
+    """
+    One byte of memory, on its own.
+    
+    Mirrored bytes share a single cell, so writing one of them is one write no
+    matter how many mirrors it has.
+    """
+    __slots__ = (
+        "_cell",
+    )
+    
     def __init__(self, value=0x00):
-        self._status:RAMStatus = RAMStatus.UNKNOWN
-        self._value:int = 0x00
-        self._value_status:RAMValueStatus = RAMValueStatus.UNKNOWN
-        self._mirrors:set[RAMByte] = set()
-        self._recursive_guard:bool = False
+        self._cell:_RAMCell = _RAMCell(self)
         
         # set value
         self.value = value
@@ -33,71 +80,64 @@ class RAMByte():
     
     @property
     def status(self) -> RAMStatus:
-        return self._status
+        return self._cell.status
     
     @status.setter
     def status(self, val:RAMStatus) -> None:
-        if (not self._recursive_guard):
-            self._recursive_guard = True
-            
-            self._status = val
-            
-            for mirror in self._mirrors:
-                mirror.status = val
-        
-            self._reset_recursive_guard()
+        self._cell.status = val
     
     @property
     def value(self) -> int:
-        return self._value
+        return self._cell.value
     
     @value.setter
     def value(self, val:int) -> None:
-        if (not self._recursive_guard):
-            self._recursive_guard = True
-            
-            # constraints
-            if ((val < 0x00) or (val > 255)):
-                raise ValueError("Byte must be between 0x00 and 0xFF (0 and 255)")
-            
-            # now we set it
-            self._value = val
-            self._status = RAMStatus.FILLED
-            self._value_status = RAMValueStatus.KNOWN
+        # constraints
+        if ((val < 0x00) or (val > 255)):
+            raise ValueError("Byte must be between 0x00 and 0xFF (0 and 255)")
         
-            for mirror in self._mirrors:
-                mirror.value = val
-            
-            self._reset_recursive_guard()
+        # now we set it
+        cell:_RAMCell = self._cell
+        cell.value = val
+        cell.status = RAMStatus.FILLED
+        cell.value_status = RAMValueStatus.KNOWN
     
     @property
     def value_status(self) -> RAMValueStatus:
-        return self._value_status
+        return self._cell.value_status
     
     @value_status.setter
     def value_status(self, val:RAMValueStatus) -> None:
-        if (not self._recursive_guard):
-            self._recursive_guard = True
-            
-            self._value_status = val
-            
-            for mirror in self._mirrors:
-                mirror.value_status = val
-        
-            self._reset_recursive_guard()
+        self._cell.value_status = val
     
-    def _reset_recursive_guard(self):
-        # only reset if it's not been reset yet
-        if (self._recursive_guard):
-            self._recursive_guard = False
-            
-            for mirror in self._mirrors:
-                mirror._reset_recursive_guard()
+    @property
+    def mirrors(self) -> list["RAMByte"]:
+        """Every other byte mirroring this one"""
+        return [member for member in self._cell.members if (member is not self)]
     
     def add_mirror(self, other:"RAMByte"):
-        if other is not self:
-            self._mirrors.add(other)
-            other._mirrors.add(self)
+        """
+        Make another byte (and all of its mirrors) mirror this one.
+        
+        They all end up with this byte's state. The smaller group moves over to
+        the bigger group's cell, so building up a big group stays cheap.
+        """
+        keep:_RAMCell = self._cell
+        gone:_RAMCell = other._cell
+        
+        if (keep is gone):
+            return
+        
+        if (len(gone.members) > len(keep.members)):
+            gone.status = keep.status
+            gone.value = keep.value
+            gone.value_status = keep.value_status
+            keep, gone = gone, keep
+        
+        for member in gone.members:
+            member._cell = keep
+        
+        keep.members.extend(gone.members)
     
     def delete(self):
         """
@@ -119,394 +159,674 @@ class RAMByte():
         self.status = RAMStatus.UNKNOWN
         self.value_status = RAMValueStatus.UNKNOWN
 
+class RAMByteHandle(RAMByte):
+    """
+    A RAMByte that's really a byte in a RAMStore.
+    
+    Reads and writes go straight through to the store, so every handle on the
+    same byte (or on any of its mirrors) sees the same thing without having to
+    be told about the others.
+    """
+    __slots__ = (
+        "_store",
+        "_index",
+    )
+    
+    def __init__(self, store:RAMStore, index:int):
+        self._store:RAMStore = store
+        self._index:int = index
+    
+    @property
+    def status(self) -> RAMStatus:
+        return _STATUSES[self._store.statuses[self._index]]
+    
+    @status.setter
+    def status(self, val:RAMStatus) -> None:
+        self._store.statuses[self._index] = _STATUS_CODES[val]
+    
+    @property
+    def value(self) -> int:
+        return self._store.values[self._index]
+    
+    @value.setter
+    def value(self, val:int) -> None:
+        _set_value(self._store, self._index, val)
+    
+    @property
+    def value_status(self) -> RAMValueStatus:
+        return _VALUE_STATUSES[self._store.value_statuses[self._index]]
+    
+    @value_status.setter
+    def value_status(self, val:RAMValueStatus) -> None:
+        self._store.value_statuses[self._index] = _VALUE_STATUS_CODES[val]
+    
+    @property
+    def mirrors(self) -> list["RAMByte"]:
+        """Always empty - a handle's mirrors are whatever the memory map says"""
+        return []
+    
+    def add_mirror(self, other:"RAMByte"):
+        raise TypeError("Mirroring comes from the memory map, handles can't be mirrored by hand")
+    
+    def __eq__(self, other) -> bool:
+        # two handles on the same byte are the same byte
+        if (isinstance(other, RAMByteHandle)):
+            return (self._store is other._store) and (self._index == other._index)
+        
+        return NotImplemented
+    
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._index))
+
+_STATUSES:tuple[RAMStatus, ...] = (
+    RAMStatus.UNKNOWN,
+    RAMStatus.EMPTY,
+    RAMStatus.FILLED,
+)
+"""RAMStatus for each status code"""
+
+_STATUS_CODES:dict[RAMStatus, int] = {
+    RAMStatus.UNKNOWN: STATUS_UNKNOWN,
+    RAMStatus.EMPTY: STATUS_EMPTY,
+    RAMStatus.FILLED: STATUS_FILLED,
+}
+
+_VALUE_STATUSES:tuple[RAMValueStatus, ...] = (
+    RAMValueStatus.UNKNOWN,
+    RAMValueStatus.KNOWN,
+)
+"""RAMValueStatus for each value status code"""
+
+_VALUE_STATUS_CODES:dict[RAMValueStatus, int] = {
+    RAMValueStatus.UNKNOWN: VALUE_UNKNOWN,
+    RAMValueStatus.KNOWN: VALUE_KNOWN,
+}
+
+def _set_value(store:RAMStore, index:int, val:int) -> None:
+    """Write a byte, same rules as RAMByte.value"""
+    if ((val < 0x00) or (val > 255)):
+        raise ValueError("Byte must be between 0x00 and 0xFF (0 and 255)")
+    
+    store.values[index] = val
+    store.statuses[index] = STATUS_FILLED
+    store.value_statuses[index] = VALUE_KNOWN
+
 class RAMSegment():
-    def __init__(self, start:int, length:int):
+    """
+    A run of addresses.
+    
+    On its own a segment gets fresh memory of its own. Made with from_segment
+    (or handed a memory) it's a window onto someone else's instead, and sees
+    whatever mirroring that memory does.
+    """
+    def __init__(self, start:int, length:int, memory:FlatMemory|SNESMemoryMap|None = None):
         self.start:int = start
         """The start address of this in memory."""
         self.length:int = length
         """The end address of this in memory."""
         
-        self.bytes:list[RAMByte] = [RAMByte()] * length
-        """The internal data from this."""
+        self.memory:FlatMemory|SNESMemoryMap = FlatMemory(start, length) if (memory is None) else memory
+        """Where the bytes actually live"""
     
     def _offset_address(self, address:int) -> int:
         return address - self.start
     
+    def _locate(self, address:int) -> tuple[RAMStore, int]:
+        if ((address < self.start) or (address >= (self.start + self.length))):
+            raise IndexError(f"Address {hex(address)} is outside of this segment")
+        
+        return self.memory.locate(address)
+    
+    @property
+    def bytes(self) -> list[RAMByte]:
+        """Handles on every byte, built fresh - get_byte is the cheap way in"""
+        return self.get_byte_handles(0, self.length)
+    
     def get_byte_handles(self, start:int, length:int) -> list[RAMByte]:
-        return self.bytes[start:(start+length)]
+        return [self.get_byte(self.start + i) for i in range(start, min(start + length, self.length))]
     
     def set_byte_handles(self, start:int, bytes_:list[RAMByte]):
+        """
+        Copy the state of some bytes in, starting at an offset.
+        
+        The bytes themselves don't get shared - that's what mirroring in the
+        memory map is for.
+        """
         for i in range(len(bytes_)):
-            self.bytes[start + i] = bytes_[i]
+            store, index = self._locate(self.start + start + i)
+            store.values[index] = bytes_[i].value
+            store.statuses[index] = _STATUS_CODES[bytes_[i].status]
+            store.value_statuses[index] = _VALUE_STATUS_CODES[bytes_[i].value_status]
+    
+    @cached_property
+    def allocator(self) -> RAMAllocator:
+        """
+        Keeps track of what's been handed out of this segment.
+        
+        Segments that overlap each keep their own, so pick one to allocate out
+        of.
+        """
+        return RAMAllocator(self.start, self.length)
+    
+    def _runs(self, address:int, length:int) -> Iterator[tuple[RAMStore, int, int]]:
+        """Where a run of this segment's addresses lives - see SNESMemoryMap.runs"""
+        if ((length < 0) or (address < self.start) or ((address + length) > (self.start + self.length))):
+            raise IndexError(f"{length} bytes at {hex(address)} run outside of this segment")
+        
+        return self.memory.runs(address, length)
+    
+    def _mark(self, address:int, length:int, status:int, value_status:int|None = None) -> None:
+        for store, index, count in self._runs(address, length):
+            store.statuses[index:index + count] = bytes((status,)) * count
+            
+            if (value_status is not None):
+                store.value_statuses[index:index + count] = bytes((value_status,)) * count
+    
+    def fill(self, address:int, length:int, value:int) -> None:
+        """
+        Set a run of bytes to one value, like a DMA from a fixed address would.
+        
+        Args:
+            address: the first address
+            length: how many bytes
+            value: what to set them to
+        """
+        if ((value < 0x00) or (value > 255)):
+            raise ValueError("Byte must be between 0x00 and 0xFF (0 and 255)")
+        
+        for store, index, count in self._runs(address, length):
+            store.values[index:index + count] = bytes((value,)) * count
+        
+        self._mark(address, length, STATUS_FILLED, VALUE_KNOWN)
+    
+    def write(self, address:int, buffer) -> None:
+        """
+        Copy a buffer's bytes in, all known.
+        
+        Args:
+            address: where the first byte goes
+            buffer: bytes, bytearray, memoryview, anything that'll cast to bytes
+        """
+        data:memoryview = memoryview(buffer).cast("B")
+        done:int = 0
+        
+        for store, index, count in self._runs(address, len(data)):
+            store.values[index:index + count] = data[done:done + count]
+            done += count
+        
+        self._mark(address, len(data), STATUS_FILLED, VALUE_KNOWN)
+    
+    def read(self, address:int, length:int) -> memoryview:
+        """
+        Get a run of values out in one go.
+        
+        Values come back whether they're known or not, the same as get_value.
+        
+        Args:
+            address: the first address
+            length: how many bytes
+        
+        Returns:
+            memoryview: the values, read only
+        """
+        return memoryview(self._read_plane("values", address, length)).toreadonly()
+    
+    def _read_plane(self, plane:str, address:int, length:int) -> bytearray:
+        ret:bytearray = bytearray()
+        
+        for store, index, count in self._runs(address, length):
+            ret += getattr(store, plane)[index:index + count]
+        
+        return ret
+    
+    def mark_unknown(self, address:int, length:int) -> None:
+        """Forget everything about a run of bytes, values are left as they were"""
+        self._mark(address, length, STATUS_UNKNOWN, VALUE_UNKNOWN)
+    
+    def _range(self, address:int|None, length:int|None) -> tuple[int, int]:
+        """Fill in the whole segment for whichever of address and length is missing"""
+        address = self.start if (address is None) else address
+        length = (self.start + self.length - address) if (length is None) else length
+        
+        return (address, length)
+    
+    def status_bits(self, status:RAMStatus, address:int|None = None, length:int|None = None) -> int:
+        """
+        Where a run of bytes has a status, as a packed bitset.
+        
+        Args:
+            status: the status to look for
+            address: the first address, the start of the segment if not given
+            length: how many bytes, the rest of the segment if not given
+        
+        Returns:
+            int: bit i is set if address + i has the status
+        """
+        address, length = self._range(address, length)
+        return bitset.pack(self._read_plane("statuses", address, length), _STATUS_CODES[status])
+    
+    def known_bits(self, address:int|None = None, length:int|None = None) -> int:
+        """Where a run of bytes has a known value, as a packed bitset - see status_bits"""
+        address, length = self._range(address, length)
+        return bitset.pack(self._read_plane("value_statuses", address, length), VALUE_KNOWN)
+    
+    def find_status_run(self, status:RAMStatus, length:int, align:int = 1, address:int|None = None, end:int|None = None) -> int|None:
+        """
+        Find the first run of bytes that all have a status.
+        
+        Args:
+            status: the status they need, say RAMStatus.EMPTY
+            length: how many bytes in a row
+            align: what the first address has to be a multiple of
+            address: where to start looking, the start of the segment if not
+                     given
+            end: where to stop looking, the end of the segment if not given
+        
+        Returns:
+            int|None: the first address of the run, None if there isn't one
+        """
+        address, span = self._range(address, None)
+        
+        if (end is not None):
+            span = min(span, end - address)
+        
+        found:int = bitset.runs_of(self.status_bits(status, address, span), length)
+        
+        if (align > 1):
+            found &= bitset.every(align, span, -address % align)
+        
+        swp:int = bitset.lowest(found)
+        
+        return None if (swp < 0) else address + swp
+    
+    def all_known(self, address:int|None = None, length:int|None = None) -> bool:
+        """Whether every value in a run of bytes is known"""
+        address, length = self._range(address, length)
+        return VALUE_UNKNOWN not in self._read_plane("value_statuses", address, length)
+    
+    def any_unknown(self, address:int|None = None, length:int|None = None) -> bool:
+        """Whether any value in a run of bytes isn't known"""
+        return not self.all_known(address, length)
+    
+    def count_status(self, status:RAMStatus, address:int|None = None, length:int|None = None) -> int:
+        """How many bytes in a run (the whole segment by default) have a status"""
+        return self.status_bits(status, address, length).bit_count()
+    
+    def count_known(self, address:int|None = None, length:int|None = None) -> int:
+        """How many bytes in a run (the whole segment by default) have a known value"""
+        return self.known_bits(address, length).bit_count()
+    
+    def copy(self, source:int, destination:int, length:int) -> None:
+        """
+        Copy a run of bytes somewhere else, like a block move.
+        
+        Whatever was known about each source byte's value goes with it, and the
+        destination's all filled. Overlapping runs are fine, the source is read
+        in full before anything's written.
+        
+        Args:
+            source: the first address to copy from
+            destination: the first address to copy to
+            length: how many bytes
+        """
+        values:bytearray = self._read_plane("values", source, length)
+        value_statuses:bytearray = self._read_plane("value_statuses", source, length)
+        done:int = 0
+        
+        for store, index, count in self._runs(destination, length):
+            store.values[index:index + count] = values[done:done + count]
+            store.value_statuses[index:index + count] = value_statuses[done:done + count]
+            done += count
+        
+        self._mark(destination, length, STATUS_FILLED)
     
     def allocate(self, address:int, length:int) -> int:
-        raise NotImplementedError
+        """
+        Claim a run of bytes at a particular address.
+        
+        The bytes are marked filled, their values are left alone.
+        
+        Args:
+            address: where
+            length: how many bytes
+        
+        Returns:
+            int: address
+        """
+        self._locate(address + length - 1)
+        ret:int = self.allocator.allocate(address, length)
+        self._mark(ret, length, STATUS_FILLED)
+        
+        return ret
     
-    def allocate_any(self, length:int) -> int:
-        # allocate this in first worst style
-        raise NotImplementedError
+    def allocate_any(self, length:int, align:int = 1, boundary:int = 0x10000) -> int:
+        """
+        Claim a run of bytes wherever it fits - see RAMAllocator.allocate_any.
+        
+        Args:
+            length: how many bytes
+            align: what the address has to be a multiple of
+            boundary: a multiple of this can't fall inside the run, 0 for none
+        
+        Returns:
+            int: where it went
+        """
+        ret:int = self.allocator.allocate_any(length, align, boundary)
+        self._mark(ret, length, STATUS_FILLED)
+        
+        return ret
     
     def deallocate(self, address:int, length:int) -> None:
-        for i in range(length):
-            self.bytes[self._offset_address(address + i)].delete()
+        # give it back if it was handed out, it's empty either way
+        if (address in self.allocator.allocations):
+            self.allocator.deallocate(address, length)
+        
+        self._mark(address, length, STATUS_EMPTY, VALUE_UNKNOWN)
     
     def get_byte(self, address:int) -> RAMByte:
-        return self.bytes[self._offset_address(address)]
+        return RAMByteHandle(*self._locate(address))
     
     def get_value(self, address:int) -> int:
-        return self.bytes[self._offset_address(address)].value
+        store, index = self._locate(address)
+        return store.values[index]
     
     def set_value(self, address:int, value:int) -> None:
-        self.bytes[self._offset_address(address)].value = value
+        _set_value(*self._locate(address), value)
         
     @classmethod
     def from_segment(cls, source:"RAMSegment", address:int, length:int) -> "RAMSegment":
-        ret:RAMSegment = cls(address, length)
-        swp:list[RAMByte] = source.get_byte_handles(address, length)
-        ret.set_byte_handles(address, swp)
+        return cls(address, length, source.memory)
+
+class _BankList():
+    """The 256 bank segments, each one made the first time it's asked for"""
+    __slots__ = (
+        "_all",
+        "_banks",
+    )
+    
+    def __init__(self, all_:RAMSegment):
+        self._all:RAMSegment = all_
+        self._banks:list[RAMSegment|None] = [None] * 256
+    
+    def __len__(self) -> int:
+        return len(self._banks)
+    
+    def __getitem__(self, index:int) -> RAMSegment:
+        ret:RAMSegment|None = self._banks[index]
+        
+        if (ret is None):
+            ret = RAMSegment.from_segment(self._all, (index % 256) * 0x010000, 0x10000)
+            self._banks[index] = ret
+        
         return ret
+    
+    def __iter__(self) -> Iterator[RAMSegment]:
+        for i in range(len(self._banks)):
+            yield self[i]
 
 class SNESSystemRam():
+    """
+    The whole SNES address space, mirrors and all.
+    
+    The bytes live in an SNESMemoryMap - WRAM, IO and ROM as paged arrays - and
+    every segment here is just a window onto it, made when it's first used.
+    Setting this up doesn't touch a single byte, and nothing takes up memory
+    until it's written to.
+    """
     def __init__(self):
-        self.all:RAMSegment = RAMSegment(0, (0xFFFFFF + 1))
-        
-        # now we can just get all the banks together
-        self.banks:list[RAMSegment] = []
-        
-        for i in range(256):
-            bank_start:int = i * 0x010000
-            
-            bank:RAMSegment = RAMSegment.from_segment(self.all, bank_start, 0x10000)
-            self.banks.append(bank)
-        
-        # wram - basic setup
-        self.wram_all:RAMSegment     = RAMSegment.from_segment(self.all, 0x7E0000, 0x10000)
-        self.wram_stack:RAMSegment   = RAMSegment.from_segment(self.all, 0x7E0000, 0x1FFF + 1)
-        self.wram_scratch:RAMSegment = RAMSegment.from_segment(self.all, 0x7E2000, 0xDFFF + 1)
+        self.memory:SNESMemoryMap = SNESMemoryMap()
+        """Where every byte actually lives"""
         
-        # wram - mirroring - all
-        for byte_address in range(0x10000):
-            left:RAMByte = self.all.get_byte(0x7E0000 + byte_address)
-            right:RAMByte = self.all.get_byte(0x7F0000 + byte_address)
+        self.all:RAMSegment = RAMSegment(0, (0xFFFFFF + 1), self.memory)
         
-            left.add_mirror(right)
+        self.banks:_BankList = _BankList(self.all)
+        """Each bank as its own segment"""
+    
+    @classmethod
+    def _from_memory(cls, memory:SNESMemoryMap) -> "SNESSystemRam":
+        ret:SNESSystemRam = cls.__new__(cls)
+        ret.memory = memory
+        ret.all = RAMSegment(0, (0xFFFFFF + 1), memory)
+        ret.banks = _BankList(ret.all)
         
-        # wram - mirroring - stack
-        for byte_address in range(0x2000):
-            mirror_bytes:list[RAMByte] = []
-            
-            for bank_val in range(0x00, 0x40):
-                mirror_addr:int = (bank_val * 0x10000) + byte_address
-                mirror_bytes.append(self.all.get_byte(mirror_addr))
-            
-            for bank_val in range(0x7E, 0xC0):
-                mirror_addr:int = (bank_val * 0x10000) + byte_address
-                mirror_bytes.append(self.all.get_byte(mirror_addr))
-            
-            for left_idx in range(len(mirror_bytes) - 1):
-                left:RAMByte = mirror_bytes[left_idx]
-                right:RAMByte = mirror_bytes[left_idx + 1]
-                left.add_mirror(right)
-        
-        # side trip - internal common mirroring function now that we're done with wram
-        def ___common_mirror(range_start, range_end):
-            for byte_address in range(range_start, range_end):
-                mirror_bytes:list[RAMByte] = []
-            
-                for bank_val in range(0x00, 0x40):
-                    mirror_addr:int = (bank_val * 0x10000) + byte_address
-                    mirror_bytes.append(self.all.get_byte(mirror_addr))
-                
-                for bank_val in range(0x80, 0xC0):
-                    mirror_addr:int = (bank_val * 0x10000) + byte_address
-                    mirror_bytes.append(self.all.get_byte(mirror_addr))
-                
-                for left_idx in range(len(mirror_bytes) - 1):
-                    left:RAMByte = mirror_bytes[left_idx]
-                    right:RAMByte = mirror_bytes[left_idx + 1]
-                    left.add_mirror(right)
-        
-        # ppu/apu basic setup and mirroring (common mirror type)
-        self.ppu_apu:RAMSegment = RAMSegment.from_segment(self.all, 0x002000, 0x1FFF + 1)
-        ___common_mirror(0x2000, 0x4000)
-        
-        # controller basic setup and mirroring (common mirror type)
-        self.controller:RAMSegment = RAMSegment.from_segment(self.all, 0x4000, 0x01FF + 1)
-        ___common_mirror(0x4000, 0x4200)
-        
-        # CPU/DMA basic setup and mirror (common mirror type)
-        self.cpu_dma:RAMSegment = RAMSegment.from_segment(self.all, 0x4200, 0x1DFF + 1)
-        ___common_mirror(0x4200, 0x6000)
-        
-        # expansion basic setup and mirror (common mirror type)
-        self.expansion:RAMSegment = RAMSegment.from_segment(self.all, 0x6000, 0x1FFF + 1)
-        ___common_mirror(0x4200, 0x6000)
-        
-        # ROM sort of defies basic setup but
-        # we can at least get all the addresses together, right?
-        # so this is sparse, you better know what you're doing
-        self.rom:RAMSegment = RAMSegment(0x000000, 0x7DFFFF + 1)
-        
-        for bank_idx in range(0x00, 0x3F + 1):
-            swp_start:int = (bank_idx * 0x010000) + 0x008000
-            swp:list[RAMByte] = self.all.get_byte_handles(swp_start, 0x7FFF + 1)
-            self.rom.set_byte_handles(swp_start, swp)
-        
-        for bank_idx in range(0x40, 0x7D + 1):
-            swp_start:int = bank_idx * 0x010000
-            swp:list[RAMByte] = self.all.get_byte_handles(swp_start, 0xFFFF + 1)
-            self.rom.set_byte_handles(swp_start, swp)
-        
-        for bank_idx in range(0xFE, 0xFF + 1):
-            # there's no mirrors for these two banks.
-            swp_start:int = bank_idx * 0x010000
-            swp:list[RAMByte] = self.all.get_byte_handles(swp_start, 0xFFFF + 1)
-            self.rom.set_byte_handles(swp_start, swp)
-        
-        # ROM mirroring
-        # oodelady. Think we can do it in two very similar loops, though
-        for byte_address in range(0x8000, 0xFFFF + 1):
-            for bank_offset in range(0x00, 0x3F + 1):
-                left_addr:int = (0x000000 + (0x010000 * bank_offset)) + byte_address
-                right_addr:int = (0x800000 + (0x010000 * bank_offset)) + byte_address
-                
-                left:RAMByte = self.all.get_byte(left_addr)
-                right:RAMByte = self.all.get_byte(right_addr)
-                
-                left.add_mirror(right)
-        
-        for byte_address in range(0x0000, 0xFFFF + 1):
-            for bank_offset in range(0x40, 0x7D + 1):
-                left_addr:int = (0x000000 + (0x010000 * bank_offset)) + byte_address
-                right_addr:int = (0x800000 + (0x010000 * bank_offset)) + byte_address
-                
-                left:RAMByte = self.all.get_byte(left_addr)
-                right:RAMByte = self.all.get_byte(right_addr)
-                
-                left.add_mirror(right)
-        
-        # that should be all the virtual memory set up and mirrored
+        return ret
+    
+    @classmethod
+    def from_image(cls, image:MemoryImage) -> "SNESSystemRam":
+        """Start from a prebuilt memory image instead of from scratch - see memory_image"""
+        return cls._from_memory(image.memory_map())
+    
+    def fork(self) -> "SNESSystemRam":
+        """A copy to go off and change, in constant time"""
+        return self._from_memory(self.memory.fork())
+    
+    def snapshot(self) -> "SNESSystemRam":
+        """A copy to restore from later, in constant time"""
+        return self.fork()
+    
+    def restore(self, snapshot:"SNESSystemRam") -> None:
+        """Go back to a snapshot, in constant time"""
+        self.memory.restore(snapshot.memory)
+    
+    def join(self, other:"SNESSystemRam") -> "SNESSystemRam":
+        """What two forks agree on - see PagedStore.join"""
+        return self._from_memory(self.memory.join(other.memory))
+    
+    def _view(self, address:int, length:int) -> RAMSegment:
+        return RAMSegment.from_segment(self.all, address, length)
+    
+    # wram
+    @cached_property
+    def wram_all(self) -> RAMSegment:
+        return self._view(0x7E0000, 0x20000)
+    
+    @cached_property
+    def wram_stack(self) -> RAMSegment:
+        return self._view(0x7E0000, 0x1FFF + 1)
+    
+    @cached_property
+    def wram_scratch(self) -> RAMSegment:
+        return self._view(0x7E2000, 0xDFFF + 1)
+    
+    # io, as seen from bank $00
+    @cached_property
+    def ppu_apu(self) -> RAMSegment:
+        return self._view(0x002000, 0x1FFF + 1)
+    
+    @cached_property
+    def controller(self) -> RAMSegment:
+        return self._view(0x004000, 0x01FF + 1)
+    
+    @cached_property
+    def cpu_dma(self) -> RAMSegment:
+        return self._view(0x004200, 0x1DFF + 1)
+    
+    @cached_property
+    def expansion(self) -> RAMSegment:
+        return self._view(0x006000, 0x1FFF + 1)
+    
+    # ROM is sparse in here, you better know what you're doing
+    @cached_property
+    def rom(self) -> RAMSegment:
+        return self._view(0x000000, 0x7DFFFF + 1)
+        
+FLAG_CARRY:int = 0x01
+FLAG_ZERO:int = 0x02
+FLAG_IRQ_DISABLE:int = 0x04
+FLAG_DECIMAL_MODE:int = 0x08
+FLAG_INDEX_REGISTER_SELECT:int = 0x10
+FLAG_MEMORY_ACCUMULATOR_SELECT:int = 0x20
+FLAG_OVERFLOW:int = 0x40
+FLAG_NEGATIVE:int = 0x80
+
+FLAG_EMULATION:int = 0x100
+"""Not really in P - it hides behind carry, through XCE - but it's kept next to the rest"""
+
+_P_MASK:int = 0xFF
+"""The flags that are actually in P"""
+
+def _flag(bit:int, writable:bool = True) -> property:
+    """A property for one flag - 0 or 1, None if it isn't known"""
+    def getter(self) -> int|None:
+        if (not (self.known & bit)):
+            return None
         
+        return 1 if (self.value & bit) else 0
+    
+    def setter(self, val:int) -> None:
+        self._validate_bit(val)
+        self.value = (self.value | bit) if val else (self.value & ~bit)
+        self.known |= bit
+    
+    return property(getter, setter if writable else None)
+
 class SNESProcessStatusRegister():
+    """
+    P, and the emulation flag, as far as they're known.
+    
+    It's all two ints - the flags, laid out like P with E on bit 8, and a mask
+    of which of them are actually known. Setting, REP, SEP, joining and
+    comparing states are all a couple of bit operations.
+    """
+    __slots__ = (
+        "value",
+        "known",
+    )
+    
     def __init__(self):
-        self._emulation:int|None = None
-        self._carry:int|None = None
-        self._zero:int|None = None
-        self._irq_disable:int|None = None
-        self._decimal_mode:int|None = None
-        self._index_register_select:int|None = None
-        self._memory_accumulator_select:int|None = None
-        self._overflow:int|None = None
-        self._negative:int|None = None
+        self.value:int = 0
+        """The flags, FLAG_ bits - only the ones in known mean anything"""
+        
+        self.known:int = 0
+        """Which FLAG_ bits are known"""
     
     def set(self, val:int):
-        # carry
-        if (val & 0x01):
-            self._carry = 1
-        else:
-            self._carry = 0
-        
-        # zero
-        if (val & 0x02):
-            self._zero = 1
-        else:
-            self._zero = 0
-        
-        # IRQ disable
-        if (val & 0x04):
-            self._irq_disable = 1
-        else:
-            self._irq_disable = 0
-        
-        # decimal mode
-        if (val & 0x08):
-            self._decimal_mode = 1
-        else:
-            self._decimal_mode = 0
-        
-        # index register select
-        if (val & 0x10):
-            self._index_register_select = 1
-        else:
-            self._index_register_select = 0
-        
-        # memory / accumulator select
-        if (val & 0x20):
-            self._memory_accumulator_select = 1
-        else:
-            self._index_register_select = 0
-        
-        # overflow
-        if (val & 0x40):
-            self._overflow = 1
-        else:
-            self._overflow = 0
-        
-        # negative
-        if (val & 0x80):
-            self._negative = 1
-        else:
-            self._negative = 0
+        self.value = (self.value & FLAG_EMULATION) | (val & _P_MASK)
+        self.known |= _P_MASK
     
     def get(self) -> int|None:
-        ret:int|None = None
-        
-        bits:list[int|None] = [
-            self._carry,
-            self._zero,
-            self._irq_disable,
-            self._decimal_mode,
-            self._index_register_select,
-            self._memory_accumulator_select,
-            self._overflow,
-            self._negative,
-        ]
-        
-        have_none:bool = False
-        
-        for bit in bits:
-            if (bit is None):
-                have_none = True
-                
-        if (not have_none):
-            ret = 0
-            
-            for i in range(len(bits)):
-                 ret += (2 ** i) * bits[i]
-
-        return ret
-
-    def state_unknown(self):
-        self._carry = None
-        self._zero = None
-        self._irq_disable = None
-        self._decimal_mode = None
-        self._index_register_select = None
-        self._memory_accumulator_select = None
-        self._overflow = None
-        self._negative = None
-        self._emulation = None
+        if ((self.known & _P_MASK) != _P_MASK):
+            return None
+        
+        return self.value & _P_MASK
     
-    def _validate_bit(self, val:int):
-        if ((val != 0) and (val != 1)):
-            raise ValueError("You're setting a bit, not an integer.")
+    def rep(self, mask:int) -> None:
+        """Clear the flags in a mask, like REP does"""
+        mask &= _P_MASK
+        self.value &= ~mask
+        self.known |= mask
     
-    @property
-    def c(self) -> int|None:
-        return self._carry
+    def sep(self, mask:int) -> None:
+        """Set the flags in a mask, like SEP does"""
+        mask &= _P_MASK
+        self.value |= mask
+        self.known |= mask
     
-    @property
-    def carry(self) -> int|None:
-        return self._carry
+    def forget(self, mask:int) -> None:
+        """Stop knowing the flags in a mask"""
+        self.known &= ~mask
+        self.value &= ~mask
+    
+    def state_unknown(self):
+        self.value = 0
+        self.known = 0
     
-    @carry.setter
-    def carry(self, val:int) -> None:
-        self._validate_bit(val)
-        self._carry = val
-
     @property
-    def d(self) -> int|None:
-        return self._decimal_mode
-
+    def accumulator_width(self) -> int|None:
+        """How many bytes wide A and memory are, None if it isn't known"""
+        if (self.known & self.value & FLAG_EMULATION):
+            return 1
+        
+        if ((self.known & (FLAG_EMULATION | FLAG_MEMORY_ACCUMULATOR_SELECT)) != (FLAG_EMULATION | FLAG_MEMORY_ACCUMULATOR_SELECT)):
+            return None
+        
+        return 1 if (self.value & FLAG_MEMORY_ACCUMULATOR_SELECT) else 2
+    
     @property
-    def decimal_mode(self) -> int|None:
-        return self._decimal_mode
+    def index_width(self) -> int|None:
+        """How many bytes wide X and Y are, None if it isn't known"""
+        if (self.known & self.value & FLAG_EMULATION):
+            return 1
+        
+        if ((self.known & (FLAG_EMULATION | FLAG_INDEX_REGISTER_SELECT)) != (FLAG_EMULATION | FLAG_INDEX_REGISTER_SELECT)):
+            return None
+        
+        return 1 if (self.value & FLAG_INDEX_REGISTER_SELECT) else 2
     
-    @decimal_mode.setter
-    def decimal_mode(self, val:int) -> None:
-        self._validate_bit(val)
-        self._decimal_mode = val
+    def __eq__(self, other) -> bool:
+        if (not isinstance(other, SNESProcessStatusRegister)):
+            return NotImplemented
+        
+        return (self.known == other.known) and (((self.value ^ other.value) & self.known) == 0)
     
-    @property
-    def e(self) -> int|None:
-        return self._emulation
+    __hash__ = None
     
-    @property
-    def emulation(self) -> int|None:
-        return self._emulation
-
-    @emulation.setter
-    def emulation(self, val:int) -> None:
-        self._validate_bit(val)
-        self._emulation = val
+    def fork(self) -> "SNESProcessStatusRegister":
+        """A copy to go off and change"""
+        ret:SNESProcessStatusRegister = SNESProcessStatusRegister.__new__(SNESProcessStatusRegister)
+        ret.value = self.value
+        ret.known = self.known
+        
+        return ret
     
-    @property
-    def i(self) -> int|None:
-        return self._irq_disable
+    def snapshot(self) -> "SNESProcessStatusRegister":
+        """A copy to restore from later"""
+        return self.fork()
     
-    @property
-    def irq_disable(self) -> int|None:
-        return self._irq_disable
-
-    @irq_disable.setter
-    def irq_disable(self, val:int) -> None:
-        self._validate_bit(val)
-        self._irq_disable = val
+    def restore(self, snapshot:"SNESProcessStatusRegister") -> None:
+        """Go back to a snapshot"""
+        self.value = snapshot.value
+        self.known = snapshot.known
     
-    @property
-    def m(self) -> int|None:
-        return self._memory_accumulator_select
+    def join(self, other:"SNESProcessStatusRegister") -> "SNESProcessStatusRegister":
+        """
+        What two states agree on.
+        
+        Flags that are known and the same in both stay known, the rest become
+        unknown.
+        
+        Args:
+            other: the other state
+        
+        Returns:
+            SNESProcessStatusRegister: the common knowledge
+        """
+        ret:SNESProcessStatusRegister = SNESProcessStatusRegister.__new__(SNESProcessStatusRegister)
+        ret.known = self.known & other.known & ~(self.value ^ other.value)
+        ret.value = self.value & ret.known
+        
+        return ret
     
-    @property
-    def memory_accumulator_select(self) -> int|None:
-        return self._memory_accumulator_select
-
-    @memory_accumulator_select.setter
-    def memory_accumulator_select(self, val:int) -> None:
-        self._validate_bit(val)
-        self._memory_accumulator_select = val
+    def _validate_bit(self, val:int):
+        if ((val != 0) and (val != 1)):
+            raise ValueError("You're setting a bit, not an integer.")
     
-    @property
-    def n(self) -> int|None:
-        return self._negative
+    c = _flag(FLAG_CARRY, False)
+    carry = _flag(FLAG_CARRY)
     
-    @property
-    def negative(self) -> int|None:
-        return self._negative
-
-    @negative.setter
-    def negative(self, val:int) -> None:
-        self._validate_bit(val)
-        self._negative = val
+    d = _flag(FLAG_DECIMAL_MODE, False)
+    decimal_mode = _flag(FLAG_DECIMAL_MODE)
     
-    @property
-    def v(self) -> int|None:
-        return self._overflow
+    e = _flag(FLAG_EMULATION, False)
+    emulation = _flag(FLAG_EMULATION)
     
-    @property
-    def overflow(self) -> int|None:
-        return self._overflow
-
-    @overflow.setter
-    def overflow(self, val:int) -> None:
-        self._validate_bit(val)
-        self._overflow = val
+    i = _flag(FLAG_IRQ_DISABLE, False)
+    irq_disable = _flag(FLAG_IRQ_DISABLE)
     
-    @property
-    def x(self) -> int|None:
-        return self._index_register_select
+    m = _flag(FLAG_MEMORY_ACCUMULATOR_SELECT, False)
+    memory_accumulator_select = _flag(FLAG_MEMORY_ACCUMULATOR_SELECT)
     
-    @property
-    def index_register_select(self) -> int|None:
-        return self._index_register_select
-
-    @index_register_select.setter
-    def index_register_select(self, val:int) -> None:
-        self._validate_bit(val)
-        self._index_register_select = val
+    n = _flag(FLAG_NEGATIVE, False)
+    negative = _flag(FLAG_NEGATIVE)
     
-    @property
-    def z(self) -> int|None:
-        return self._zero
-
-    @property
-    def zero(self) -> int|None:
-        return self._zero
-
-    @zero.setter
-    def zero(self, val:int) -> None:
-        self._validate_bit(val)
-        self._zero = val
+    v = _flag(FLAG_OVERFLOW, False)
+    overflow = _flag(FLAG_OVERFLOW)
+    
+    x = _flag(FLAG_INDEX_REGISTER_SELECT, False)
+    index_register_select = _flag(FLAG_INDEX_REGISTER_SELECT)
+    
+    z = _flag(FLAG_ZERO, False)
+    zero = _flag(FLAG_ZERO)
 
 class SnesCPURegisters():
     def __init__(self):
@@ -516,19 +836,113 @@ class SnesCPURegisters():
         self._processor_status:SNESProcessStatusRegister = SNESProcessStatusRegister()
         self._stack:int|None = None
         self._program_counter:int|None = None
-
+        
+        self._direct_page:int|None = None
+        """D, which direct page addressing is relative to"""
+        
+        self._data_bank:int|None = None
+        """DBR, the bank absolute addressing reads and writes"""
+    
     def state_unknown(self):
         self._accumulator = None
         self._x_index = None
         self._y_index = None
         self._stack = None
         self._program_counter = None
+        self._direct_page = None
+        self._data_bank = None
         
         self._processor_status.state_unknown()
     
+    def fork(self) -> "SnesCPURegisters":
+        """A copy to go off and change"""
+        ret:SnesCPURegisters = SnesCPURegisters.__new__(SnesCPURegisters)
+        ret.__dict__.update(self.__dict__)
+        ret._processor_status = self._processor_status.fork()
+        
+        return ret
+    
+    def snapshot(self) -> "SnesCPURegisters":
+        """A copy to restore from later"""
+        return self.fork()
+    
+    def restore(self, snapshot:"SnesCPURegisters") -> None:
+        """Go back to a snapshot"""
+        status:SNESProcessStatusRegister = self._processor_status
+        
+        self.__dict__.update(snapshot.__dict__)
+        self._processor_status = status
+        self._processor_status.restore(snapshot._processor_status)
+    
+    def join(self, other:"SnesCPURegisters") -> "SnesCPURegisters":
+        """
+        What two states agree on.
+        
+        Registers that are known and the same in both stay known, the rest
+        become unknown.
+        
+        Args:
+            other: the other state
+        
+        Returns:
+            SnesCPURegisters: the common knowledge
+        """
+        ret:SnesCPURegisters = self.fork()
+        
+        for key, val in other.__dict__.items():
+            if ((key != "_processor_status") and (ret.__dict__[key] != val)):
+                ret.__dict__[key] = None
+        
+        ret._processor_status = self._processor_status.join(other._processor_status)
+        
+        return ret
+    
 class SnesRAM():
+    """
+    Everything the compiler knows about the machine at some point - the CPU's
+    registers and the whole address space.
+    
+    Forks and snapshots are cheap (memory is shared until one side writes to
+    it), so trying something out and throwing it away, or following both sides
+    of a branch and joining them back up after, costs next to nothing.
+    """
     def __init__(self):
         self._cpu_registers:SnesCPURegisters = SnesCPURegisters()
+        self.system:SNESSystemRam = SNESSystemRam()
+        """The address space"""
     
     def state_unknown(self):
-        self._cpu_registers.state_unknown()
\ No newline at end of file
+        self._cpu_registers.state_unknown()
+    
+    def fork(self) -> "SnesRAM":
+        """A copy to go off and change, in constant time"""
+        ret:SnesRAM = SnesRAM.__new__(SnesRAM)
+        ret._cpu_registers = self._cpu_registers.fork()
+        ret.system = self.system.fork()
+        
+        return ret
+    
+    def snapshot(self) -> "SnesRAM":
+        """A copy to restore from later, in constant time"""
+        return self.fork()
+    
+    def restore(self, snapshot:"SnesRAM") -> None:
+        """Go back to a snapshot, in constant time"""
+        self._cpu_registers.restore(snapshot._cpu_registers)
+        self.system.restore(snapshot.system)
+    
+    def join(self, other:"SnesRAM") -> "SnesRAM":
+        """
+        What two states agree on, say where two branches meet back up.
+        
+        Args:
+            other: the other state
+        
+        Returns:
+            SnesRAM: the common knowledge of both
+        """
+        ret:SnesRAM = SnesRAM.__new__(SnesRAM)
+        ret._cpu_registers = self._cpu_registers.join(other._cpu_registers)
+        ret.system = self.system.join(other.system)
+        
+        return ret
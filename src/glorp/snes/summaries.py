@@ -0,0 +1,361 @@
+"""
+What each function does to the CPU, as seen from the calls to it.
+
+Every function gets a FunctionSummary: what's known coming in (all its callers
+joined), what it needs set up, what it leaves alone, what it overwrites, and
+what's known when it returns. With those, a call doesn't have to mean
+forgetting everything - whatever the callee leaves alone carries straight over,
+and whatever it sets is known after.
+
+Summaries depend on each other through calls, and on themselves through
+recursion, so they're worked out together. They start out as though nothing
+gets called and nothing returns, and each round joins in whatever new ways in
+and out it finds - they only ever know less, so once a round finds nothing
+new, that's it. Only the last round's are safe to use.
+"""
+from typing import (
+    Hashable,
+)
+
+from .assembler import (
+    IRBlock,
+    IRData,
+    IRInstruction,
+    IRLabel,
+)
+
+from .flow import (
+    CALLS,
+    RETURNS,
+    TRACKED,
+    WidthFlow,
+    is_jump,
+)
+
+from .opcodes import SnesAddressMode
+
+from .peephole import (
+    REG_A,
+    REG_X,
+    REG_Y,
+    effects,
+)
+
+from .ram import (
+    FLAG_CARRY,
+    FLAG_EMULATION,
+    FLAG_INDEX_REGISTER_SELECT,
+    FLAG_MEMORY_ACCUMULATOR_SELECT,
+    SNESProcessStatusRegister,
+)
+
+CLOBBERS_ALL:int = REG_A | REG_X | REG_Y | 0xFF
+"""Every register and flag, as effects' masks have them"""
+
+_WIDTHS:int = FLAG_MEMORY_ACCUMULATOR_SELECT | FLAG_INDEX_REGISTER_SELECT
+
+_DIRECT_CALLS:tuple[SnesAddressMode, ...] = (
+    SnesAddressMode.ABSOLUTE,
+    SnesAddressMode.ABSOLUTE_LONG,
+)
+"""JSR and JSL modes that go straight to a label - the rest go through pointers"""
+
+_DIRECT_JUMPS:tuple[SnesAddressMode, ...] = _DIRECT_CALLS + (SnesAddressMode.RELATIVE_LONG,)
+"""JMP, JML and BRL modes that go straight to a label"""
+
+def _tail_call(item:IRInstruction, functions) -> bool:
+    """Whether it's a BRL, JMP or JML straight to another function - a call that returns for the caller"""
+    return (item.mnemonic in ("brl", "jmp", "jml")) and (item.mode in _DIRECT_JUMPS) and (item.target in functions)
+
+class FunctionSummary():
+    """What calling one function does"""
+    __slots__ = (
+        "symbol",
+        "entry",
+        "exit",
+        "preserves",
+        "clobbers",
+        "requires",
+    )
+    
+    def __init__(self, symbol:Hashable):
+        self.symbol:Hashable = symbol
+        
+        self.entry:SNESProcessStatusRegister|None = None
+        """What's known coming in, from every caller - None if nothing reaches it"""
+        
+        self.exit:SNESProcessStatusRegister|None = None
+        """What's known on the way out, None if it's never seen to return"""
+        
+        self.preserves:int = TRACKED
+        """Tracked FLAG_ bits that nothing it does - or calls - ever changes"""
+        
+        self.clobbers:int = 0
+        """REG_ and FLAG_ bits it, or anything it calls, might write"""
+        
+        self.requires:int = 0
+        """Tracked FLAG_ bits its immediates need, that it doesn't set up itself"""
+    
+    def __repr__(self):
+        return f"FunctionSummary({self.symbol!r}, preserves {hex(self.preserves)}, clobbers {hex(self.clobbers)}, requires {hex(self.requires)})"
+    
+    def apply(self, state:SNESProcessStatusRegister) -> None:
+        """
+        Move a state past a call.
+        
+        What's preserved stays as the caller had it, the rest is whatever's
+        known on the way out.
+        
+        Args:
+            state: the caller's state, changed in place
+        """
+        changed:int = TRACKED & ~self.preserves
+        exit_known:int = 0 if (self.exit is None) else self.exit.known & changed
+        exit_value:int = 0 if (self.exit is None) else self.exit.value & exit_known
+        
+        state.known = (state.known & ~changed) | exit_known
+        state.value = (state.value & ~changed) | exit_value
+
+class SummaryFlow(WidthFlow):
+    """A WidthFlow that knows what calls do"""
+    def __init__(self, summaries:dict[Hashable, FunctionSummary], entry:SNESProcessStatusRegister|None = None, entries:dict[Hashable, SNESProcessStatusRegister]|None = None):
+        super().__init__(entry, entries)
+        
+        self.summaries:dict[Hashable, FunctionSummary] = summaries
+        """dict[function label, summary]"""
+    
+    def call(self, instruction:IRInstruction, state:SNESProcessStatusRegister) -> bool:
+        summary:FunctionSummary|None = self.summaries.get(instruction.target)
+        
+        # calls through pointers could be anything
+        if ((summary is None) or (instruction.mode not in _DIRECT_CALLS)):
+            return super().call(instruction, state)
+        
+        if (summary.exit is None):
+            return False
+        
+        summary.apply(state)
+        
+        return True
+
+def _preserves(instruction:IRInstruction) -> int:
+    """Tracked FLAG_ bits an instruction leaves alone, calls aside"""
+    mnemonic:str = instruction.mnemonic
+    
+    if ((mnemonic == "rep") or (mnemonic == "sep")):
+        return TRACKED & ~(instruction.operand & 0xFF)
+    
+    if (mnemonic == "xce"):
+        return TRACKED & ~(FLAG_CARRY | FLAG_EMULATION | _WIDTHS)
+    
+    swp:tuple[int, int]|None = effects(instruction)
+    
+    if (swp is None):
+        # going somewhere else doesn't change anything, the rest could
+        return TRACKED if (is_jump(instruction) or (mnemonic in RETURNS)) else 0
+    
+    return TRACKED & ~(swp[1] & 0xFF)
+
+def _clobbers(instruction:IRInstruction) -> int:
+    """REG_ and FLAG_ bits an instruction might write, calls aside"""
+    mnemonic:str = instruction.mnemonic
+    
+    if ((mnemonic == "rep") or (mnemonic == "sep")):
+        return instruction.operand & 0xFF
+    
+    if (mnemonic == "xce"):
+        return FLAG_CARRY | _WIDTHS
+    
+    swp:tuple[int, int]|None = effects(instruction)
+    
+    if (swp is None):
+        return 0 if (is_jump(instruction) or (mnemonic in RETURNS)) else CLOBBERS_ALL
+    
+    return swp[1] & CLOBBERS_ALL
+
+def _own_effects(block:IRBlock, functions) -> tuple[int, int, set[Hashable]]:
+    """(preserves, clobbers, who it calls) of a block, not counting what the calls do"""
+    preserves:int = TRACKED
+    clobbers:int = 0
+    callees:set[Hashable] = set()
+    
+    for item in block:
+        if (isinstance(item, IRLabel)):
+            continue
+        
+        if (isinstance(item, IRData)):
+            preserves = 0
+            clobbers = CLOBBERS_ALL
+            continue
+        
+        if (item.mnemonic in CALLS):
+            if ((item.target is None) or (item.mode not in _DIRECT_CALLS)):
+                preserves = 0
+                clobbers = CLOBBERS_ALL
+            else:
+                callees.add(item.target)
+            
+            continue
+        
+        if (_tail_call(item, functions)):
+            callees.add(item.target)
+            continue
+        
+        preserves &= _preserves(item)
+        clobbers |= _clobbers(item)
+    
+    return (preserves, clobbers, callees)
+
+def _walk(flow:SummaryFlow, block:IRBlock) -> tuple[list[tuple[Hashable, SNESProcessStatusRegister]], SNESProcessStatusRegister|None, int]:
+    """
+    Run a flow through a function.
+    
+    Returns:
+        tuple: ([(callee, state going into the call)], the state at the
+               returns joined, None if nothing returns, tracked bits its
+               immediates found unknown)
+    """
+    blocks, states = flow.analyze(block)
+    calls:list[tuple[Hashable, SNESProcessStatusRegister]] = []
+    exit:SNESProcessStatusRegister|None = None
+    unknown:int = 0
+    
+    for basic, entry in zip(blocks, states):
+        if (entry is None):
+            continue
+        
+        state:SNESProcessStatusRegister = entry.fork()
+        
+        for item in block.items[basic.start:basic.end]:
+            if (isinstance(item, IRInstruction)):
+                if ((item.mnemonic in CALLS) and (item.target is not None)):
+                    calls.append((item.target, state.fork()))
+                elif ((item.mnemonic == "rts") or (item.mnemonic == "rtl")):
+                    exit = state.fork() if (exit is None) else exit.join(state)
+                elif (_tail_call(item, flow.summaries)):
+                    # returns however the function it goes to does
+                    calls.append((item.target, state.fork()))
+                    swp:SNESProcessStatusRegister = state.fork()
+                    
+                    if (flow.call(item, swp)):
+                        exit = swp if (exit is None) else exit.join(swp)
+                else:
+                    needs:tuple[int, int]|None = flow.width_needed(item)
+                    
+                    if (needs is not None):
+                        flag, value = needs
+                        unknown |= flag & ~state.known
+                        
+                        if ((value == 0) and (state.emulation is None)):
+                            unknown |= FLAG_EMULATION
+            
+            if (not flow.step(item, state)):
+                break
+    
+    return (calls, exit, unknown)
+
+def _same(left:SNESProcessStatusRegister|None, right:SNESProcessStatusRegister|None) -> bool:
+    if ((left is None) or (right is None)):
+        return left is right
+    
+    return left == right
+
+def summarize(blocks:dict[Hashable, IRBlock], entries:dict[Hashable, SNESProcessStatusRegister]|None = None) -> dict[Hashable, FunctionSummary]:
+    """
+    Summarize a set of functions that call each other.
+    
+    A function's known to come in however its callers leave things, joined -
+    unless nothing else calls it, or it's in entries, since then something
+    outside the set does.
+    
+    Args:
+        blocks: dict[function label, its code], each starting at its label and
+                leaving with RTS or RTL
+        entries: dict[function label, what's known coming in] for the ones
+                 called from outside the set, like main
+    
+    Returns:
+        dict[Hashable, FunctionSummary]: dict[function label, summary]
+    """
+    entries = {} if (entries is None) else entries
+    ret:dict[Hashable, FunctionSummary] = {symbol: FunctionSummary(symbol) for symbol in blocks}
+    callees:dict[Hashable, set[Hashable]] = {}
+    
+    for symbol, block in blocks.items():
+        summary:FunctionSummary = ret[symbol]
+        summary.preserves, summary.clobbers, callees[symbol] = _own_effects(block, blocks)
+    
+    # what calls do to the flags and registers, through every level of calls
+    changed:bool = True
+    
+    while (changed):
+        changed = False
+        
+        for symbol, summary in ret.items():
+            preserves:int = summary.preserves
+            clobbers:int = summary.clobbers
+            
+            for callee in callees[symbol]:
+                swp:FunctionSummary|None = ret.get(callee)
+                preserves &= 0 if (swp is None) else swp.preserves
+                clobbers |= CLOBBERS_ALL if (swp is None) else swp.clobbers
+            
+            if ((preserves != summary.preserves) or (clobbers != summary.clobbers)):
+                summary.preserves = preserves
+                summary.clobbers = clobbers
+                changed = True
+    
+    # who gets called by something else in here
+    called:set[Hashable] = set()
+    
+    for symbol, swp in callees.items():
+        called.update(callee for callee in swp if (callee != symbol))
+    
+    # and what's known going in and out, until it settles
+    changed = True
+    
+    while (changed):
+        changed = False
+        incoming:dict[Hashable, SNESProcessStatusRegister] = {}
+        
+        for symbol, block in blocks.items():
+            summary = ret[symbol]
+            
+            if (symbol in entries):
+                incoming[symbol] = entries[symbol].fork()
+            elif (symbol not in called):
+                incoming[symbol] = SNESProcessStatusRegister()
+            
+            if (summary.entry is None):
+                continue
+            
+            calls, exit, _ = _walk(SummaryFlow(ret, summary.entry), block)
+            
+            if (not _same(exit, summary.exit)):
+                summary.exit = exit
+                changed = True
+            
+            for callee, state in calls:
+                if (callee in ret):
+                    incoming[callee] = state if (callee not in incoming) else incoming[callee].join(state)
+        
+        for symbol, summary in ret.items():
+            entry:SNESProcessStatusRegister|None = incoming.get(symbol)
+            
+            if (not _same(entry, summary.entry)):
+                summary.entry = entry
+                changed = True
+    
+    # what it finds unknown coming in knowing only that it's in native mode,
+    # that it's in native mode at all, and not coming in knowing everything
+    native:SNESProcessStatusRegister = SNESProcessStatusRegister()
+    native.emulation = 0
+    known:SNESProcessStatusRegister = native.fork()
+    known.sep(FLAG_CARRY | _WIDTHS)
+    
+    for symbol, block in blocks.items():
+        requires:int = _walk(SummaryFlow(ret, native.fork()), block)[2] & ~FLAG_EMULATION
+        requires |= _walk(SummaryFlow(ret), block)[2] & FLAG_EMULATION
+        ret[symbol].requires = requires & ~_walk(SummaryFlow(ret, known.fork()), block)[2]
+    
+    return ret
@@ -4,6 +4,11 @@ from pathlib import Path
 
 import platform
 import re
+import sys
+
+@task
+def bench(ctx:Context):
+    ctx.run("python benchmarks/lexer_benchmark.py")
 
 @task
 def build(ctx:Context):
@@ -11,6 +16,13 @@ def build(ctx:Context):
         case _:
             print(f"Running on unimplemented platform: {platform.system()}")
 
+@task
+def memory_image(ctx:Context, output:str="memory.img"):
+    sys.path.insert(0, str(Path("src").resolve()))
+    from glorp.snes.memory_image import write_image
+    
+    print(f"Wrote {write_image(output)} bytes to {output}")
+
 @task
 def clean(ctx:Context):
     match platform.system():
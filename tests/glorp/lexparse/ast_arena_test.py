@@ -0,0 +1,80 @@
+from ... import context
+
+import pickle
+
+import pytest
+
+lexparse = context.glorp.lexparse
+
+Parser = lexparse.parser.Parser
+Scanner = lexparse.scanner.Scanner
+SymbolTable = lexparse.symbols.SymbolTable
+
+ast = lexparse.ast
+ASTArena = lexparse.ast_arena.ASTArena
+ASTKind = lexparse.ast_arena.ASTKind
+
+
+def _src() -> str:
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "    loop()" + "\n"
+    src = src + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass_time()"
+    
+    return src
+
+def _shape(node) -> tuple:
+    # enough of a node to compare trees
+    ret:list = [node.line, node.end_line]
+    
+    if (isinstance(node, (ast.ASTFunctionCall, ast.ASTFunctionDef))):
+        ret.append(node.name)
+        ret.append(node.symbol)
+    
+    if (isinstance(node, ast.ASTNodeWithBody)):
+        ret.append(node.body_indent)
+        ret.append([_shape(child) for child in node.body])
+    
+    return tuple(ret)
+
+def test_arena_matches_object_ast():
+    symbols:SymbolTable = SymbolTable()
+    tokens = Scanner(symbols).tokenize(_src())
+    
+    expected = Parser(symbols).parse(tokens)
+    arena:ASTArena = Parser(symbols).parse_arena(tokens)
+    
+    # views stand in for the real classes
+    assert (isinstance(arena.root, ast.AST))
+    assert (isinstance(arena.root.body[0], ast.ASTFunctionDef))
+    assert (isinstance(arena.root.body[0].body[0], ast.ASTFunctionCall))
+    assert (_shape(arena.root) == _shape(expected))
+    
+    # and it goes both ways
+    assert (_shape(ASTArena.from_ast(expected).root) == _shape(expected))
+    assert (_shape(arena.to_ast()) == _shape(expected))
+
+def test_arena_layout():
+    arena:ASTArena = Parser().parse_arena(Scanner().tokenize(_src()))
+    
+    assert (len(arena) == 6)
+    assert (list(arena.of_kind(ASTKind.FUNCTION_DEF)) == [1, 4])
+    assert (list(arena.children(1)) == [2, 3])
+    assert ([arena.symbols.name(arena.symbol_ids[i]) for i in arena.of_kind(ASTKind.FUNCTION_CALL)] == ["init", "loop", "pass_time"])
+    assert ((arena.lines[4], arena.end_lines[4]) == (5, 6))
+    
+    # views are read only
+    with pytest.raises(TypeError):
+        arena.root.add_node(ast.ASTFunctionDef())
+    
+    with pytest.raises(AttributeError):
+        arena.root.body[0].name = "nope"
+
+def test_arena_pickles():
+    arena:ASTArena = Parser().parse_arena(Scanner().tokenize(_src()))
+    res:ASTArena = pickle.loads(pickle.dumps(arena))
+    
+    assert (_shape(res.root) == _shape(arena.root))
@@ -0,0 +1,58 @@
+from ... import context
+
+from concurrent.futures import ThreadPoolExecutor
+
+lexparse = context.glorp.lexparse
+
+parallel = lexparse.parallel
+Parser = lexparse.parser.Parser
+Scanner = lexparse.scanner.Scanner
+SymbolTable = lexparse.symbols.SymbolTable
+
+
+def _src(functions:int) -> str:
+    src:str = ""
+    
+    for i in range(functions):
+        src = src + f"def routine_{i}():" + "\n"
+        src = src + f"    helper_{i}()" + "\n"
+        src = src + f"    helper_{i + 1}()" + "\n"
+        src = src + "\n"
+    
+    return src
+
+def _shape(ast) -> list:
+    return [(node.name, node.symbol, node.line, node.end_line, [(call.name, call.symbol, call.line) for call in node.body]) for node in ast.body]
+
+def test_split_source():
+    src:str = _src(10)
+    res = parallel.split_source(src, 3)
+    
+    assert (len(res) == 3)
+    assert (res[0][0] == 0)
+    assert (res[-1][1] == len(src))
+    
+    # each chunk picks up where the last left off, on a def
+    for (_, stop, line), (start, _, next_line) in zip(res, res[1:]):
+        assert (stop == start)
+        assert (src[start:].startswith("def "))
+        assert (next_line == src.count("\n", 0, start) + 1)
+
+def test_parse_parallel(monkeypatch):
+    monkeypatch.setattr(parallel, "MIN_CHUNK_SIZE", 64)
+    src:str = _src(50)
+    
+    expected = Parser().parse(Scanner().tokenize(src))
+    
+    # a thread pool is plenty to check the stitching
+    with ThreadPoolExecutor(2) as pool:
+        res = parallel.parse_parallel(src, workers=2, executor=pool)
+    
+    assert (_shape(res) == _shape(expected))
+    
+    # and a real process pool, too
+    assert (_shape(parallel.parse_parallel(src, workers=2)) == _shape(expected))
+    
+    # small enough to not bother
+    monkeypatch.setattr(parallel, "MIN_CHUNK_SIZE", len(src))
+    assert (_shape(parallel.parse_parallel(src, workers=2)) == _shape(expected))
@@ -8,6 +8,7 @@ ast = lexparse.ast
 Token = lexparse.token.Token
 TokenType = lexparse.token.TokenType
 Parser = lexparse.parser.Parser
+Scanner = lexparse.scanner.Scanner
 
 
 def test_bare_minimum_parser():
@@ -22,4 +23,107 @@ def test_bare_minimum_parser():
     
     # try to parse it
     parser:Parser = Parser()
-    parser.parse(tokens)
\ No newline at end of file
+    parser.parse(tokens)
+
+def test_parser_multiple_defs():
+    # build a src file
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "    loop()" + "\n"
+    src = src + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass_time()" + "\n"
+    
+    # lex and parse it
+    tokens = Scanner().tokenize(src)
+    res = Parser().parse(tokens)
+    
+    assert ([node.name for node in res.body] == ["main", "init"])
+    assert ([node.name for node in res.body[0].body] == ["init", "loop"])
+    assert ([node.name for node in res.body[1].body] == ["pass_time"])
+
+def test_parser_streams_from_scanner():
+    # build a src file
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass_time()"
+    
+    # keep track of how far the lexer got
+    pulled:list[Token] = []
+    
+    def _tokens():
+        for token in Scanner().iter_tokens(src):
+            pulled.append(token)
+            yield token
+    
+    parser:Parser = Parser()
+    nodes = parser.parse_iter(_tokens())
+    
+    # the first def is out before the second one has been lexed
+    first = next(nodes)
+    assert (first.name == "main")
+    assert (pulled[-1].line == 3)
+    
+    # and the window never held more than the lookahead
+    assert (len(parser._reader) <= Parser.LOOKAHEAD)
+    
+    rest = list(nodes)
+    assert ([node.name for node in rest] == ["init"])
+    assert (pulled[-1].type == TokenType.EOF)
+
+def test_parser_reads_token_buffers():
+    # build a src file
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass_time()"
+    
+    expected = Parser().parse(Scanner().tokenize(src))
+    
+    for compact in (
+        Scanner().tokenize_compact(src),
+        Scanner().tokenize_compact(src.encode("utf-8")),
+    ):
+        res = Parser().parse(compact)
+        
+        assert ([node.name for node in res.body] == [node.name for node in expected.body])
+        
+        for i in range(len(res.body)):
+            assert ([node.name for node in res.body[i].body] == [node.name for node in expected.body[i].body])
+
+def test_parser_reparse_reuses_defs():
+    old:str = ""
+    old = old + "def main():" + "\n"
+    old = old + "    init()" + "\n"
+    old = old + "def init():" + "\n"
+    old = old + "    pass_time()" + "\n"
+    old = old + "def loop():" + "\n"
+    old = old + "    loop()" + "\n"
+    
+    # swap line 4 for two lines
+    new:str = old.replace("    pass_time()", "    wait()" + "\n" + "    pass_time()")
+    
+    scanner:Scanner = Scanner()
+    parser:Parser = Parser()
+    before = parser.parse(scanner.tokenize(old))
+    main, init, loop = before.body
+    
+    res = parser.reparse(before, scanner.retokenize(scanner.stream, new, 4, 4, 1), 4, 4, 1)
+    
+    # main and loop are the same objects, loop moved down a line
+    assert (res.body[0] is main)
+    assert (res.body[1] is not init)
+    assert (res.body[2] is loop)
+    assert ((loop.line, loop.end_line) == (6, 7))
+    assert (loop.body[0].line == 7)
+    
+    # and it all matches a parse from scratch
+    expected = Parser().parse(Scanner().tokenize(new))
+    
+    for node, expected_node in zip(res.body, expected.body):
+        assert ((node.name, node.line, node.end_line) == (expected_node.name, expected_node.line, expected_node.end_line))
+        assert ([(call.name, call.line) for call in node.body] == [(call.name, call.line) for call in expected_node.body])
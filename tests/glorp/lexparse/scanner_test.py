@@ -0,0 +1,170 @@
+from ... import context
+
+import pytest
+
+lexparse = context.glorp.lexparse
+
+Lexer = lexparse.lexer.Lexer
+Scanner = lexparse.scanner.Scanner
+
+Token = lexparse.token.Token
+TokenType = lexparse.token.TokenType
+
+
+def _assert_same_stream(src:str):
+    # the lexer is the reference
+    expected:list[Token] = Lexer().tokenize(src)
+    res:list[Token] = Scanner().tokenize(src)
+    
+    assert (len(res) == len(expected))
+    
+    for i in range(len(res)):
+        assert (res[i].type == expected[i].type)
+        assert (res[i].value == expected[i].value)
+        assert (res[i].line == expected[i].line)
+        assert (res[i].column == expected[i].column)
+
+def test_scanner_matches_lexer_bare_minimum():
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()"
+    
+    _assert_same_stream(src)
+
+def test_scanner_matches_lexer_multiple_defs():
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "\n"
+    src = src + "    " + "\n"
+    src = src + "    load_level_2()" + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "        if True:" + "\n"
+    src = src + "            pass" + "\n"
+    src = src + "        identifier( indent )eof"
+    
+    _assert_same_stream(src)
+
+def test_scanner_matches_lexer_wide_identifiers():
+    src:str = ""
+    src = src + "def größe():" + "\n"
+    src = src + "    naïve_2()"
+    
+    _assert_same_stream(src)
+
+def test_scanner_keywords():
+    res:list[Token] = Scanner().tokenize("while whilst None indent")
+    
+    assert (res[0].type == TokenType.WHILE)
+    assert (res[1].type == TokenType.IDENTIFIER)
+    assert (res[2].type == TokenType.NONE)
+    assert (res[3].type == TokenType.IDENTIFIER)
+
+def test_scanner_trailing_newline():
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    
+    res:list[Token] = Scanner().tokenize(src)
+    
+    assert (res[-3].type == TokenType.NEWLINE)
+    assert (res[-2].type == TokenType.DEDENT)
+    assert (res[-2].value == "4")
+    assert (res[-1].type == TokenType.EOF)
+
+def test_scanner_errors():
+    with pytest.raises(SyntaxError):
+        Scanner().tokenize("def main():\n\tinit()")
+    
+    with pytest.raises(SyntaxError):
+        Scanner().tokenize("def main(): \n    init()")
+    
+    with pytest.raises(SyntaxError):
+        Scanner().tokenize("init() + 2")
+    
+    with pytest.raises(ValueError):
+        Scanner().tokenize("def main():\n    init()\n  init()")
+
+def test_scanner_buffers_match_strings(tmp_path):
+    src:str = ""
+    src = src + "def größe():" + "\n"
+    src = src + "    naïve_2() init()" + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass"
+    
+    expected:list[Token] = Scanner().tokenize(src)
+    
+    # write it out for the mmap path
+    path = tmp_path / "src.py"
+    path.write_bytes(src.encode("utf-8"))
+    
+    for res in (
+        Scanner().tokenize_buffer(src.encode("utf-8")),
+        Scanner().tokenize_buffer(memoryview(src.encode("utf-8"))),
+        Scanner().tokenize_file(path),
+    ):
+        assert (len(res) == len(expected))
+        
+        for i in range(len(res)):
+            assert (res[i].type == expected[i].type)
+            assert (res[i].value == expected[i].value)
+            assert (res[i].line == expected[i].line)
+            assert (res[i].column == expected[i].column)
+
+def test_scanner_buffer_tokens_are_lazy():
+    buffer:bytearray = bytearray(b"def main():\n    init()")
+    res:list[Token] = Scanner().tokenize_buffer(buffer)
+    
+    # identifiers still point into the buffer until they're read
+    assert (isinstance(res[1], lexparse.token.BufferToken))
+    assert ((res[1].start, res[1].end) == (4, 8))
+    
+    buffer[4:8] = b"boot"
+    assert (res[1].value == "boot")
+    
+    # and then they hang onto it
+    buffer[4:8] = b"main"
+    assert (res[1].value == "boot")
+
+def test_scanner_retokenize():
+    old:str = ""
+    old = old + "def main():" + "\n"
+    old = old + "    init()" + "\n"
+    old = old + "\n"
+    old = old + "def init():" + "\n"
+    old = old + "    pass_time()" + "\n"
+    old = old + "def loop():" + "\n"
+    old = old + "    loop()" + "\n"
+    
+    # line 5 turns into two
+    new:str = old.replace("    pass_time()", "    wait()" + "\n" + "        pass_time()")
+    
+    scanner:Scanner = Scanner()
+    tokens:list[Token] = scanner.tokenize(old)
+    untouched:Token = tokens[0]
+    
+    res:list[Token] = scanner.retokenize(tokens, new, 5, 5, 1)
+    expected:list[Token] = Scanner().tokenize(new)
+    
+    assert ([(token.type, token.value, token.line, token.column) for token in res] == [(token.type, token.value, token.line, token.column) for token in expected])
+    
+    # the block in front of the edit wasn't lexed again
+    assert (res[0] is untouched)
+    
+    # only what's around the edit counts as being in it
+    assert (lexparse.scanner.top_level_span(new, 5, 6) == (len("def main():\n    init()\n\n"), new.index("def loop"), 4, 7))
+
+def test_scanner_slices():
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass_time()" + "\n"
+    
+    start:int = src.index("def init")
+    whole:list[Token] = Scanner().tokenize(src)
+    res:list[Token] = list(Scanner().iter_slice(src, start, line=3))
+    
+    # the slice runs to the end, so it ends the same as the whole thing
+    assert ([(token.type, token.value, token.line, token.column) for token in res] == [(token.type, token.value, token.line, token.column) for token in whole[-len(res):]])
+    assert (res[0].line == 3)
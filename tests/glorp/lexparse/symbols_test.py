@@ -0,0 +1,57 @@
+from ... import context
+
+lexparse = context.glorp.lexparse
+
+Lexer = lexparse.lexer.Lexer
+Parser = lexparse.parser.Parser
+Scanner = lexparse.scanner.Scanner
+SymbolTable = lexparse.symbols.SymbolTable
+
+TokenType = lexparse.token.TokenType
+
+
+def test_symbol_table_interns():
+    symbols:SymbolTable = SymbolTable()
+    
+    first:int = symbols.intern("main")
+    second:int = symbols.intern("init")
+    
+    assert (symbols.intern("".join(["ma", "in"])) == first)
+    assert (symbols.intern_bytes(b"init") == second)
+    assert (symbols.name(first) == "main")
+    assert (symbols.lookup("nope") is None)
+    assert ("init" in symbols)
+    assert (len(symbols) == 2)
+
+def test_symbols_shared_through_pipeline():
+    # build a src file
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    main()"
+    
+    symbols:SymbolTable = SymbolTable()
+    
+    # strings, buffers and token buffers should all agree
+    for tokens in (
+        Scanner(symbols).tokenize(src),
+        Scanner(symbols).tokenize_buffer(src.encode("utf-8")),
+        Scanner(symbols).tokenize_compact(src.encode("utf-8")),
+        Lexer().tokenize(src),
+    ):
+        ast = Parser(symbols).parse(tokens)
+        
+        main = ast.body[0]
+        init = ast.body[1]
+        
+        assert (ast.symbols is symbols)
+        assert (main.symbol == symbols.lookup("main"))
+        assert (init.symbol == symbols.lookup("init"))
+        assert (main.body[0].symbol == init.symbol)
+        assert (init.body[0].symbol == main.symbol)
+        
+        # one copy of each name
+        assert (main.name is init.body[0].name)
+    
+    assert (len(symbols) == 2)
@@ -0,0 +1,45 @@
+from ... import context
+
+lexparse = context.glorp.lexparse
+
+Scanner = lexparse.scanner.Scanner
+
+Token = lexparse.token.Token
+TokenType = lexparse.token.TokenType
+TokenBuffer = lexparse.token_buffer.TokenBuffer
+
+
+def _as_tuples(tokens) -> list[tuple]:
+    return [(t.type, t.value, t.line, t.column) for t in tokens]
+
+def test_token_buffer_matches_token_stream():
+    # build a src file
+    src:str = ""
+    src = src + "def größe():" + "\n"
+    src = src + "    naïve_2() init()" + "\n"
+    src = src + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass" + "\n"
+    
+    expected:list[tuple] = _as_tuples(Scanner().tokenize(src))
+    
+    # strings and buffers both
+    for source in (src, src.encode("utf-8"), memoryview(src.encode("utf-8"))):
+        res:TokenBuffer = Scanner().tokenize_compact(source)
+        
+        assert (len(res) == len(expected))
+        assert (_as_tuples(res) == expected)
+
+def test_token_buffer_columns():
+    res:TokenBuffer = Scanner().tokenize_compact("def main():\n    init()")
+    
+    # it's all arrays under the hood
+    assert (res.types.typecode == "B")
+    assert (res.type_of(7) == TokenType.IDENTIFIER)
+    assert ((res.starts[7], res.ends[7]) == (16, 20))
+    assert (res.value_of(7) == "init")
+    assert ((res.line_of(7), res.column_of(7)) == (2, 5))
+    
+    # and tokens come out as slotted objects
+    assert (not hasattr(res[7], "__dict__"))
+    assert (res[-1].type == TokenType.EOF)
@@ -0,0 +1,46 @@
+from ... import context
+
+snes = context.glorp.snes
+
+IRBlock = snes.assembler.IRBlock
+SNESProcessStatusRegister = snes.ram.SNESProcessStatusRegister
+
+
+def function(symbol:str, *code) -> IRBlock:
+    """
+    A function's IR - its label, the code, then RTS.
+    
+    Args:
+        symbol: its label
+        code: label keys as strs, and (mnemonic, mode, operand, target) or
+              (mnemonic, mode, operand, target, size) for instructions
+    """
+    ret = IRBlock()
+    ret.label(symbol)
+    
+    for swp in code:
+        if (isinstance(swp, str)):
+            ret.label(swp)
+        else:
+            mnemonic, mode, operand, target, *size = swp
+            ret.emit(mnemonic, mode, operand, target=target, size=size[0] if size else None)
+    
+    ret.emit("rts")
+    
+    return ret
+
+def listing(block, *fields:str, labels:bool = True) -> list:
+    """Instructions as tuples of the fields asked for - mnemonic and operand if none are - and labels as their keys"""
+    fields = fields or ("mnemonic", "operand")
+    
+    return [
+        tuple(getattr(item, field) for field in fields) if hasattr(item, "mnemonic") else item.key
+        for item in block.items if (labels or hasattr(item, "mnemonic"))
+    ]
+
+def native() -> SNESProcessStatusRegister:
+    """Nothing known but that it's in native mode"""
+    ret = SNESProcessStatusRegister()
+    ret.emulation = 0
+    
+    return ret
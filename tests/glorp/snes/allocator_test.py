@@ -0,0 +1,100 @@
+from ... import context
+
+import random
+
+import pytest
+
+snes = context.glorp.snes
+
+RAMAllocator = snes.allocator.RAMAllocator
+RAMSegment = snes.ram.RAMSegment
+RAMStatus = snes.ram.RAMStatus
+SNESSystemRam = snes.ram.SNESSystemRam
+
+
+def test_allocator_coalesces():
+    allocator:RAMAllocator = RAMAllocator(0x1000, 0x100)
+    
+    first:int = allocator.allocate_any(0x10)
+    second:int = allocator.allocate_any(0x10)
+    third:int = allocator.allocate_any(0x10)
+    
+    assert ((first, second, third) == (0x1000, 0x1010, 0x1020))
+    
+    # a hole in the middle
+    allocator.deallocate(second)
+    report = allocator.report()
+    assert ((report.free_blocks, report.free_bytes, report.largest_free_block) == (2, 0xE0, 0xD0))
+    assert (report.fragmentation > 0)
+    
+    # smallest block that fits gets used
+    assert (allocator.allocate_any(0x8) == 0x1010)
+    allocator.deallocate(0x1010)
+    
+    # and everything merges back up
+    allocator.deallocate(first)
+    allocator.deallocate(third, 0x10)
+    report = allocator.report()
+    assert ((report.free_blocks, report.free_bytes, report.fragmentation) == (1, 0x100, 0.0))
+    
+    with pytest.raises(ValueError):
+        allocator.deallocate(first)
+    
+    with pytest.raises(MemoryError):
+        allocator.allocate_any(0x101)
+
+def test_allocator_constraints():
+    allocator:RAMAllocator = RAMAllocator(0x7EFFF0, 0x100)
+    
+    # the first spot that's aligned and doesn't straddle a bank
+    assert (allocator.allocate_any(0x20, align=0x10) == 0x7F0000)
+    assert (allocator.allocate_any(0x08, align=0x04, boundary=0) == 0x7EFFF0)
+    assert (allocator.allocate_any(0x08, boundary=0) == 0x7EFFF8)
+    
+    allocator.allocate(0x7F0040, 0x10)
+    
+    with pytest.raises(ValueError):
+        allocator.allocate(0x7F0048, 0x10)
+    
+    with pytest.raises(ValueError):
+        allocator.allocate_any(0x20000)
+
+def test_allocator_random():
+    rng = random.Random(1)
+    allocator:RAMAllocator = RAMAllocator(0, 0x10000)
+    used:dict[int, int] = {}
+    
+    for _ in range(2000):
+        if (used and (rng.random() < 0.45)):
+            address:int = rng.choice(list(used))
+            allocator.deallocate(address, used.pop(address))
+        else:
+            length:int = rng.randint(1, 64)
+            
+            try:
+                address:int = allocator.allocate_any(length, align=rng.choice((1, 2, 16)))
+            except MemoryError:
+                continue
+            
+            # nothing handed out twice
+            for other, other_length in used.items():
+                assert (((address + length) <= other) or ((other + other_length) <= address))
+            
+            used[address] = length
+    
+    assert (allocator.report().allocated_bytes == sum(used.values()))
+
+def test_segment_allocate():
+    system:SNESSystemRam = SNESSystemRam()
+    scratch:RAMSegment = system.wram_scratch
+    
+    address:int = scratch.allocate_any(0x10, align=0x100)
+    assert (address == 0x7E2000)
+    assert (scratch.get_byte(address).status == RAMStatus.FILLED)
+    
+    scratch.deallocate(address, 0x10)
+    assert (scratch.get_byte(address + 0xF).status == RAMStatus.EMPTY)
+    assert (scratch.allocator.report().free_blocks == 1)
+    
+    with pytest.raises(IndexError):
+        scratch.allocate(0x7EFFF8, 0x10)
@@ -0,0 +1,84 @@
+from ... import context
+
+import pytest
+
+snes = context.glorp.snes
+
+Assembler = snes.assembler.Assembler
+IRBlock = snes.assembler.IRBlock
+SnesAddressMode = snes.opcodes.SnesAddressMode
+
+
+def test_branches_relax():
+    block:IRBlock = IRBlock()
+    block.label("top")
+    block.emit("nop")
+    block.emit("beq", SnesAddressMode.RELATIVE, target="top")
+    block.emit("bne", SnesAddressMode.RELATIVE, target="far")
+    block.data(bytes(200))
+    block.label("far")
+    block.emit("bra", SnesAddressMode.RELATIVE, target="top")
+    block.emit("jmp", SnesAddressMode.ABSOLUTE, target="elsewhere")
+    
+    swp = Assembler({"elsewhere": 0x028000}).assemble(block, 0x008000)
+    
+    assert (swp.labels == {"top": 0x8000, "far": 0x80D0})
+    
+    # close enough for 8 bits
+    assert (swp.code[1:3] == b"\xF0\xFD")
+    
+    # too far, so it's the opposite branch over a jmp
+    assert (swp.code[3:8] == b"\xF0\x03\x4C\xD0\x80")
+    
+    # a bra that can't reach is a jmp, and a jmp to another bank is a jml
+    assert (swp.code[0xD0:] == b"\x4C\x00\x80\x5C\x00\x80\x02")
+    assert (swp.passes > 1)
+
+def test_short_jumps_stay_short():
+    block:IRBlock = IRBlock()
+    block.emit("jml", SnesAddressMode.ABSOLUTE_LONG, target="next")
+    block.label("next")
+    block.emit("jmp", SnesAddressMode.ABSOLUTE, target="next", relax=False)
+    
+    assert (Assembler().assemble(block, 0x008000).code == b"\x80\x00\x4C\x02\x80")
+
+def test_data_accesses_relax():
+    block:IRBlock = IRBlock()
+    block.emit("lda", SnesAddressMode.ABSOLUTE, 0x0012)
+    block.emit("lda", SnesAddressMode.ABSOLUTE_LONG, 0x7E0012)
+    block.emit("lda", SnesAddressMode.ABSOLUTE_LONG, 0x002100)
+    block.emit("lda", SnesAddressMode.ABSOLUTE_LONG, 0x801234)
+    block.emit("sta", SnesAddressMode.ABSOLUTE_LONG_INDEXED_BY_X, 0x001234)
+    
+    # nothing known, so nothing moves
+    assert (len(Assembler().assemble(block, 0x008000).code) == 3 + 4 + 4 + 4 + 4)
+    
+    # D = $0000, DBR = $00
+    swp:bytearray = Assembler(direct_page=0x0000, data_bank=0x00).assemble(block, 0x008000).code
+    assert (swp == b"\xA5\x12" + b"\xAF\x12\x00\x7E" + b"\xAD\x00\x21" + b"\xAD\x34\x12" + b"\x9D\x34\x12")
+
+def test_assembler_errors():
+    block:IRBlock = IRBlock()
+    block.emit("bra", SnesAddressMode.RELATIVE, target="nowhere")
+    
+    with pytest.raises(ValueError):
+        Assembler().assemble(block, 0x008000)
+    
+    with pytest.raises(ValueError):
+        IRBlock().emit("lda", SnesAddressMode.IMMEDIATE, 0x12)
+    
+    block = IRBlock()
+    block.label("twice")
+    block.label("twice")
+    
+    with pytest.raises(ValueError):
+        Assembler().assemble(block, 0x008000)
+    
+    # JSR only has 16 bits, and JSL would need the callee to RTL
+    block = IRBlock()
+    block.emit("jsr", SnesAddressMode.ABSOLUTE, target="far")
+    
+    with pytest.raises(ValueError):
+        Assembler({"far": 0x018000}).assemble(block, 0x008000)
+    
+    assert (Assembler({"far": 0x009000}).assemble(block, 0x008000).code == b"\x20\x00\x90")
@@ -0,0 +1,227 @@
+from ... import context
+
+import pytest
+
+lexparse = context.glorp.lexparse
+snes = context.glorp.snes
+
+Parser = lexparse.parser.Parser
+Scanner = lexparse.scanner.Scanner
+SymbolTable = lexparse.symbols.SymbolTable
+
+SnesAddressMode = snes.opcodes.SnesAddressMode
+SnesCompiler = snes.compiler.SnesCompiler
+
+
+def _compiler_for(src:str) -> SnesCompiler:
+    symbols:SymbolTable = SymbolTable()
+    ast = Parser(symbols).parse(Scanner(symbols).tokenize(src))
+    return SnesCompiler(ast)
+
+def test_compiler_indexes_by_symbol():
+    # build a src file
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    init()" + "\n"
+    src = src + "    main()" + "\n"
+    src = src + "def init():" + "\n"
+    src = src + "    pass_time()"
+    
+    compiler:SnesCompiler = _compiler_for(src)
+    functions = compiler.helper_index_functions()
+    
+    main:int = compiler.symbols.lookup("main")
+    init:int = compiler.symbols.lookup("init")
+    
+    assert (set(functions) == {main, init})
+    assert (functions[main].name == "main")
+    
+    graph = compiler.helper_call_graph()
+    
+    assert (graph[main] == {main, init})
+    assert (graph[init] == {compiler.symbols.lookup("pass_time")})
+
+def test_compiler_labels():
+    compiler:SnesCompiler = _compiler_for("def main():\n    init()")
+    main:int = compiler.symbols.lookup("main")
+    
+    compiler.rom.current_address = 0x8000
+    compiler.helper_label(main)
+    
+    assert (compiler.labels[main] == 0x8000)
+
+def test_compiler_builtin_init():
+    compiler:SnesCompiler = SnesCompiler()
+    compiler.rom.current_address = 0x8000
+    compiler.builtin_init()
+    
+    # sei, clc, xce, rep #$30, lda #$0000, sep #$20, lda #$80, sta $2100,
+    # stz $4200 (from lda #$00, sta $4200), wait: lda $7E0200, beq wait, lda #$00,
+    # sta $7E0200, jml $018000
+    expected:bytes = bytes.fromhex("78 18 FB C2 30 A9 00 00 E2 20 A9 80 8D 00 21 9C 00 42 AF 00 02 7E F0 FA A9 00 8F 00 02 7E 5C 00 80 01")
+    assert (bytes(compiler.rom._bin[0x8000:compiler.rom.current_address]) == expected)
+    
+    # and it knows it's in native mode with a 8 bit A, 16 bit index
+    status = compiler.ram._cpu_registers._processor_status
+    assert (status.emulation == 0)
+    assert (status.accumulator_width == 1)
+    assert (status.index_width == 2)
+
+def test_compiler_labels_resolve_at_the_end_of_the_segment():
+    compiler:SnesCompiler = SnesCompiler()
+    compiler.rom.current_address = 0x8000
+    done:int = compiler.symbols.intern("done")
+    
+    compiler.helper_start_segment("test")
+    compiler.asm("bra", SnesAddressMode.RELATIVE, target=done)
+    compiler.asm("nop")
+    compiler.helper_label(done)
+    compiler.asm("nop")
+    
+    assert (done not in compiler.labels)
+    compiler.helper_end_segment("test")
+    
+    assert (compiler.labels[done] == 0x8003)
+    assert (bytes(compiler.rom._bin[0x8000:compiler.rom.current_address]) == b"\x80\x01\xEA\xEA")
+
+def test_compiler_assembles_with_what_it_knows_of_d_and_dbr():
+    compiler:SnesCompiler = SnesCompiler()
+    compiler.rom.current_address = 0x8000
+    registers = compiler.ram._cpu_registers
+    
+    compiler.helper_start_segment("test")
+    registers._direct_page = 0x0000
+    registers._data_bank = 0x00
+    compiler.asm("lda", SnesAddressMode.ABSOLUTE, 0x0012)
+    compiler.helper_end_segment("test")
+    assert (bytes(compiler.rom._bin[0x8000:compiler.rom.current_address]) == b"\xA5\x12")
+    
+    # moving D anywhere in the segment means it's not known for any of it
+    compiler.helper_start_segment("test")
+    registers._direct_page = 0x0000
+    registers._data_bank = 0x00
+    compiler.asm("lda", SnesAddressMode.ABSOLUTE, 0x0012)
+    compiler.asm("tcd")
+    compiler.helper_end_segment("test")
+    assert (bytes(compiler.rom._bin[0x8002:compiler.rom.current_address]) == b"\xAD\x12\x00\x5B")
+    
+    # and block moves leave DBR at the destination bank, so long loads stay long
+    start:int = compiler.rom.current_address
+    compiler.helper_start_segment("test")
+    registers._direct_page = 0x0000
+    registers._data_bank = 0x00
+    compiler.asm("mvn", SnesAddressMode.BLOCK_MOVE, 0x007E)
+    compiler.asm("lda", SnesAddressMode.ABSOLUTE_LONG, 0x001234)
+    compiler.helper_end_segment("test")
+    assert (bytes(compiler.rom._bin[start:compiler.rom.current_address]) == b"\x54\x7E\x00\xAF\x34\x12\x00")
+
+def test_compiler_functions_are_summarized():
+    compiler:SnesCompiler = _compiler_for("def main():\n    tick()\n    tock()\ndef tock():\n    tick()\ndef tick():\n    tock()\n")
+    compiler.helper_index_functions()
+    compiler.rom.current_address = 0x018000
+    compiler.inliner = None
+    compiler.folder = None
+    
+    main:int = compiler.symbols.lookup("main")
+    tick:int = compiler.symbols.lookup("tick")
+    tock:int = compiler.symbols.lookup("tock")
+    
+    entry = snes.ram.SNESProcessStatusRegister()
+    entry.emulation = 0
+    entry.sep(0x20)
+    compiler.helper_compile_functions(entry)
+    
+    # main first, then the rest in order, each a JSR per call and an RTS
+    assert (compiler.labels[main] == 0x018000)
+    assert (compiler.labels[tock] == 0x018007)
+    assert (compiler.labels[tick] == 0x01800B)
+    assert (bytes(compiler.rom._bin[0x018000:compiler.rom.current_address]) == bytes.fromhex("20 0B 80 20 07 80 60 20 0B 80 60 20 07 80 60"))
+    
+    # they only ever call each other, so they come in how main left things
+    assert (compiler.summaries[tick].entry.accumulator_width == 1)
+    assert (compiler.summaries[tock].entry.accumulator_width == 1)
+    
+    # and calling one doesn't make the compiler forget
+    compiler.ram._cpu_registers._processor_status.restore(entry)
+    compiler.asm_jsr(tick)
+    assert (compiler.ram._cpu_registers._processor_status.accumulator_width == 1)
+
+def test_compiler_leaves_out_dead_functions():
+    src:str = ""
+    src = src + "def main():" + "\n"
+    src = src + "    used()" + "\n"
+    src = src + "def unused():" + "\n"
+    src = src + "    library()" + "\n"
+    src = src + "def library():" + "\n"
+    src = src + "    not_even_defined()" + "\n"
+    src = src + "def used():" + "\n"
+    src = src + "    used()" + "\n"
+    src = src + "def nmi():" + "\n"
+    src = src + "    used()" + "\n"
+    
+    compiler:SnesCompiler = _compiler_for(src)
+    compiler.helper_index_functions()
+    compiler.rom.current_address = 0x018000
+    compiler.inliner = None
+    compiler.folder = None
+    
+    live:set[int] = compiler.helper_reachable()
+    assert (live == {compiler.symbols.lookup(name) for name in ("main", "used", "nmi")})
+    
+    # the dead ones aren't even turned into code, so their bad call's fine
+    compiler.helper_compile_functions()
+    assert (compiler.dead_functions == {compiler.symbols.lookup("unused"), compiler.symbols.lookup("library")})
+    assert (compiler.symbols.lookup("unused") not in compiler.labels)
+    assert (compiler.rom.current_address == 0x018000 + (3 * 4))
+    
+    # starting from somewhere else
+    assert (compiler.helper_reachable([compiler.symbols.lookup("unused")]) == {compiler.symbols.lookup("unused"), compiler.symbols.lookup("library")})
+
+def test_compiler_inlines_small_functions():
+    compiler:SnesCompiler = _compiler_for("def main():\n    helper()\n    helper()\ndef helper():\n    loop()\ndef loop():\n    loop()\n")
+    compiler.helper_index_functions()
+    compiler.rom.current_address = 0x018000
+    compiler.helper_compile_functions()
+    
+    # helper's gone into main, and the calls before returns are jumps now -
+    # near enough to be branches, even
+    assert (compiler.symbols.lookup("helper") not in compiler.labels)
+    assert (compiler.labels[compiler.symbols.lookup("loop")] == 0x018005)
+    assert (bytes(compiler.rom._bin[0x018000:compiler.rom.current_address]) == bytes.fromhex("20 05 80 80 00 80 FE"))
+    assert (compiler.inliner.stats.inlined == 2)
+    assert (compiler.inliner.stats.tail_calls == 2)
+
+def test_compiler_folds_copies():
+    compiler:SnesCompiler = _compiler_for("def main():\n    a()\n    b()\ndef a():\n    loop()\ndef b():\n    loop()\ndef loop():\n    loop()\n")
+    compiler.helper_index_functions()
+    compiler.rom.current_address = 0x018000
+    compiler.inliner = None
+    compiler.helper_compile_functions()
+    
+    # b's the same as a, so it's a's code, under both names
+    a:int = compiler.symbols.lookup("a")
+    b:int = compiler.symbols.lookup("b")
+    assert (compiler.labels[a] == compiler.labels[b] == 0x018007)
+    assert (compiler.summaries[b] is compiler.summaries[a])
+    
+    # and loop ends just like a does, so it goes there to do it
+    assert (bytes(compiler.rom._bin[0x018000:compiler.rom.current_address]) == bytes.fromhex("20 07 80 20 07 80 60 20 0B 80 60 80 FA"))
+    assert (compiler.folder.stats.functions == 1)
+    assert (compiler.folder.stats.tails == 1)
+
+def test_compiler_interrupt_handlers_return_with_rti():
+    compiler:SnesCompiler = _compiler_for("def main():\n    main()\ndef nmi():\n    main()\n")
+    compiler.helper_index_functions()
+    compiler.rom.current_address = 0x018000
+    compiler.helper_compile_functions()
+    
+    # main's last call is a jump now, but nmi's has to come back for the RTI
+    assert (compiler.labels[compiler.symbols.lookup("nmi")] == 0x018002)
+    assert (bytes(compiler.rom._bin[0x018000:compiler.rom.current_address]) == bytes.fromhex("80 FE 20 00 80 40"))
+    
+    # and nothing gets to call one
+    compiler = _compiler_for("def main():\n    nmi()\ndef nmi():\n    main()\n")
+    compiler.helper_index_functions()
+    
+    with pytest.raises(ValueError):
+        compiler.helper_compile_functions()
@@ -0,0 +1,151 @@
+from ... import context
+from . import (
+    listing,
+    native,
+)
+
+import pytest
+
+snes = context.glorp.snes
+
+IRBlock = snes.assembler.IRBlock
+SnesAddressMode = snes.opcodes.SnesAddressMode
+WidthFlow = snes.flow.WidthFlow
+basic_blocks = snes.flow.basic_blocks
+
+IMM = SnesAddressMode.IMMEDIATE
+ABS = SnesAddressMode.ABSOLUTE
+REL = SnesAddressMode.RELATIVE
+
+
+def test_basic_blocks():
+    block = IRBlock()
+    block.emit("nop")
+    block.label("loop")
+    block.emit("dex")
+    block.emit("bne", REL, target="loop")
+    block.emit("rts")
+    block.label("other")
+    block.emit("nop")
+    
+    blocks = basic_blocks(block.items)
+    assert ([(basic.start, basic.end) for basic in blocks] == [(0, 1), (1, 4), (4, 5), (5, 7)])
+    assert ([basic.successors for basic in blocks] == [[1], [1, 2], [], []])
+    
+    # nothing in here goes to "other", so something outside must
+    assert ([basic.entry for basic in blocks] == [True, False, False, True])
+
+def test_redundant_switches_go():
+    block = IRBlock()
+    block.emit("rep", IMM, 0x30)
+    block.emit("lda", IMM, 0x1234, size=2)
+    block.emit("rep", IMM, 0x20)
+    block.emit("ldx", IMM, 0x5678, size=2)
+    block.emit("sep", IMM, 0x30)
+    block.emit("sep", IMM, 0x20)
+    block.emit("lda", IMM, 0x12, size=1)
+    
+    flow = WidthFlow(native())
+    flow.optimize(block)
+    assert (listing(block) == [("rep", 0x30), ("lda", 0x1234), ("ldx", 0x5678), ("sep", 0x30), ("lda", 0x12)])
+    assert (flow.stats.removed == 2)
+    assert (flow.stats.bytes_saved == 4)
+    assert (flow.stats.cycles_saved == 6)
+
+def test_switches_go_in_where_widths_are_unknown():
+    block = IRBlock()
+    block.emit("lda", IMM, 0x12, size=1)
+    block.emit("ldy", IMM, 0x1234, size=2)
+    block.emit("sta", ABS, 0x2100)
+    block.emit("lda", IMM, 0x34, size=1)
+    block.emit("rep", IMM, 0x31)
+    
+    flow = WidthFlow(native())
+    flow.optimize(block)
+    
+    # carry isn't known, so that bit of the last one stays
+    assert (listing(block) == [("sep", 0x20), ("lda", 0x12), ("rep", 0x10), ("ldy", 0x1234), ("sta", 0x2100), ("lda", 0x34), ("rep", 0x21)])
+    assert (flow.stats.inserted == 2)
+    assert (flow.stats.trimmed == 1)
+
+def test_widths_join_through_branches():
+    # both ways into "join" leave A 8 bit
+    block = IRBlock()
+    block.emit("sep", IMM, 0x20)
+    block.emit("beq", REL, target="join")
+    block.emit("rep", IMM, 0x10)
+    block.label("join")
+    block.emit("sep", IMM, 0x20)
+    block.emit("lda", IMM, 0x12, size=1)
+    
+    WidthFlow(native()).optimize(block)
+    assert (listing(block) == [("sep", 0x20), ("beq", 0), ("rep", 0x10), "join", ("lda", 0x12)])
+    
+    # but not when one of them doesn't
+    block = IRBlock()
+    block.emit("sep", IMM, 0x20)
+    block.emit("beq", REL, target="join")
+    block.emit("rep", IMM, 0x20)
+    block.label("join")
+    block.emit("lda", IMM, 0x12, size=1)
+    
+    WidthFlow(native()).optimize(block)
+    assert (listing(block) == [("sep", 0x20), ("beq", 0), ("rep", 0x20), "join", ("sep", 0x20), ("lda", 0x12)])
+    
+    # loops come round with what the end of the body leaves
+    block = IRBlock()
+    block.emit("sep", IMM, 0x20)
+    block.label("loop")
+    block.emit("sep", IMM, 0x20)
+    block.emit("lda", IMM, 0x12, size=1)
+    block.emit("dex")
+    block.emit("bne", REL, target="loop")
+    
+    WidthFlow(native()).optimize(block)
+    assert (listing(block) == [("sep", 0x20), "loop", ("lda", 0x12), ("dex", 0), ("bne", 0)])
+
+def test_calls_and_outside_labels_forget():
+    block = IRBlock()
+    block.emit("sep", IMM, 0x20)
+    block.emit("jsr", ABS, target="somewhere")
+    block.emit("sep", IMM, 0x20)
+    block.emit("rts")
+    block.label("outside")
+    block.emit("sep", IMM, 0x20)
+    block.label("also_outside")
+    block.emit("sep", IMM, 0x20)
+    
+    WidthFlow(native()).optimize(block)
+    assert (listing(block) == [("sep", 0x20), ("jsr", 0), ("sep", 0x20), ("rts", 0), "outside", ("sep", 0x20), "also_outside", ("sep", 0x20)])
+    
+    # unless it's told what's known there
+    block = IRBlock()
+    block.emit("rts")
+    block.label("outside")
+    block.emit("sep", IMM, 0x20)
+    known = native()
+    known.memory_accumulator_select = 1
+    
+    WidthFlow(entries={"outside": known}).optimize(block)
+    assert (listing(block) == [("rts", 0), "outside"])
+
+def test_emulation_mode():
+    block = IRBlock()
+    block.emit("sec")
+    block.emit("xce")
+    block.emit("sep", IMM, 0x30)
+    block.emit("rep", IMM, 0x28)
+    block.emit("clc")
+    block.emit("xce")
+    block.emit("rep", IMM, 0x20)
+    block.emit("lda", IMM, 0x1234, size=2)
+    
+    WidthFlow().optimize(block)
+    assert (listing(block) == [("sec", 0), ("xce", 0), ("rep", 0x08), ("clc", 0), ("xce", 0), ("rep", 0x20), ("lda", 0x1234)])
+    
+    # 16 bit needs native mode, and nothing here says it is
+    block = IRBlock()
+    block.emit("lda", IMM, 0x1234, size=2)
+    
+    with pytest.raises(ValueError):
+        WidthFlow().optimize(block)
@@ -0,0 +1,117 @@
+from ... import context
+from . import (
+    function,
+    listing,
+)
+
+import pytest
+
+snes = context.glorp.snes
+
+Assembler = snes.assembler.Assembler
+Folder = snes.folding.Folder
+IRBlock = snes.assembler.IRBlock
+SnesAddressMode = snes.opcodes.SnesAddressMode
+function_key = snes.folding.function_key
+
+ABS = SnesAddressMode.ABSOLUTE
+IMM = SnesAddressMode.IMMEDIATE
+REL = SnesAddressMode.RELATIVE
+IMP = SnesAddressMode.IMPLIED
+
+
+def test_keys_ignore_names():
+    left = function("left", "loop", ("dex", IMP, 0, None), ("bne", REL, 0, "loop"), ("jsr", ABS, 0, "left"))
+    right = function("right", "again", ("dex", IMP, 0, None), ("bne", REL, 0, "again"), ("jsr", ABS, 0, "right"))
+    other = function("other", "again", ("dex", IMP, 0, None), ("bne", REL, 0, "again"), ("jsr", ABS, 0, "left"))
+    assert (function_key("left", left) == function_key("right", right))
+    assert (function_key("left", left) != function_key("other", other))
+
+def test_copies_fold_into_one():
+    blocks = {
+        "main": function("main",
+            ("jsr", ABS, 0, "first"),
+            ("jsr", ABS, 0, "second"),
+        ),
+        "first": function("first", ("jsr", ABS, 0, "one")),
+        "second": function("second", ("jsr", ABS, 0, "two")),
+        "one": function("one", ("inc", ABS, 0x10, None)),
+        "two": function("two", ("inc", ABS, 0x10, None)),
+        "nmi": function("nmi",
+            ("jsr", ABS, 0, "second"),
+            ("jsr", ABS, 0, "first"),
+        ),
+    }
+    
+    folder = Folder()
+    aliases = folder.fold_functions(blocks, ["main", "nmi"])
+    
+    # one and two being the same makes first and second the same, and then
+    # nmi's the same as main
+    assert (aliases == {"two": "one", "second": "first", "nmi": "main"})
+    assert (list(blocks) == ["main", "first", "one"])
+    assert (listing(blocks["main"], "mnemonic", "operand", "target") == ["main", "nmi", ("jsr", 0, "first"), ("jsr", 0, "first"), ("rts", 0, None)])
+    assert (listing(blocks["first"], "mnemonic", "operand", "target") == ["first", "second", ("jsr", 0, "one"), ("rts", 0, None)])
+    assert (folder.stats.functions == 3)
+    assert (folder.stats.bytes_saved == 4 + 4 + 7)
+
+def test_tails_are_shared():
+    block = IRBlock()
+    block.label("first")
+    block.emit("lda", IMM, 0x12, size=1)
+    block.emit("sta", ABS, 0x2100)
+    block.emit("stz", ABS, 0x2101)
+    block.emit("rts")
+    block.label("second")
+    block.emit("lda", IMM, 0x34, size=1)
+    block.emit("sta", ABS, 0x2100)
+    block.emit("stz", ABS, 0x2101)
+    block.emit("rts")
+    block.label("short")
+    block.emit("stz", ABS, 0x2101)
+    block.emit("rts")
+    block.label("shorter")
+    block.emit("rts")
+    
+    folder = Folder()
+    folder.fold_tails(block)
+    res = listing(block, "mnemonic", "operand", "target")
+    shared, short = res[2], res[4]
+    assert (res == [
+        "first", ("lda", 0x12, None), shared, ("sta", 0x2100, None), short, ("stz", 0x2101, None), ("rts", 0, None),
+        "second", ("lda", 0x34, None), ("brl", 0, shared),
+        "short", ("brl", 0, short),
+        "shorter", ("rts", 0, None),
+    ])
+    
+    # a lone RTS is smaller than the jump
+    assert (folder.stats.tails == 2)
+    assert (folder.stats.bytes_saved == (7 - 3) + (4 - 3))
+    
+    # and they're near enough to only need branches
+    assembled = Assembler({}).assemble(block, 0x8000)
+    assert (assembled.code == bytes.fromhex("A9 12 8D 00 21 9C 01 21 60 A9 34 80 F5 80 F6 60"))
+
+def test_tails_stay_in_the_bank():
+    def block():
+        ret = IRBlock()
+        ret.label("first")
+        ret.emit("lda", IMM, 0x12, size=1)
+        ret.emit("sta", ABS, 0x2100)
+        ret.emit("stz", ABS, 0x2101)
+        ret.emit("rts")
+        ret.label("second")
+        ret.emit("lda", IMM, 0x34, size=1)
+        ret.emit("sta", ABS, 0x2100)
+        ret.emit("stz", ABS, 0x2101)
+        ret.emit("rts")
+        
+        Folder().fold_tails(ret)
+        
+        return ret
+    
+    # first's tail is the end of bank 1, second starts bank 2
+    with pytest.raises(ValueError):
+        Assembler({}).assemble(block(), 0x01FFF7)
+    
+    assert (Assembler({}).assemble(block(), 0x01FFF0).code == bytes.fromhex("A9 12 8D 00 21 9C 01 21 60 A9 34 80 F5"))
@@ -0,0 +1,194 @@
+from ... import context
+from . import (
+    function,
+    listing,
+)
+
+import pytest
+
+snes = context.glorp.snes
+
+Assembler = snes.assembler.Assembler
+IRBlock = snes.assembler.IRBlock
+Inliner = snes.inliner.Inliner
+SnesAddressMode = snes.opcodes.SnesAddressMode
+
+ABS = SnesAddressMode.ABSOLUTE
+REL = SnesAddressMode.RELATIVE
+IMP = SnesAddressMode.IMPLIED
+
+
+def test_small_functions_are_pasted_in():
+    blocks = {
+        "main": function("main",
+            ("jsr", ABS, 0, "bump"),
+            ("jsr", ABS, 0, "bump"),
+            ("lda", ABS, 0x10, None),
+        ),
+        "bump": function("bump",
+            ("inc", ABS, 0x10, None),
+        ),
+    }
+    
+    inliner = Inliner()
+    blocks = inliner.inline(blocks, {"main"})
+    assert (list(blocks) == ["main"])
+    assert (listing(blocks["main"], "mnemonic", "target") == [("main"), ("inc", None), ("inc", None), ("lda", None), ("rts", None)])
+    
+    # two calls' JSR and RTS, and the function itself, for nothing
+    assert (inliner.stats.inlined == 2)
+    assert (inliner.stats.removed == 1)
+    assert (inliner.stats.cycles_saved == 24)
+    assert (inliner.stats.bytes_saved == 4)
+
+def test_budget_and_size_limits():
+    body = [("inc", ABS, 0x10, None)] * 3
+    
+    def blocks():
+        return {
+            "main": function("main", *([("jsr", ABS, 0, "bump")] * 4), ("nop", IMP, 0, None)),
+            "bump": function("bump", *body),
+        }
+    
+    # each call grows by 6 bytes, 24 in all, less the 10 bump goes away with
+    inliner = Inliner(budget=13)
+    assert (list(inliner.inline(blocks(), {"main"})) == ["main", "bump"])
+    assert (inliner.stats.inlined == 0)
+    
+    inliner = Inliner(budget=14)
+    assert (list(inliner.inline(blocks(), {"main"})) == ["main"])
+    assert (inliner.stats.bytes_saved == -14)
+    
+    inliner = Inliner(max_size=8)
+    assert (list(inliner.inline(blocks(), {"main"})) == ["main", "bump"])
+
+def test_recursion_is_left_alone():
+    blocks = {
+        "main": function("main",
+            ("jsr", ABS, 0, "even"),
+            ("nop", IMP, 0, None),
+        ),
+        "even": function("even",
+            ("jsr", ABS, 0, "odd"),
+            ("nop", IMP, 0, None),
+        ),
+        "odd": function("odd",
+            ("jsr", ABS, 0, "even"),
+            ("nop", IMP, 0, None),
+        ),
+    }
+    
+    inliner = Inliner()
+    assert (list(inliner.inline(blocks, {"main"})) == ["main", "even", "odd"])
+    assert (inliner.stats.inlined == 0)
+
+def test_labels_are_kept_apart():
+    blocks = {
+        "main": function("main",
+            ("jsr", ABS, 0, "wait"),
+            ("jsr", ABS, 0, "wait"),
+            ("nop", IMP, 0, None),
+        ),
+        "wait": function("wait",
+            "loop",
+            ("dex", IMP, 0, None),
+            ("bne", REL, 0, "loop"),
+        ),
+    }
+    
+    blocks = Inliner().inline(blocks, {"main"})
+    res = listing(blocks["main"], "mnemonic", "target")
+    first, second = res[1], res[4]
+    assert (first != second)
+    assert (res == ["main", first, ("dex", None), ("bne", first), second, ("dex", None), ("bne", second), ("nop", None), ("rts", None)])
+
+def test_calls_before_returns_become_jumps():
+    blocks = {
+        "main": function("main",
+            ("jsr", ABS, 0, "far"),
+            ("jsl", SnesAddressMode.ABSOLUTE_LONG, 0, "far"),
+        ),
+        "far": function("far",
+            ("jsr", ABS, 0, "far"),
+            ("jsr", ABS, 0, "far"),
+        ),
+    }
+    
+    inliner = Inliner()
+    blocks = inliner.inline(blocks, {"main"})
+    
+    # a JSL's return is an RTL, so that one has to stay
+    assert (listing(blocks["main"], "mnemonic", "target") == ["main", ("jsr", "far"), ("jsl", "far"), ("rts", None)])
+    assert (listing(blocks["far"], "mnemonic", "target") == ["far", ("jsr", "far"), ("brl", "far")])
+    assert (inliner.stats.tail_calls == 1)
+    assert (inliner.stats.bytes_saved == 1)
+    assert (inliner.stats.cycles_saved == 9)
+
+def test_tail_calls_stay_in_the_bank():
+    blocks = {
+        "main": function("main",
+            ("nop", IMP, 0, None),
+            ("jsr", ABS, 0, "f"),
+        ),
+    }
+    
+    blocks = Inliner().inline(blocks, {"main"})
+    
+    # the RTS at the end of f would come back to f's bank, not this one
+    with pytest.raises(ValueError):
+        Assembler({"f": 0x028000}).assemble(blocks["main"], 0x01FFF0)
+    
+    # but in the same bank it's as short as it can be
+    assert (Assembler({"f": 0x018000}).assemble(blocks["main"], 0x01FFF0).code == bytes.fromhex("EA 4C 00 80"))
+    assert (Assembler({"f": 0x01FFF0}).assemble(blocks["main"], 0x01FFF0).code == bytes.fromhex("EA 80 FD"))
+
+def test_functions_still_pointed_at_stay():
+    blocks = {
+        "main": function("main",
+            ("jsr", ABS, 0, "g"),
+            ("jmp", ABS, 0, "f"),
+        ),
+        "g": function("g",
+            ("jsr", ABS, 0, "f"),
+            ("nop", IMP, 0, None),
+        ),
+        "f": function("f",
+            ("inx", IMP, 0, None),
+        ),
+    }
+    
+    inliner = Inliner()
+    blocks = inliner.inline(blocks, {"main"})
+    
+    # g goes, but main still jumps to f
+    assert (list(blocks) == ["main", "f"])
+    assert (inliner.stats.removed == 1)
+    
+    block = IRBlock()
+    
+    for swp in blocks.values():
+        block.items.extend(swp.items)
+    
+    Assembler().assemble(block, 0x008000)
+    
+    # and going over it again changes nothing
+    assert (list(Inliner().inline(blocks, {"main"})) == ["main", "f"])
+
+def test_stack_tricks_stay_put():
+    def blocks(*code):
+        return {
+            "main": function("main", ("jsr", ABS, 0, "f"), ("nop", IMP, 0, None)),
+            "f": function("f", *code),
+        }
+    
+    # the return address is what's at 1,s in there
+    for code in (
+        [("lda", SnesAddressMode.STACK_RELATIVE, 1, None)],
+        [("tsx", IMP, 0, None)],
+        [("pla", IMP, 0, None), ("pha", IMP, 0, None)],
+        [("pha", IMP, 0, None)],
+    ):
+        assert (list(Inliner().inline(blocks(*code), {"main"})) == ["main", "f"])
+    
+    # but a push and its pull are fine
+    assert (list(Inliner().inline(blocks(("pha", IMP, 0, None), ("pla", IMP, 0, None)), {"main"})) == ["main"])
@@ -0,0 +1,55 @@
+from ... import context
+
+import pickle
+
+import pytest
+
+snes = context.glorp.snes
+
+MemoryImage = snes.memory_image.MemoryImage
+SNESMemoryMap = snes.memory.SNESMemoryMap
+SNESSystemRam = snes.ram.SNESSystemRam
+RAMStatus = snes.ram.RAMStatus
+write_image = snes.memory_image.write_image
+
+
+def test_image_round_trip(tmp_path):
+    path = tmp_path / "memory.img"
+    ram:SNESSystemRam = SNESSystemRam()
+    ram.wram_scratch.write(0x7E2000, b"\x12\x34")
+    ram.all.write(0x808000, b"\xEA")
+    
+    write_image(path, ram.memory)
+    image:MemoryImage = MemoryImage(path)
+    loaded:SNESSystemRam = SNESSystemRam.from_image(image)
+    fresh:SNESMemoryMap = SNESMemoryMap()
+    
+    # same map
+    for address in (0x000000, 0x002100, 0x004016, 0x004300, 0x7E1234, 0x7FFFFF, 0x808000, 0xC00000, 0xFF0000):
+        store, index = loaded.memory.locate(address)
+        assert (loaded.memory.region(address) == fresh.region(address))
+        assert (index == fresh.locate(address)[1])
+    
+    # same contents
+    assert (bytes(loaded.all.read(0x7E2000, 3)) == b"\x12\x34\x00")
+    assert (loaded.all.get_byte(0x008000).value == 0xEA)
+    assert (loaded.all.get_byte(0x7E2001).status == RAMStatus.FILLED)
+    assert (loaded.all.get_byte(0x7E2002).status == RAMStatus.UNKNOWN)
+    
+    # writes copy the page, so other maps off the same image don't see them
+    loaded.all.write(0x7E2000, b"\x99")
+    other:SNESSystemRam = SNESSystemRam.from_image(image)
+    assert (loaded.all.get_byte(0x7E2000).value == 0x99)
+    assert (other.all.get_byte(0x7E2000).value == 0x12)
+    
+    # workers get the path and map it themselves
+    swp:MemoryImage = pickle.loads(pickle.dumps(image))
+    assert (swp.path == image.path)
+    assert (len(swp.pages) == len(image.pages))
+
+def test_image_rejects_junk(tmp_path):
+    path = tmp_path / "junk.img"
+    path.write_bytes(b"not an image at all, no sir")
+    
+    with pytest.raises(ValueError):
+        MemoryImage(path)
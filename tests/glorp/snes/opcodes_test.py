@@ -0,0 +1,55 @@
+from ... import context
+
+import pytest
+
+snes = context.glorp.snes
+
+opcodes = snes.opcodes
+
+SnesAddressMode = opcodes.SnesAddressMode
+SNESProcessStatusRegister = snes.ram.SNESProcessStatusRegister
+
+
+def test_opcode_table_is_complete():
+    assert (len(opcodes.OPCODES) == 256)
+    assert ([op.opcode for op in opcodes.OPCODES] == list(range(256)))
+    assert (sum(len(modes) for modes in opcodes.OPCODES_BY_MNEMONIC_THEN_MODE.values()) == 256)
+    
+    # the ones the compiler used to get wrong
+    assert (opcodes.lookup("rep", SnesAddressMode.IMMEDIATE).opcode == 0xC2)
+    assert (opcodes.lookup("sep", SnesAddressMode.IMMEDIATE).opcode == 0xE2)
+    assert (opcodes.lookup("sta", SnesAddressMode.ABSOLUTE_LONG).opcode == 0x8F)
+    assert (opcodes.lookup("lda", SnesAddressMode.ABSOLUTE_LONG).opcode == 0xAF)
+    assert (opcodes.lookup("jsl", SnesAddressMode.ABSOLUTE_LONG).cycles == 8)
+    
+    with pytest.raises(ValueError):
+        opcodes.lookup("sta", SnesAddressMode.IMMEDIATE)
+
+def test_encode():
+    assert (opcodes.encode("nop", SnesAddressMode.IMPLIED) == b"\xEA")
+    assert (opcodes.encode("sta", SnesAddressMode.ABSOLUTE, 0x2100) == b"\x8D\x00\x21")
+    assert (opcodes.encode("jml", SnesAddressMode.ABSOLUTE_LONG, 0x018000) == b"\x5C\x00\x80\x01")
+    assert (opcodes.encode("beq", SnesAddressMode.RELATIVE, -5) == b"\xF0\xFB")
+    assert (opcodes.encode("brl", SnesAddressMode.RELATIVE_LONG, -2) == b"\x82\xFE\xFF")
+    assert (opcodes.encode("mvn", SnesAddressMode.BLOCK_MOVE, 0x7E7F) == b"\x54\x7F\x7E")
+    assert (opcodes.encode("rep", SnesAddressMode.IMMEDIATE, 0x30) == b"\xC2\x30")
+    
+    with pytest.raises(ValueError):
+        opcodes.encode("beq", SnesAddressMode.RELATIVE, 200)
+    
+    # immediates follow M and X
+    status:SNESProcessStatusRegister = SNESProcessStatusRegister()
+    
+    with pytest.raises(ValueError):
+        opcodes.encode("lda", SnesAddressMode.IMMEDIATE, 0x12, status=status)
+    
+    status.emulation = 0
+    status.rep(0x20)
+    status.sep(0x10)
+    assert (opcodes.encode("lda", SnesAddressMode.IMMEDIATE, 0x1234, status=status) == b"\xA9\x34\x12")
+    assert (opcodes.encode("ldx", SnesAddressMode.IMMEDIATE, 0x12, status=status) == b"\xA2\x12")
+    assert (opcodes.encode("ldx", SnesAddressMode.IMMEDIATE, 0x12, size=2) == b"\xA2\x12\x00")
+    
+    buffer:bytearray = bytearray(8)
+    assert (opcodes.encode_into(buffer, 2, "sta", SnesAddressMode.ABSOLUTE_LONG, 0x7E0200) == 4)
+    assert (buffer == b"\x00\x00\x8F\x00\x02\x7E\x00\x00")
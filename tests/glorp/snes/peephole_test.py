@@ -0,0 +1,263 @@
+from ... import context
+
+import random
+
+snes = context.glorp.snes
+
+IRBlock = snes.assembler.IRBlock
+IRInstruction = snes.assembler.IRInstruction
+Peephole = snes.peephole.Peephole
+PeepholeRule = snes.peephole.PeepholeRule
+SnesAddressMode = snes.opcodes.SnesAddressMode
+
+IMM = SnesAddressMode.IMMEDIATE
+DP = SnesAddressMode.DIRECT_PAGE
+ABS = SnesAddressMode.ABSOLUTE
+IMP = SnesAddressMode.IMPLIED
+
+
+def _listing(block) -> list[tuple]:
+    return [(item.mnemonic, item.mode, item.operand) for item in block.items]
+
+def _run(block) -> dict:
+    """
+    Just enough of a 65816 in native mode to tell whether two blocks do the
+    same thing - registers, the flags, and every byte written.
+    """
+    state:dict = {"a": 0x1234, "x": 0x5678, "y": 0x9ABC, "p": 0x30, "memory": {}}
+    
+    def width(flag:int) -> int:
+        return 1 if (state["p"] & flag) else 2
+    
+    def nz(value:int, size:int) -> None:
+        top:int = 0x80 if (size == 1) else 0x8000
+        state["p"] = (state["p"] & ~0x82) | (0x02 if (value == 0) else 0) | (0x80 if (value & top) else 0)
+    
+    def load(register:str, value:int, size:int) -> None:
+        if (size == 1):
+            state[register] = (state[register] & 0xFF00) | (value & 0xFF) if (register == "a") else value & 0xFF
+        else:
+            state[register] = value & 0xFFFF
+        
+        nz(value & ((1 << (size * 8)) - 1), size)
+    
+    def read(address:int, size:int) -> int:
+        return sum(state["memory"].get(address + i, 0) << (i * 8) for i in range(size))
+    
+    def write(address:int, value:int, size:int) -> None:
+        for i in range(size):
+            state["memory"][address + i] = (value >> (i * 8)) & 0xFF
+    
+    for item in block.items:
+        mnemonic:str = item.mnemonic
+        
+        if (mnemonic in ("lda", "ldx", "ldy")):
+            size:int = width(0x20 if (mnemonic == "lda") else 0x10)
+            value:int = item.operand if (item.mode == IMM) else read(item.operand, size)
+            load(mnemonic[2], value, size)
+        elif (mnemonic in ("sta", "stx", "sty", "stz")):
+            size = width(0x20 if (mnemonic in ("sta", "stz")) else 0x10)
+            write(item.operand, 0 if (mnemonic == "stz") else state[mnemonic[2]], size)
+        elif (mnemonic == "rep"):
+            state["p"] &= ~item.operand
+        elif (mnemonic == "sep"):
+            state["p"] |= item.operand
+            
+            if (item.operand & 0x10):
+                state["x"] &= 0xFF
+                state["y"] &= 0xFF
+        elif (mnemonic in ("clc", "sec", "cli", "sei", "cld", "sed", "clv")):
+            bit:int = {"c": 0x01, "i": 0x04, "d": 0x08, "v": 0x40}[mnemonic[2]]
+            state["p"] = (state["p"] | bit) if (mnemonic[0] == "s") else (state["p"] & ~bit)
+        elif (mnemonic == "adc"):
+            size = width(0x20)
+            mask:int = (1 << (size * 8)) - 1
+            total:int = (state["a"] & mask) + (item.operand & mask) + (state["p"] & 0x01)
+            state["p"] = (state["p"] & ~0x01) | (1 if (total > mask) else 0)
+            load("a", total, size)
+        elif (mnemonic == "inx"):
+            size = width(0x10)
+            load("x", state["x"] + 1, size)
+    
+    return state
+
+def _random_block(rng:random.Random) -> tuple:
+    """A block, and a copy of it - widths are tracked so immediates get the right size"""
+    items:list[tuple] = []
+    p:int = 0x30
+    
+    for _ in range(rng.randrange(1, 16)):
+        kind:int = rng.randrange(8)
+        
+        if (kind == 0):
+            mnemonic:str = rng.choice(("lda", "ldx", "ldy"))
+            size:int = 1 if (p & (0x20 if (mnemonic == "lda") else 0x10)) else 2
+            items.append((mnemonic, IMM, rng.choice((0, 0, 1, 0x80)), size))
+        elif (kind == 1):
+            items.append((rng.choice(("lda", "ldx")), rng.choice((DP, ABS)), rng.choice((0x10, 0x2000)), None))
+        elif (kind in (2, 3)):
+            items.append((rng.choice(("sta", "sta", "stx", "sty", "stz")), rng.choice((DP, ABS)), rng.choice((0x10, 0x11, 0x2000)), None))
+        elif (kind == 4):
+            mnemonic = rng.choice(("rep", "sep"))
+            operand:int = rng.choice((0, 0x10, 0x20, 0x30, 0x01))
+            p = (p & ~operand) if (mnemonic == "rep") else (p | operand)
+            items.append((mnemonic, IMM, operand, None))
+        elif (kind == 5):
+            items.append((rng.choice(("clc", "sec", "cli", "sei", "cld", "clv")), IMP, 0, None))
+        elif (kind == 6):
+            size = 1 if (p & 0x20) else 2
+            items.append(("adc", IMM, rng.choice((0, 1, 0xFF)), size))
+        else:
+            items.append((rng.choice(("inx", "nop")), IMP, 0, None))
+    
+    blocks:list = []
+    
+    for _ in range(2):
+        block = IRBlock()
+        
+        for mnemonic, mode, operand, size in items:
+            block.items.append(IRInstruction(mnemonic, mode, operand, size=size))
+        
+        blocks.append(block)
+    
+    return tuple(blocks)
+
+def test_stz_for_zero_stores():
+    block = IRBlock()
+    block.emit("lda", IMM, 0, size=1)
+    block.emit("sta", ABS, 0x4200)
+    block.emit("lda", ABS, 0x2000)
+    
+    peephole = Peephole()
+    assert (peephole.optimize(block) == 1)
+    assert (_listing(block) == [("stz", ABS, 0x4200), ("lda", ABS, 0x2000)])
+    
+    stats = peephole.stats["stz for zero stores"]
+    assert (stats.hits == 1)
+    assert (stats.bytes_saved == 2)
+    assert (stats.cycles_saved == 2)
+    
+    # A is still wanted at the end of the block
+    block = IRBlock()
+    block.emit("lda", IMM, 0, size=1)
+    block.emit("sta", ABS, 0x4200)
+    assert (Peephole().optimize(block) == 0)
+
+def test_redundant_and_dead_loads():
+    block = IRBlock()
+    block.emit("ldx", IMM, 5, size=2)
+    block.emit("stx", DP, 0x10)
+    block.emit("ldx", IMM, 5, size=2)
+    block.emit("stx", DP, 0x12)
+    block.emit("ldy", IMM, 1, size=2)
+    block.emit("ldy", DP, 0x12)
+    
+    peephole = Peephole()
+    peephole.optimize(block)
+    assert (_listing(block) == [("ldx", IMM, 5), ("stx", DP, 0x10), ("stx", DP, 0x12), ("ldy", DP, 0x12)])
+    assert (peephole.stats["redundant load"].bytes_saved == 3)
+    assert (peephole.stats["dead load"].hits == 1)
+    
+    # a width change in between means the load mightn't be all overwritten
+    block = IRBlock()
+    block.emit("lda", IMM, 0x1234, size=2)
+    block.emit("sep", IMM, 0x20)
+    block.emit("lda", IMM, 0x56, size=1)
+    block.emit("sta", DP, 0x10)
+    assert (Peephole().optimize(block) == 0)
+
+def test_rep_and_sep_merge():
+    block = IRBlock()
+    block.emit("rep", IMM, 0x10)
+    block.emit("rep", IMM, 0x20)
+    block.emit("nop")
+    block.emit("rep", IMM, 0x20)
+    block.emit("sep", IMM, 0x30)
+    block.emit("nop")
+    block.emit("sep", IMM, 0x20)
+    block.emit("rep", IMM, 0x10)
+    block.emit("sep", IMM, 0)
+    
+    peephole = Peephole()
+    peephole.optimize(block)
+    assert (_listing(block) == [("rep", IMM, 0x30), ("nop", IMP, 0), ("sep", IMM, 0x30), ("nop", IMP, 0), ("sep", IMM, 0x20), ("rep", IMM, 0x10)])
+    assert (peephole.stats["merge rep and sep"].hits == 2)
+    assert (peephole.stats["empty rep or sep"].cycles_saved == 3)
+
+def test_dead_flag_ops():
+    block = IRBlock()
+    block.emit("sec")
+    block.emit("clc")
+    block.emit("adc", IMM, 1, size=1)
+    block.emit("cli")
+    block.emit("sei")
+    block.emit("sed")
+    
+    peephole = Peephole()
+    peephole.optimize(block)
+    assert (_listing(block) == [("clc", IMP, 0), ("adc", IMM, 1), ("cli", IMP, 0), ("sei", IMP, 0), ("sed", IMP, 0)])
+    assert ([stats.name for stats in peephole.report()] == ["dead flag op"])
+    
+    # interrupts read I between every instruction, so critical sections and
+    # windows for interrupts stay just as they are
+    block = IRBlock()
+    block.emit("sei")
+    block.emit("lda", DP, 0x10)
+    block.emit("sta", ABS, 0x2100)
+    block.emit("cli")
+    block.emit("rep", IMM, 0x04)
+    block.emit("sep", IMM, 0x04)
+    block.emit("rts")
+    
+    peephole.optimize(block)
+    assert (_listing(block) == [("sei", IMP, 0), ("lda", DP, 0x10), ("sta", ABS, 0x2100), ("cli", IMP, 0), ("rep", IMM, 0x04), ("sep", IMM, 0x04), ("rts", IMP, 0)])
+    
+    # branches could go anywhere, so anything before one stays
+    block = IRBlock()
+    block.emit("sec")
+    block.emit("bra", SnesAddressMode.RELATIVE, target="somewhere")
+    block.emit("clc")
+    assert (Peephole().optimize(block) == 0)
+
+def test_rules_from_patterns():
+    rule = PeepholeRule("drop nops", "nop", lambda window, items, end: [])
+    block = IRBlock()
+    block.emit("nop")
+    block.label("here")
+    block.emit("nop")
+    block.emit("sec")
+    
+    assert (Peephole([rule]).optimize(block) == 2)
+    assert (len(block.items) == 2)
+    
+    rule = PeepholeRule("any store", "lda imm|dp; sta|stz", lambda window, items, end: None)
+    block = IRBlock()
+    block.emit("lda", DP, 0x10)
+    block.emit("stz", ABS, 0x2000)
+    assert (rule.match(block.items, 0) is not None)
+    assert (rule.match(block.items, 1) is None)
+    
+    # rewrites get the block's own items and where the window ends, not a copy of the rest
+    seen = []
+    rule = PeepholeRule("look", "sec", lambda window, items, end: seen.append((items, end)))
+    block = IRBlock()
+    block.emit("nop")
+    block.emit("sec")
+    block.emit("nop")
+    assert (Peephole([rule]).optimize(block) == 0)
+    assert (len(seen) == 1)
+    assert ((seen[0][0] is block.items) and (seen[0][1] == 2))
+
+def test_optimized_blocks_do_the_same_thing():
+    rng:random.Random = random.Random(65816)
+    peephole = Peephole()
+    
+    for _ in range(2000):
+        original, optimized = _random_block(rng)
+        peephole.optimize(optimized)
+        
+        assert (len(optimized.items) <= len(original.items))
+        assert (_run(optimized) == _run(original)), _listing(original)
+    
+    # and it has actually been doing something
+    assert (all(stats.hits for stats in peephole.stats.values()))
@@ -0,0 +1,294 @@
+from ... import context
+
+import pytest
+
+snes = context.glorp.snes
+
+memory = snes.memory
+ram = snes.ram
+
+RAMSegment = ram.RAMSegment
+RAMStatus = ram.RAMStatus
+RAMValueStatus = ram.RAMValueStatus
+SNESSystemRam = ram.SNESSystemRam
+
+
+def test_segment_bytes_are_separate():
+    segment:RAMSegment = RAMSegment(0x100, 0x10)
+    segment.set_value(0x101, 0x42)
+    
+    assert (segment.get_value(0x100) == 0x00)
+    assert (segment.get_value(0x101) == 0x42)
+    assert (segment.get_byte(0x100).status == RAMStatus.UNKNOWN)
+    assert (segment.get_byte(0x101).status == RAMStatus.FILLED)
+    assert (segment.get_byte(0x101).value_status == RAMValueStatus.KNOWN)
+    
+    with pytest.raises(ValueError):
+        segment.set_value(0x102, 0x100)
+    
+    with pytest.raises(IndexError):
+        segment.get_value(0x110)
+    
+    # handles write through
+    handle = segment.get_byte(0x102)
+    handle.value = 0x10
+    assert (segment.get_value(0x102) == 0x10)
+    
+    handle.delete()
+    assert (segment.get_byte(0x102).status == RAMStatus.EMPTY)
+    assert (segment.get_byte(0x102).value_status == RAMValueStatus.UNKNOWN)
+    assert (segment.get_value(0x102) == 0x10)
+
+def test_system_ram_mirrors():
+    system:SNESSystemRam = SNESSystemRam()
+    
+    # low wram shows up in every system bank
+    system.wram_stack.set_value(0x7E0100, 0x12)
+    assert (system.all.get_value(0x000100) == 0x12)
+    assert (system.all.get_value(0x3F0100) == 0x12)
+    assert (system.all.get_value(0xBF0100) == 0x12)
+    assert (system.all.get_byte(0x800100) == system.all.get_byte(0x7E0100))
+    
+    # but $7F is its own bank
+    assert (system.all.get_byte(0x7F0100).status == RAMStatus.UNKNOWN)
+    system.wram_all.set_value(0x7F0100, 0x34)
+    assert (system.all.get_value(0x7E0100) == 0x12)
+    
+    # io and rom mirror into the upper half
+    system.cpu_dma.set_value(0x004200, 0x01)
+    assert (system.banks[0x80].get_value(0x804200) == 0x01)
+    system.rom.set_value(0x018000, 0x56)
+    assert (system.all.get_value(0x818000) == 0x56)
+    system.rom.set_value(0x400000, 0x78)
+    assert (system.all.get_value(0xC00000) == 0x78)
+    
+    # the last two banks don't mirror anywhere
+    system.all.set_value(0xFE0000, 0x9A)
+    assert (system.all.get_value(0x7E0000) == 0x00)
+    assert (system.all.get_value(0x7D0000) == 0x00)
+    
+    assert (system.memory.region(0x8F2100) == memory.MemoryRegion.IO)
+    assert (system.memory.region(0x001FFF) == memory.MemoryRegion.WRAM)
+    assert (system.memory.region(0xC00000) == memory.MemoryRegion.ROM)
+
+def test_ram_byte_mirrors_share_a_cell():
+    left = ram.RAMByte()
+    right = ram.RAMByte()
+    far = ram.RAMByte(0x22)
+    
+    left.add_mirror(right)
+    right.add_mirror(far)
+    
+    assert (left.value == 0x00)
+    assert (far.value == 0x00)
+    assert (set(map(id, left.mirrors)) == {id(right), id(far)})
+    
+    far.value = 0x33
+    assert (left.value == 0x33)
+    assert (left.status == RAMStatus.FILLED)
+    
+    left.delete()
+    assert (right.status == RAMStatus.EMPTY)
+    assert (far.value_status == RAMValueStatus.UNKNOWN)
+
+def test_open_bus():
+    system:SNESSystemRam = SNESSystemRam()
+    
+    for address in (0x002000, 0x002184, 0x804015, 0x004018, 0x004220, 0x804380, 0x005FFF):
+        assert (system.memory.region(address) == memory.MemoryRegion.OPEN_BUS)
+        
+        # writes go nowhere
+        system.all.set_value(address, 0x12)
+        assert (system.all.get_value(address) == 0x00)
+        assert (system.all.get_byte(address).status == RAMStatus.UNKNOWN)
+    
+    # the registers squeezed in between are still there
+    for address in (0x002183, 0x004016, 0x004017, 0x00437F):
+        assert (system.memory.region(address) == memory.MemoryRegion.IO)
+        
+        system.all.set_value(address, 0x12)
+        assert (system.all.get_value(address | 0x800000) == 0x12)
+
+def test_system_ram_is_lazy():
+    system:SNESSystemRam = SNESSystemRam()
+    
+    # nothing's there until it's written
+    assert (system.memory.resident_bytes == 0)
+    assert (system.rom.get_byte(0x018000).status == RAMStatus.UNKNOWN)
+    assert (system.banks[0xC0].get_value(0xC01234) == 0x00)
+    assert (system.memory.resident_bytes == 0)
+    
+    system.wram_scratch.set_value(0x7E2000, 0x01)
+    assert (system.memory.wram.resident_pages == 1)
+    assert (system.memory.rom.resident_pages == 0)
+    
+    # segments stick around once they're made
+    assert (system.wram_scratch is system.wram_scratch)
+    assert (system.banks[0x7E] is system.banks[0x7E])
+    assert (len(list(system.banks)) == 256)
+    
+    # handles are just a store and an index, nothing more
+    handle = system.wram_scratch.get_byte(0x7E2000)
+    assert (isinstance(handle, ram.RAMByteHandle))
+    assert (not hasattr(handle, "__dict__"))
+
+def test_paged_store_slices():
+    store = memory.PagedStore(memory.STORE_PAGE_SIZE * 4)
+    start:int = memory.STORE_PAGE_SIZE - 2
+    
+    # across a page boundary, skipping the untouched page after it
+    store.values[start:start + 4] = b"\x01\x02\x03\x04"
+    assert (store.resident_pages == 2)
+    assert (store.values[start - 1:start + 5] == b"\x00\x01\x02\x03\x04\x00")
+    assert (store.values[memory.STORE_PAGE_SIZE * 3:memory.STORE_PAGE_SIZE * 3 + 2] == b"\x00\x00")
+    assert (store.resident_pages == 2)
+    assert (store.values[start + 3] == 0x04)
+
+def test_fork_and_join():
+    state = ram.SnesRAM()
+    state.system.wram_all.set_value(0x7E0000, 0x01)
+    state.system.wram_all.set_value(0x7E0001, 0x02)
+    state._cpu_registers._accumulator = 0x10
+    state._cpu_registers._processor_status.carry = 1
+    
+    before = state.snapshot()
+    left = state.fork()
+    right = state.fork()
+    
+    # each side only sees its own writes
+    left.system.wram_all.set_value(0x7E0001, 0x03)
+    left.system.wram_all.set_value(0x7E8000, 0x04)
+    right.system.wram_all.set_value(0x7E8000, 0x04)
+    right._cpu_registers._accumulator = 0x11
+    
+    assert (state.system.wram_all.get_value(0x7E0001) == 0x02)
+    assert (right.system.wram_all.get_value(0x7E0001) == 0x02)
+    assert (left.system.wram_all.get_value(0x7E0001) == 0x03)
+    
+    # writing to the original doesn't leak into forks either
+    state.system.wram_all.set_value(0x7E0000, 0x05)
+    assert (left.system.wram_all.get_value(0x7E0000) == 0x01)
+    
+    # what both sides agree on stays known
+    res = left.join(right)
+    wram = res.system.wram_all
+    
+    assert (wram.get_value(0x7E0000) == 0x01)
+    assert (wram.get_byte(0x7E0000).value_status == RAMValueStatus.KNOWN)
+    assert (wram.get_byte(0x7E0001).value_status == RAMValueStatus.UNKNOWN)
+    assert (wram.get_byte(0x7E0001).status == RAMStatus.FILLED)
+    assert (wram.get_value(0x7E8000) == 0x04)
+    assert (wram.get_byte(0x7E8000).value_status == RAMValueStatus.KNOWN)
+    assert (res._cpu_registers._accumulator is None)
+    assert (res._cpu_registers._processor_status.carry == 1)
+    
+    # and the snapshot takes us back
+    state.restore(before)
+    assert (state.system.wram_all.get_value(0x7E0000) == 0x01)
+    assert (state._cpu_registers._accumulator == 0x10)
+    
+    state.system.wram_all.set_value(0x7E0000, 0x06)
+    assert (before.system.wram_all.get_value(0x7E0000) == 0x01)
+
+def test_bulk_operations():
+    system:SNESSystemRam = SNESSystemRam()
+    
+    # a whole bank of wram in one go
+    system.wram_all.fill(0x7E0000, 0x10000, 0xAA)
+    assert (system.all.get_value(0x7EFFFF) == 0xAA)
+    assert (system.all.get_value(0x7F0000) == 0x00)
+    assert (system.all.get_byte(0x001234).value_status == RAMValueStatus.KNOWN)
+    
+    # across bank $00's regions, open bus included
+    system.banks[0x00].write(0x002180, bytes(range(8)))
+    assert (bytes(system.all.read(0x802180, 8)) == b"\x00\x01\x02\x03\x00\x00\x00\x00")
+    assert (system.all.get_byte(0x002183).status == RAMStatus.FILLED)
+    assert (system.all.get_byte(0x002184).status == RAMStatus.UNKNOWN)
+    
+    # copies go through mirrors, and can overlap
+    system.all.write(0x000100, b"\x01\x02\x03\x04")
+    system.all.copy(0x800100, 0x7E0102, 4)
+    assert (bytes(system.wram_all.read(0x7E0100, 6)) == b"\x01\x02\x01\x02\x03\x04")
+    
+    system.all.mark_unknown(0x000100, 2)
+    system.all.copy(0x000100, 0x7E8000, 4)
+    assert (system.all.get_byte(0x7E8000).value_status == RAMValueStatus.UNKNOWN)
+    assert (system.all.get_byte(0x7E8000).status == RAMStatus.FILLED)
+    assert (system.all.get_byte(0x7E8002).value_status == RAMValueStatus.KNOWN)
+    
+    # and stay inside the segment
+    with pytest.raises(IndexError):
+        system.wram_stack.fill(0x7E1FFF, 2, 0x00)
+    
+    with pytest.raises(ValueError):
+        system.wram_stack.fill(0x7E0000, 2, 0x100)
+
+def test_status_queries():
+    system:SNESSystemRam = SNESSystemRam()
+    scratch:RAMSegment = system.wram_scratch
+    
+    assert (scratch.count_status(RAMStatus.UNKNOWN) == scratch.length)
+    assert (scratch.find_status_run(RAMStatus.EMPTY, 1) is None)
+    
+    # a hole of 5, then one of 16 that's a byte off being aligned
+    scratch.deallocate(0x7E2003, 5)
+    scratch.deallocate(0x7E200F, 16)
+    
+    assert (scratch.count_status(RAMStatus.EMPTY) == 21)
+    assert (scratch.find_status_run(RAMStatus.EMPTY, 4) == 0x7E2003)
+    assert (scratch.find_status_run(RAMStatus.EMPTY, 6) == 0x7E200F)
+    assert (scratch.find_status_run(RAMStatus.EMPTY, 8, align=8) == 0x7E2010)
+    assert (scratch.find_status_run(RAMStatus.EMPTY, 16, align=8) is None)
+    assert (scratch.find_status_run(RAMStatus.EMPTY, 4, address=0x7E2005) == 0x7E200F)
+    assert (scratch.find_status_run(RAMStatus.EMPTY, 4, end=0x7E2006) is None)
+    assert (scratch.status_bits(RAMStatus.EMPTY, 0x7E2000, 8) == 0b11111000)
+    
+    # known values
+    scratch.write(0x7E3000, b"\x01\x02\x03")
+    assert (scratch.all_known(0x7E3000, 3))
+    assert (scratch.any_unknown(0x7E3000, 4))
+    assert (scratch.count_known() == 3)
+    assert (scratch.known_bits(0x7E2FFF, 5) == 0b01110)
+
+def test_status_register():
+    status = ram.SNESProcessStatusRegister()
+    assert (status.get() is None)
+    assert (status.m is None)
+    
+    # the m flag used to land on x
+    status.set(0x10)
+    assert (status.get() == 0x10)
+    assert (status.m == 0)
+    assert (status.x == 1)
+    assert (status.emulation is None)
+    
+    status.sep(0x21)
+    assert (status.get() == 0x31)
+    status.rep(0x10)
+    assert (status.get() == 0x21)
+    
+    # widths need e, unless it's on
+    assert (status.accumulator_width is None)
+    status.emulation = 0
+    assert (status.accumulator_width == 1)
+    assert (status.index_width == 2)
+    status.emulation = 1
+    assert (status.index_width == 1)
+    
+    with pytest.raises(ValueError):
+        status.carry = 2
+    
+    # join keeps what they agree on
+    other = status.fork()
+    other.rep(0x01)
+    other.emulation = 0
+    swp = status.join(other)
+    assert (swp.carry is None)
+    assert (swp.emulation is None)
+    assert (swp.m == 1)
+    assert (swp != status)
+    assert (status.join(status) == status)
+    
+    status.state_unknown()
+    assert (status.m is None)
+    assert (status.get() is None)
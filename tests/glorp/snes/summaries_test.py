@@ -0,0 +1,129 @@
+from ... import context
+from . import (
+    function,
+    listing,
+    native,
+)
+
+snes = context.glorp.snes
+
+SnesAddressMode = snes.opcodes.SnesAddressMode
+SummaryFlow = snes.summaries.SummaryFlow
+summarize = snes.summaries.summarize
+
+IMM = SnesAddressMode.IMMEDIATE
+ABS = SnesAddressMode.ABSOLUTE
+
+FLAG_CARRY = snes.ram.FLAG_CARRY
+FLAG_EMULATION = snes.ram.FLAG_EMULATION
+FLAG_INDEX_REGISTER_SELECT = snes.ram.FLAG_INDEX_REGISTER_SELECT
+FLAG_MEMORY_ACCUMULATOR_SELECT = snes.ram.FLAG_MEMORY_ACCUMULATOR_SELECT
+REG_A = snes.peephole.REG_A
+REG_X = snes.peephole.REG_X
+
+
+def test_calls_keep_what_they_leave_alone():
+    blocks = {
+        "main": function("main",
+            ("rep", IMM, 0x10, None, None),
+            ("jsr", ABS, 0, "narrow", None),
+            ("sep", IMM, 0x20, None, None),
+            ("lda", IMM, 0x12, None, 1),
+            ("ldx", IMM, 0x1234, None, 2),
+        ),
+        "narrow": function("narrow",
+            ("sep", IMM, 0x20, None, None),
+            ("lda", IMM, 0, None, 1),
+        ),
+    }
+    
+    summaries = summarize(blocks, {"main": native()})
+    narrow = summaries["narrow"]
+    assert (narrow.preserves == FLAG_CARRY | FLAG_INDEX_REGISTER_SELECT | FLAG_EMULATION)
+    assert (narrow.clobbers & REG_A)
+    assert (not (narrow.clobbers & REG_X))
+    assert (narrow.exit.memory_accumulator_select == 1)
+    
+    # X is still 16 bit after the call, and A's 8 bit because of it
+    main = blocks["main"]
+    SummaryFlow(summaries, summaries["main"].entry).optimize(main)
+    assert (listing(main, labels=False) == [("rep", 0x10), ("jsr", 0), ("lda", 0x12), ("ldx", 0x1234), ("rts", 0)])
+
+def test_callees_come_in_knowing_what_callers_set():
+    blocks = {
+        "main": function("main",
+            ("rep", IMM, 0x20, None, None),
+            ("jsr", ABS, 0, "wide", None),
+            ("jsr", ABS, 0, "helper", None),
+        ),
+        "helper": function("helper",
+            ("jsr", ABS, 0, "wide", None),
+        ),
+        "wide": function("wide",
+            ("rep", IMM, 0x20, None, None),
+            ("lda", IMM, 0x1234, None, 2),
+        ),
+        "unused": function("unused",
+            ("lda", IMM, 0x1234, None, 2),
+        ),
+    }
+    
+    summaries = summarize(blocks, {"main": native()})
+    assert (summaries["wide"].entry.accumulator_width == 2)
+    
+    # nothing here calls it, so it could come in any way at all
+    assert (summaries["unused"].entry.known == 0)
+    assert (summaries["unused"].requires == FLAG_MEMORY_ACCUMULATOR_SELECT | FLAG_EMULATION)
+    assert (summaries["wide"].requires == FLAG_EMULATION)
+    
+    wide = blocks["wide"]
+    SummaryFlow(summaries, summaries["wide"].entry).optimize(wide)
+    assert (listing(wide, labels=False) == [("lda", 0x1234), ("rts", 0)])
+
+def test_recursion_settles():
+    blocks = {
+        "main": function("main",
+            ("sep", IMM, 0x30, None, None),
+            ("jsr", ABS, 0, "countdown", None),
+            ("lda", IMM, 0x12, None, 1),
+        ),
+        "countdown": function("countdown",
+            ("dex", SnesAddressMode.IMPLIED, 0, None, None),
+            ("beq", SnesAddressMode.RELATIVE, 0, "done", None),
+            ("jsr", ABS, 0, "countdown", None),
+            "done",
+        ),
+        "forever": function("forever",
+            ("jsr", ABS, 0, "forever", None),
+        ),
+    }
+    
+    summaries = summarize(blocks, {"main": native()})
+    countdown = summaries["countdown"]
+    assert (countdown.entry.accumulator_width == 1)
+    assert (countdown.exit.accumulator_width == 1)
+    assert (countdown.clobbers & REG_X)
+    
+    # never comes back, so nothing after calling it matters
+    assert (summaries["forever"].exit is None)
+    assert (summaries["main"].exit.accumulator_width == 1)
+
+def test_tail_jumps_return_like_where_they_go():
+    blocks = {
+        "main": function("main",
+            ("jsr", ABS, 0, "setup", None),
+            ("lda", IMM, 0x12, None, 1),
+        ),
+        "setup": function("setup",
+            ("rep", IMM, 0x10, None, None),
+            ("jmp", ABS, 0, "narrow", None),
+        ),
+        "narrow": function("narrow",
+            ("sep", IMM, 0x20, None, None),
+        ),
+    }
+    
+    summaries = summarize(blocks, {"main": native()})
+    assert (summaries["narrow"].entry.index_width == 2)
+    assert (summaries["setup"].exit.accumulator_width == 1)
+    assert (not (summaries["setup"].preserves & FLAG_MEMORY_ACCUMULATOR_SELECT))